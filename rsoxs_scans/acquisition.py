@@ -21,14 +21,20 @@ from .defaults import (
     nexafs_edges,
     nexafs_speed_table,
     default_warning_step_time,
+    default_config_change_time,
     default_exposure_time,
     default_diameter,
     default_spiral_step,
     config_list,
+    location_axes,
 )
-from .rsoxs import dryrun_rsoxs_plan
+import redis_json_dict
+from .serialization import content_key, NumpyEncoder
+from .rsoxs import dryrun_rsoxs_plan, rotated_positions
+from .motor_limits import pack_locations, check_locations, location_errors
 from .nexafs import dryrun_nexafs_plan, dryrun_nexafs_step_plan
-from .spirals import dryrun_spiral_plan
+from .spirals import dryrun_spiral_plan, spiral_scan_points, scan_points_time
+from .acquisition_queue import AcquisitionQueue
 
 
 def dryrun_acquisition(acq, sample):
@@ -109,9 +115,143 @@ def dryrun_acquisition(acq, sample):
         return outputs
 
 
+def _rebind_md(step, old_sample, sample):
+    # copy of a step, with its md pointing at sample if it pointed at old_sample
+    step = dict(step)
+    kwargs = step.get("kwargs")
+    if isinstance(kwargs, dict) and kwargs.get("md") is old_sample:
+        step["kwargs"] = {**kwargs, "md": sample}
+    return step
+
+
+def _dryrun_acquisition_cached(acq, sample, step_cache, used):
+    # dryrun_acquisition, reusing the steps of an earlier dry run of the same acquisition of the same sample
+    if step_cache is None:
+        return dryrun_acquisition(acq, sample)
+    key = content_key((acq, {key: value for key, value in sample.items() if key != "acquisitions"}))
+    if key in step_cache:
+        old_sample, cached_steps, detector = step_cache[key]
+        sample.update({"RSoXS_Main_DET": detector})  # as dryrun_acquisition would have
+        steps = [_rebind_md(step, old_sample, sample) for step in cached_steps]
+    else:
+        steps = dryrun_acquisition(acq, sample)
+        if not isinstance(steps, list):
+            steps = [steps]
+    used[key] = (sample, [dict(step) for step in steps], sample.get("RSoXS_Main_DET"))
+    return steps
+
+
+def precheck_bar_envelope(bar):
+    """Checks every location that the RSoXS and step NEXAFS acquisitions on a bar will visit against the motor limits.
+
+    The rotated positions for all of a sample's requested angles are found in one call and checked together, without
+    generating any energies or text, so a whole bar can be checked before it is dry run.  An acquisition which fails
+    here will also give an error step in its dry run.
+
+    Parameters
+    ----------
+    bar : list of dict
+        elements are unique dictionaries for each sample on the bar sheet with full metadata and acquisitions
+
+    Returns
+    -------
+    list of dict
+        one entry for each acquisition with a problem, with the sample_num and acq_num (indices into the bar and the
+        sample's acquisitions), sample_id, type, and the validation text
+    """
+    problems = []
+    column = {axis: index for index, axis in enumerate(location_axes)}
+    for samp_num, sample in enumerate(bar):
+        # only these acquisition types move the sample to a list of rotated locations
+        requests = [
+            (acq_num, list(acq["angles"]))
+            for acq_num, acq in enumerate(sample["acquisitions"])
+            if acq.get("type") in ("rsoxs", "nexafs_step")
+            and isinstance(acq.get("angles"), (list, redis_json_dict.redis_json_dict.ObservableSequence))
+            and len(acq["angles"])
+        ]
+        if not requests:
+            continue
+        all_angles = [angle for acq_num, angles in requests for angle in angles]
+        th, x, _ = rotated_positions(
+            all_angles, sample["bar_loc"], front=sample["front"], grazing=sample["grazing"]
+        )
+        # every rotated location is the sample location with x, y, and th replaced
+        positions = np.repeat(pack_locations([sample["location"]]), len(all_angles), axis=0)
+        positions[:, column["x"]] = x
+        positions[:, column["y"]] = sample["bar_loc"].get("y0", 0)
+        positions[:, column["th"]] = th
+        start = 0
+        for acq_num, angles in requests:
+            validation = location_errors(check_locations(positions[start : start + len(angles)]))
+            start += len(angles)
+            if validation:
+                problems.append(
+                    {
+                        "sample_num": samp_num,
+                        "acq_num": acq_num,
+                        "sample_id": sample["sample_id"],
+                        "type": sample["acquisitions"][acq_num]["type"],
+                        "validation": validation,
+                    }
+                )
+    return problems
+
+
+def select_group_acquisitions(bar, group="all"):
+    """Finds the acquisitions in the bar which belong to any of the requested groups, in one pass over the bar
+
+    An acquisition matches a group if the group is "all", if the acquisition's group is "all", or if the names are
+    the same (case-insensitive).  Each acquisition is listed once, under the first requested group it matches, even
+    if it matches several.
+
+    Parameters
+    ----------
+    bar : list of dict
+        sample dicts with acquisitions
+    group : str or list of str, optional
+        group(s) to select (excel column 'group'), by default "all"
+
+    Returns
+    -------
+    list of tuple
+        (group index, sample index, acquisition index) of each matching acquisition, ordered by group index and then
+        by position in the bar
+    """
+    if isinstance(group, str):
+        group = [group]
+    if not isinstance(group, list):
+        group = ["all"]
+    # first position of each requested group name
+    group_index = {}
+    for group_num, gr in enumerate(group):
+        group_index.setdefault(str(gr).lower(), group_num)
+    all_index = group_index.get("all")
+
+    selected = []
+    for samp_num, s in enumerate(bar):
+        for acq_num, a in enumerate(s["acquisitions"]):
+            acq_group = str(a.get("group", "")).lower()
+            if acq_group == "all" and group:
+                matches = [0]  # an acquisition in group "all" runs with the first group requested
+            else:
+                matches = [index for index in (group_index.get(acq_group), all_index) if index is not None]
+            if matches:
+                selected.append((min(matches), samp_num, acq_num))
+    selected.sort(key=itemgetter(0))  # stable, so the bar order is kept within each group
+    return selected
+
+
 ### TODO sort_by docstring explanation is confusing
 def dryrun_bar(
-    bar, sort_by=["apriority"], rev=[False], print_dry_run=True, group="all", repeat_previous_runs=False
+    bar,
+    sort_by=["apriority"],
+    rev=[False],
+    print_dry_run=True,
+    group="all",
+    repeat_previous_runs=False,
+    precheck=False,
+    step_cache=None,
 ):
     """Generate output queue entries for all sample dicts in the bar list
 
@@ -126,75 +266,88 @@ def dryrun_bar(
         whether to reverse the sort algorithm, list the same length of sort_by, or booleans, by default [False]
     print_dry_run : bool, optional
         whether to print the final scan queue to stdout, by default True
-    group : str, optional
-        subset of acquisitions to execute the dry-run for (excel column 'group'), by default "all". case-insensitive
+    group : str or list of str, optional
+        subset of acquisitions to execute the dry-run for (excel column 'group'), by default "all". case-insensitive.
+        with several groups, each acquisition is included once, and sort_by "group" orders them by the first group
+        they match (see select_group_acquisitions)
+    precheck : bool, optional
+        whether to check the whole bar against the motor limits first (see precheck_bar_envelope) and leave out
+        any acquisitions that would fail, with a warning, instead of dry running them, by default False
+    step_cache : dict, optional
+        steps of earlier dry runs, by the content of the acquisition and its sample.  acquisitions which haven't
+        changed reuse their steps instead of being dry run again, and the cache is then left holding just the
+        acquisitions of this dry run.  by default None (no cache)
 
     Returns
     -------
-    list of dict
-        all acquisition queue entries for the matched group of scans as a list of dictionaries
+    AcquisitionQueue
+        all acquisition queue entries for the matched group of scans as a list of dictionaries, which can also be
+        looked up by acq_index, uid, sample_id, group, or configuration.  the energies and times in the kwargs
+        of the scan steps are read-only numpy arrays shared by every step with the same values (see
+        serialization.intern_array), so copy one before changing it
     """
 
-    config_change_time = 120  # time to change between configurations, in seconds.
+    config_change_time = default_config_change_time  # time to change between configurations, in seconds.
     list_out = []
 
-    if isinstance(group, str):
-        group = [group]
-    if not isinstance(group, list):
-        group = ["all"]
-    for group_num, gr in enumerate(group):
-        # Loop through sample dicts in the bar
-        for samp_num, s in enumerate(bar):
-            sample = s
-            sample_id = s["sample_id"]
-            sample_project = s["project_name"]
-            # Loop through acquisitions within the sample
-            for acq_num, a in enumerate(s["acquisitions"]):
-                # Skip this acquisition unless any of these conditions are true
-                if not (
-                    str(gr).lower() == "all"  # true if user specified all to be evaluated
-                    or a.get("group", "").lower() == "all"  # If the acquisition has group "all"
-                    or str(a.get("group", "")).lower()
-                    == str(gr).lower()  # true if group matches user selected group
-                ):
-                    continue
-
-                # skip the acquisition if it has a run already in the list (and we're not repeating everything)
-                if len(a.get("runs", [])) and not repeat_previous_runs:
-                    continue
-
-                if "uid" not in a.keys():
-                    a["uid"] = str(uuid.uuid1())
-                a["uid"] = str(a["uid"])
-
-                if "priority" not in a.keys():
-                    a["priority"] = 50  ### TODO why 50?
-
-                # Generate list of lists, where each sub-list is a single acquisition
-                list_out.append(  # list everything we might possibly want for each acquisition
-                    # TODO - make this a dictionary
-                    [
-                        sample_id,  # 0  X
-                        sample_project,  # 1  X
-                        a["configuration"],  # 2  X
-                        a["type"],  # 3
-                        est_scan_time(a),  # 4 calculated plan time
-                        sample,  # 5 full sample dict
-                        a,  # 6 full acquisition dict
-                        samp_num,  # 7 sample index
-                        acq_num,  # 8 acq index
-                        a["edge"],  # 9  X
-                        s["density"],  # 10
-                        s["proposal_id"],  # 11 X
-                        s["sample_priority"],  # 12 X
-                        a["priority"],  # 13
-                        a["uid"],  # 14
-                        a.get("group", "all"),  # 15
-                        a.get("slack_message_start", ""),  # 16
-                        a.get("slack_message_end", ""),  # 17
-                        group_num,
-                    ]
-                )  # 13 X
+    rejected = set()
+    if precheck:
+        for problem in precheck_bar_envelope(bar):
+            rejected.add((problem["sample_num"], problem["acq_num"]))
+            warnings.warn(
+                f"WARNING: acquisition #{problem['acq_num']} of sample_id: {problem['sample_id']} ({problem['type']}) "
+                f"was left out because it would fail:\n{problem['validation']}",
+                stacklevel=2,
+            )
+
+    # Loop through the selected acquisitions, each only once, in order of the first group they matched
+    for group_num, samp_num, acq_num in select_group_acquisitions(bar, group):
+        s = bar[samp_num]
+        a = s["acquisitions"][acq_num]
+        sample = s
+        sample_id = s["sample_id"]
+        sample_project = s["project_name"]
+
+        # skip the acquisition if it has a run already in the list (and we're not repeating everything)
+        if len(a.get("runs", [])) and not repeat_previous_runs:
+            continue
+
+        # skip the acquisition if it failed the motor limit precheck
+        if (samp_num, acq_num) in rejected:
+            continue
+
+        if "uid" not in a.keys():
+            a["uid"] = str(uuid.uuid1())
+        a["uid"] = str(a["uid"])
+
+        if "priority" not in a.keys():
+            a["priority"] = 50  ### TODO why 50?
+
+        # Generate list of lists, where each sub-list is a single acquisition
+        list_out.append(  # list everything we might possibly want for each acquisition
+            # TODO - make this a dictionary
+            [
+                sample_id,  # 0  X
+                sample_project,  # 1  X
+                a["configuration"],  # 2  X
+                a["type"],  # 3
+                est_scan_time(a),  # 4 calculated plan time
+                sample,  # 5 full sample dict
+                a,  # 6 full acquisition dict
+                samp_num,  # 7 sample index
+                acq_num,  # 8 acq index
+                a["edge"],  # 9  X
+                s["density"],  # 10
+                s["proposal_id"],  # 11 X
+                s["sample_priority"],  # 12 X
+                a["priority"],  # 13
+                a["uid"],  # 14
+                a.get("group", "all"),  # 15
+                a.get("slack_message_start", ""),  # 16
+                a.get("slack_message_end", ""),  # 17
+                group_num,  # 18 index of the first requested group it matched
+            ]
+        )  # 13 X
 
     # Prepare for sorting scans
     switcher = {  # all the possible things we might want to sort by
@@ -242,8 +395,9 @@ def dryrun_bar(
     text = ""  # Dry run output text for visual inspection
     total_time = 0
     previous_config = ""
-    acq_queue = []  # output queue
+    acq_queue = AcquisitionQueue()  # output queue
     acqs_with_errors = []
+    used_steps = {}  # step_cache entries for this dry run
 
     # Loop through sorted acquisition steps and build output acquisition queue and dryrun text message
     for i, step in enumerate(list_out):
@@ -285,13 +439,16 @@ def dryrun_bar(
         
         #dryrun acquisition and output steps
         try: 
-            acquisition["steps"] = dryrun_acquisition(step[6], step[5])
+            acquisition["steps"] = _dryrun_acquisition_cached(step[6], step[5], step_cache, used_steps)
             acquisition["acq_index"] = i
             acquisition["acq_time"] = step[4]
             acquisition["total_acq"] = len(list_out)
             acquisition["time_before"] = total_time
             acquisition["priority"] = step[13]
+            acquisition["sample_priority"] = step[12]
             acquisition["uid"] = step[14]
+            acquisition["sample_id"] = step[0]
+            acquisition["configuration"] = step[2]
             acquisition["group"] = step[15]
             acquisition["slack_message_start"] = step[16]
             acquisition["slack_message_end"] = step[17]
@@ -325,6 +482,10 @@ def dryrun_bar(
         # Keep track of the previous config, for calc. config change time.
         previous_config = step[2]
     
+    if step_cache is not None:
+        step_cache.clear()
+        step_cache.update(used_steps)
+
     # Store total_time estimate in each acquisition
     for acq in acq_queue:
         acq["total_queue_time"] = total_time
@@ -342,13 +503,6 @@ def dryrun_bar(
     return acq_queue
 
 
-class NumpyEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, np.ndarray):
-            return obj.tolist()
-        return json.JSONEncoder.default(self, obj)
-
-
 def get_acq_details(acqIndex, outputs, printOutput=True):
     """Provides full details of each step within an acquisition as a list of dicts, optionally prints (more human readible output)
 
@@ -356,8 +510,8 @@ def get_acq_details(acqIndex, outputs, printOutput=True):
     ----------
     acqIndex : int
         acquisition number to provide detailed results for
-    outputs : list of dict
-        full command queue for this acquisition with expanded parameters
+    outputs : AcquisitionQueue or list of dict
+        full command queue for this acquisition with expanded parameters, as from dryrun_bar
     printOutput : bool, optional
         whether to provide a (more) readible version to std, by default True
 
@@ -366,12 +520,9 @@ def get_acq_details(acqIndex, outputs, printOutput=True):
     list of dict
         list containing a dict for each 'queue step' [set of commands within an acquisition]
     """
-    # outList = list(filter(lambda outputs: outputs["acq_index"] == acqIndex, outputs))
-    outList = [output["steps"] for output in outputs if output["acq_index"] == acqIndex]
-    if len(outList) == 1:
-        outList = outList[0]
-    elif len(outList) > 1:
-        outList = sum(outList)
+    if not isinstance(outputs, AcquisitionQueue):
+        outputs = AcquisitionQueue(outputs)
+    outList = outputs.steps(acqIndex)
     if printOutput:
         for step in outList:
             print("-" * 50)
@@ -379,7 +530,7 @@ def get_acq_details(acqIndex, outputs, printOutput=True):
             print("-" * 50)
             print(json.dumps(step, indent=4, cls=NumpyEncoder))
 
-    return
+    return outList
 
 
 def est_scan_time(acq):
@@ -443,10 +594,7 @@ def est_scan_time(acq):
             if isinstance(exptime, (int, float)):
                 if exptime > 0:
                     exp = exptime
-            num = (
-                round(acq.get("diameter", default_diameter) / acq.get("spiral_step", default_spiral_step)) + 1
-            ) ** 2
-            time = (exp + 5.0) * num
+            time = scan_points_time(spiral_scan_points(**acq), exp)
             total_time = time * len(acq.get("polarizations", [0]))  # time is the estimate for a single energy scan
             total_time += 30 * len(acq.get("polarizations", [0]))  # 30 seconds for each polarization change
             if isinstance(acq.get("angles", None), list):
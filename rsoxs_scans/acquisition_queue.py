@@ -0,0 +1,144 @@
+"""Indexed container for the expanded acquisition queue made by dryrun_bar
+
+AcquisitionQueue is a list of queue entries, so it can be used (and saved) anywhere the plain list was, but it also
+keeps lookup tables by acq_index, uid, and sample_id, which are built the first time they are needed and dropped
+whenever the list is changed.
+"""
+
+# imports
+from collections import defaultdict
+
+
+def _invalidates(method):
+    # wraps a list method which changes the list, so the lookup tables are rebuilt on the next lookup
+    def wrapper(self, *args, **kwargs):
+        self._indexes = None
+        return method(self, *args, **kwargs)
+
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+class AcquisitionQueue(list):
+    """
+    list of acquisition queue entries (dicts with "acq_index", "uid", "sample_id", "configuration", "group",
+    "steps", ...) with constant time lookup by acquisition index, uid, and sample_id, and filtered views by group
+    and configuration
+
+    slices and views are AcquisitionQueues holding the same entry dicts, not copies.  the lookup tables follow
+    changes to the list itself, but if the entries are edited in place (e.g. an acq_index is changed), call
+    reindex()
+    """
+
+    def __init__(self, entries=()):
+        super().__init__(entries)
+        self._indexes = None
+
+    ## Changes to the list drop the lookup tables
+    append = _invalidates(list.append)
+    extend = _invalidates(list.extend)
+    insert = _invalidates(list.insert)
+    pop = _invalidates(list.pop)
+    remove = _invalidates(list.remove)
+    clear = _invalidates(list.clear)
+    sort = _invalidates(list.sort)
+    reverse = _invalidates(list.reverse)
+    __setitem__ = _invalidates(list.__setitem__)
+    __delitem__ = _invalidates(list.__delitem__)
+    __iadd__ = _invalidates(list.__iadd__)
+    __imul__ = _invalidates(list.__imul__)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return AcquisitionQueue(super().__getitem__(item))
+        return super().__getitem__(item)
+
+    def __add__(self, other):
+        return AcquisitionQueue(list(self) + list(other))
+
+    def __repr__(self):
+        return f"AcquisitionQueue({super().__repr__()})"
+
+    def copy(self):
+        return AcquisitionQueue(self)
+
+    def __reduce__(self):
+        return (AcquisitionQueue, (list(self),))
+
+    def reindex(self):
+        """rebuilds the lookup tables, needed only after entries are edited in place"""
+        indexes = {
+            "acq_index": defaultdict(list),
+            "uid": {},
+            "sample_id": defaultdict(list),
+            "group": defaultdict(list),
+            "configuration": defaultdict(list),
+        }
+        for position, entry in enumerate(self):
+            indexes["acq_index"][entry.get("acq_index")].append(position)
+            indexes["uid"].setdefault(str(entry.get("uid")), position)
+            indexes["sample_id"][entry.get("sample_id")].append(position)
+            indexes["group"][str(entry.get("group", "")).lower()].append(position)
+            indexes["configuration"][entry.get("configuration")].append(position)
+        self._indexes = indexes
+        return indexes
+
+    def _index(self, name):
+        if self._indexes is None:
+            self.reindex()
+        return self._indexes[name]
+
+    def _entries(self, positions):
+        return AcquisitionQueue(list.__getitem__(self, position) for position in positions)
+
+    def by_acq_index(self, acq_index):
+        """the entry for acquisition number acq_index, raises KeyError if there is none"""
+        positions = self._index("acq_index").get(acq_index)
+        if not positions:
+            raise KeyError(f"no acquisition with acq_index {acq_index} in the queue")
+        return list.__getitem__(self, positions[0])
+
+    def by_uid(self, uid):
+        """the entry with the acquisition uid, raises KeyError if there is none"""
+        position = self._index("uid").get(str(uid))
+        if position is None:
+            raise KeyError(f"no acquisition with uid {uid} in the queue")
+        return list.__getitem__(self, position)
+
+    def by_sample(self, sample_id):
+        """all entries for sample_id, in queue order"""
+        return self._entries(self._index("sample_id").get(sample_id, ()))
+
+    def by_group(self, group):
+        """all entries in the group (case-insensitive), in queue order"""
+        return self._entries(self._index("group").get(str(group).lower(), ()))
+
+    def by_configuration(self, configuration):
+        """all entries run in the configuration, in queue order"""
+        return self._entries(self._index("configuration").get(configuration, ()))
+
+    def steps(self, acq_index):
+        """every queue step for acquisition number acq_index, from all entries with that index"""
+        positions = self._index("acq_index").get(acq_index, ())
+        return [step for position in positions for step in self[position]["steps"]]
+
+    @property
+    def acq_indexes(self):
+        """acquisition numbers in the queue"""
+        return list(self._index("acq_index"))
+
+    @property
+    def sample_ids(self):
+        """sample_ids in the queue, in the order they first appear"""
+        return list(self._index("sample_id"))
+
+    @property
+    def groups(self):
+        """groups (lowercase) in the queue, in the order they first appear"""
+        return list(self._index("group"))
+
+    @property
+    def configurations(self):
+        """configurations in the queue, in the order they first appear"""
+        return list(self._index("configuration"))
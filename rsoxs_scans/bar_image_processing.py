@@ -1,11 +1,168 @@
 import numpy as np
-from matplotlib import pyplot as plt
 from PIL import Image
 
 
+def mosaic_shape(num_images, image_shape, pixel_overlap, y_off):
+    """
+    size of the stitched bar image, computed up front from the number and size of the images,
+    the horizontal overlap between neighbouring images, and the vertical drift (y_off) per image
+    """
+    height, width = image_shape[:2]
+    if not 0 <= pixel_overlap < width:
+        raise ValueError(f"pixel overlap of {pixel_overlap} must be between 0 and the image width {width}")
+    if abs(y_off) * (num_images - 1) >= height:
+        raise ValueError(f"y offset of {y_off} pixels per image leaves nothing to stitch for {num_images} images")
+    pixel_step = width - pixel_overlap
+    return (height - abs(y_off) * (num_images - 1), width + (num_images - 1) * pixel_step) + tuple(image_shape[2:])
+
+
+def stitch_images(images, pixel_overlap, y_off, out=None, memmap_path=None):
+    """
+    stitch bar images by writing each one in place into a preallocated canvas
+
+    images are given in the order they were taken, each element holding the image as its first entry
+    (images[i][0]), and every later image is placed to the left of the earlier ones.  each image is only
+    read once, so images can be a lazy sequence (e.g. from a catalog) and the canvas can be an np.memmap
+    to keep memory bounded for a full bar.  the result is the same as repeatedly concatenating the images.
+
+    out: optional preallocated array of the right shape (see mosaic_shape) to write into
+    memmap_path: optional path of a .npy file to hold the canvas on disk instead of in memory
+    """
+    num_images = len(images)
+    first = np.asarray(images[0][0])
+    height, width = first.shape[:2]
+    shape = mosaic_shape(num_images, first.shape, pixel_overlap, y_off)
+    pixel_step = width - pixel_overlap
+    if out is None:
+        if memmap_path is not None:
+            out = np.lib.format.open_memmap(memmap_path, mode="w+", dtype=first.dtype, shape=shape)
+        else:
+            out = np.empty(shape, dtype=first.dtype)
+    elif out.shape != shape:
+        raise ValueError(f"output array has shape {out.shape}, expected {shape}")
+
+    y_step = abs(y_off)
+    for i in range(num_images):
+        image = first if i == 0 else np.asarray(images[i][0])
+        # rows kept from this image - the vertical drift trims the top of later images (the bottom for y_off < 0)
+        if y_off > 0:
+            row_start = y_step * i
+        elif y_off < 0:
+            row_start = y_step * (num_images - 1 - i)
+        else:
+            row_start = 0
+        rows = slice(row_start, row_start + shape[0])
+        if i == num_images - 1:
+            # the last image is leftmost and kept whole
+            out[:, :width] = image[rows, :]
+        else:
+            # earlier images lose the columns that the next image overlaps
+            col_start = width + (num_images - 2 - i) * pixel_step
+            out[:, col_start : col_start + pixel_step] = image[rows, pixel_overlap:]
+    if isinstance(out, np.memmap):
+        out.flush()
+    return out
+
+
+def _block_mean(image, factor, out, chunk_rows=256):
+    ## average factor x factor blocks a band of rows at a time, so a memmapped mosaic is never fully in memory
+    rows, cols = out.shape[:2]
+    for start in range(0, rows, chunk_rows):
+        stop = min(start + chunk_rows, rows)
+        band = np.asarray(image[start * factor : stop * factor, : cols * factor], dtype=np.float32)
+        band = band.reshape((stop - start, factor, cols, factor) + band.shape[2:])
+        out[start:stop] = band.mean(axis=(1, 3))
+    return out
+
+
+def pyramid_level_path(path_prefix, factor):
+    """file holding the level of the image pyramid downsampled by factor"""
+    return f"{path_prefix}_x{factor}.npy"
+
+
+def build_image_pyramid(image, factors=(2, 4, 8), path_prefix=None):
+    """
+    downsampled copies of a stitched bar image, for viewing the bar zoomed out without touching the full image
+
+    each level is the block mean of the image over factor x factor pixels (float32), and is computed from the
+    previous level when the factors divide evenly, so the full resolution image is only read once.  any rows or
+    columns left over at the bottom and right edges are dropped.
+
+    factors: increasing downsampling factors to build
+    path_prefix: if given, every level is written to a memory-mapped .npy file (see pyramid_level_path)
+        which can be reopened later with load_pyramid_level
+
+    returns a dictionary of {factor: downsampled image}
+    """
+    pyramid = {}
+    source, source_factor = image, 1
+    for factor in sorted(factors):
+        if factor < 2:
+            raise ValueError(f"pyramid factor of {factor} must be 2 or larger")
+        if factor % source_factor:
+            source, source_factor = image, 1
+        step = factor // source_factor
+        shape = (source.shape[0] // step, source.shape[1] // step) + tuple(source.shape[2:])
+        if path_prefix is not None:
+            level = np.lib.format.open_memmap(
+                pyramid_level_path(path_prefix, factor), mode="w+", dtype=np.float32, shape=shape
+            )
+        else:
+            level = np.empty(shape, dtype=np.float32)
+        _block_mean(source, step, level)
+        if isinstance(level, np.memmap):
+            level.flush()
+        pyramid[factor] = level
+        source, source_factor = level, factor
+    return pyramid
+
+
+def _level_slice(pixels, factor):
+    ## full resolution slice to the same part of a level downsampled by factor
+    return slice(
+        None if pixels.start is None else pixels.start // factor,
+        None if pixels.stop is None else pixels.stop // factor,
+    )
+
+
+def load_pyramid_level(path_prefix, factor, region=None):
+    """
+    open one level of a saved image pyramid without reading it into memory
+
+    region: optional (row slice, column slice) in full resolution pixels, only that part of the level is returned
+    """
+    level = np.load(pyramid_level_path(path_prefix, factor), mmap_mode="r")
+    if region is None:
+        return level
+    return level[tuple(_level_slice(pixels, factor) for pixels in region)]
+
+
+def _as_image(level, dtype):
+    ## a pyramid level (float32 block means) in the dtype of the mosaic, so imshow scales it the same way, e.g. RGB
+    ## images with values 0-255 aren't clipped to [0, 1] as floats are
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        return np.clip(np.rint(level), info.min, info.max).astype(dtype)
+    return np.asarray(level, dtype=dtype)
+
+
+def plot_bar_image(image):
+    """show a stitched bar image with the bar coordinates as the axes"""
+    from matplotlib import pyplot as plt  # only needed when plotting, so stitching works without a display
+
+    fig, ax = plt.subplots()
+    ax.imshow(image, extent=[-210, 25, -14.5, 14.5])
+    # fig.canvas.mpl_connect("button_press_event", plot_click) ## For now, want to keep simple and not do clicking here.
+    # fig.canvas.mpl_connect("key_press_event", plot_key_press)
+    plt.show()
+    return ax
+
+
 ## Just copied from Eliot's code for now
-def stitch_sample(images, step_size, y_off, from_image=None, flip_file=False):
-    global sample_image_axes
+def stitch_sample(
+    images, step_size, y_off, from_image=None, flip_file=False, plot=True, memmap_path=None, pyramid_levels=None
+):
+    global sample_image_axes, sample_image_pyramid
 
     if isinstance(from_image, str):
         im_frame = Image.open(from_image)
@@ -15,25 +172,17 @@ def stitch_sample(images, step_size, y_off, from_image=None, flip_file=False):
     else:
         pixel_step = int(step_size * (1760) / 25)
         pixel_overlap = 2464 - pixel_step
-        result = images[0][0]
-        i = 0
-        for imageb in images[1:]:
-            image = imageb[0]
-            i += 1
-            if y_off > 0:
-                result = np.concatenate((image[(y_off * i) :, :], result[:-(y_off), pixel_overlap:]), axis=1)
-            elif y_off < 0:
-                result = np.concatenate((image[: (y_off * i), :], result[-(y_off):, pixel_overlap:]), axis=1)
-            else:
-                result = np.concatenate((image[:, :], result[:, pixel_overlap:]), axis=1)
+        result = stitch_images(images, pixel_overlap, y_off, memmap_path=memmap_path)
         # result = np.flipud(result)
 
-    fig, ax = plt.subplots()
-    ax.imshow(result, extent=[-210, 25, -14.5, 14.5])
-    sample_image_axes = ax
-    #fig.canvas.mpl_connect("button_press_event", plot_click) ## For now, want to keep simple and not do clicking here.
-    #fig.canvas.mpl_connect("key_press_event", plot_key_press)
-    plt.show()
+    # the pyramid is saved next to the memmapped mosaic, if there is one
+    path_prefix = None if memmap_path is None else str(memmap_path).removesuffix(".npy")
+    sample_image_pyramid = build_image_pyramid(result, pyramid_levels, path_prefix) if pyramid_levels else {}
+    if plot:
+        # the extent is in bar coordinates, so the coarsest level shows the same view with far fewer pixels
+        if sample_image_pyramid:
+            coarsest = sample_image_pyramid[max(sample_image_pyramid)]
+            sample_image_axes = plot_bar_image(_as_image(coarsest, result.dtype))
+        else:
+            sample_image_axes = plot_bar_image(result)
     return result
-
-
@@ -0,0 +1,353 @@
+"""Saves and loads bars and acquisition queues as Arrow (or Parquet) tables
+
+A bar is saved as a Samples table (one row per sample) and an Acquisitions table (one row per acquisition, with the
+index of its sample), and a queue (as from dryrun_bar) as a Queue table (one row per acquisition entry) and a Steps
+table (one row per queue step, with the step kwargs as columns).  Lists such as energies, polarizations, angles,
+and locations are stored as Arrow list (and struct) columns, so nothing is turned into text (the motor positions of
+locations are saved as floats).  Arrow IPC files are memory-mapped when loaded, and the energies and exposure times
+of the queue come back as numpy views into the file.
+
+Excel stays the format for people to read and edit, this is for fast saving and loading by programs.
+pyarrow is only needed when these functions are used.
+"""
+
+# imports
+import json
+import math
+import uuid
+from pathlib import Path
+import numpy as np
+from .defaults import current_version
+from .acquisition_queue import AcquisitionQueue
+
+
+table_names = {"bar": ("samples", "acquisitions"), "queue": ("queue", "steps")}
+file_formats = {"arrow": ".arrow", "parquet": ".parquet"}
+_metadata_key = b"rsoxs_scans"
+_present_suffix = ".present"
+_integer_suffix = ".integer"
+_kwarg_prefix = "kwargs."
+
+
+def _pyarrow():
+    # pyarrow is optional, so it is only imported when a table is saved or loaded
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as error:
+        raise ImportError(
+            "saving and loading Arrow or Parquet tables needs pyarrow (pip install pyarrow)"
+        ) from error
+    return pyarrow
+
+
+def _plain(value):
+    # python value of anything from a bar or queue, for Arrow or JSON.  motor positions (of sample locations) are
+    # made floats, as a mix of ints and floats in a struct field would make Arrow give up on the whole column
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, dict):
+        plain = {str(key): _plain(item) for key, item in value.items()}
+        position = plain.get("position")
+        if "motor" in plain and isinstance(position, (int, float)) and not isinstance(position, bool):
+            plain["position"] = float(position)
+        return plain
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+
+def _same(loaded, value, promote=False):
+    # whether a value read back from Arrow is the value which was saved, optionally allowing ints to become floats
+    if isinstance(value, dict):
+        return (
+            isinstance(loaded, dict)
+            and loaded.keys() == value.keys()
+            and all(_same(loaded[key], item, promote) for key, item in value.items())
+        )
+    if isinstance(value, list):
+        return (
+            isinstance(loaded, list)
+            and len(loaded) == len(value)
+            and all(_same(item_loaded, item, promote) for item_loaded, item in zip(loaded, value))
+        )
+    if isinstance(value, bool) or isinstance(loaded, bool):
+        return loaded is value
+    if isinstance(value, float) and math.isnan(value):
+        return isinstance(loaded, float) and math.isnan(loaded)
+    promoted = promote and isinstance(value, int) and isinstance(loaded, float)
+    return (type(loaded) is type(value) or promoted) and loaded == value
+
+
+def _integer_flags(value):
+    # which numbers were ints, for a column of numbers (or lists of numbers) which Arrow made floats
+    if isinstance(value, list):
+        return [isinstance(item, int) for item in value]
+    return None if value is None else isinstance(value, int)
+
+
+def _has_empty_struct(data_type, pa):
+    # structs without fields can't be written to Parquet
+    if pa.types.is_struct(data_type):
+        return data_type.num_fields == 0 or any(_has_empty_struct(field.type, pa) for field in data_type)
+    if pa.types.is_list(data_type) or pa.types.is_large_list(data_type):
+        return _has_empty_struct(data_type.value_type, pa)
+    return False
+
+
+def _column(values, pa):
+    # Arrow array of the values, and of which numbers were ints if Arrow made a mix of ints and floats into floats,
+    # or (None, None) if Arrow can't keep the values exactly
+    try:
+        array = pa.array(values)
+    except (pa.ArrowException, TypeError, ValueError, OverflowError):
+        return None, None
+    if _has_empty_struct(array.type, pa):
+        return None, None
+    loaded = array.to_pylist()
+    if all(map(_same, loaded, values)):
+        return array, None
+    if array.type in (pa.float64(), pa.list_(pa.float64())) and all(
+        _same(item_loaded, item, promote=True) for item_loaded, item in zip(loaded, values)
+    ):
+        return array, pa.array([_integer_flags(value) for value in values])
+    return None, None
+
+
+def _restore_integers(value, flags):
+    if isinstance(value, list):
+        return [int(item) if flag else item for item, flag in zip(value, flags)]
+    return int(value) if flags else value
+
+
+def _records_to_table(records, column_names=None):
+    """
+    Arrow table with a column for every key in the records (dicts)
+
+    columns which Arrow can't hold exactly (e.g. a mix of text and numbers) are saved as JSON text, columns mixing
+    ints and floats get an extra column marking the ints, and keys missing from some records get an extra boolean
+    column, so the records are loaded back as they were.  columns where every
+    value is a numpy array are loaded back as numpy arrays.  column_names optionally renames the keys.
+    """
+    pa = _pyarrow()
+    keys = list(dict.fromkeys(key for record in records for key in record))
+    column_names = column_names or {}
+    columns = {}
+    json_columns = []
+    array_columns = []
+    for key in keys:
+        name = column_names.get(key, key)
+        present = [key in record for record in records]
+        raw = [record.get(key) for record in records]
+        values = [_plain(value) for value in raw]
+        if any(value is not None for value in raw) and all(
+            isinstance(value, np.ndarray) for value, here in zip(raw, present) if here
+        ):
+            array_columns.append(name)
+        array, integers = _column(values, pa)
+        if array is None:
+            json_columns.append(name)
+            array = pa.array([json.dumps(value, default=str) for value in values], type=pa.string())
+        columns[name] = array
+        if integers is not None:
+            columns[name + _integer_suffix] = integers
+        if not all(present):
+            columns[name + _present_suffix] = pa.array(present, type=pa.bool_())
+    metadata = {"version": current_version, "json_columns": json_columns, "array_columns": array_columns}
+    return pa.table(columns, metadata={_metadata_key: json.dumps(metadata)})
+
+
+def _list_column_arrays(column, pa):
+    # numpy views of each list in a list column, without copying the values
+    array = column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+    try:
+        flat = array.values.to_numpy(zero_copy_only=True)
+    except pa.ArrowException:
+        flat = array.values.to_numpy(zero_copy_only=False)
+    offsets = array.offsets.to_numpy()
+    valid = array.is_valid().to_numpy(zero_copy_only=False)
+    return [flat[offsets[i] : offsets[i + 1]] if valid[i] else None for i in range(len(array))]
+
+
+def _table_to_records(table, column_names=None):
+    """records (dicts) from a table made by _records_to_table, column_names optionally maps columns back to keys"""
+    pa = _pyarrow()
+    metadata = json.loads((table.schema.metadata or {}).get(_metadata_key, b"{}"))
+    json_columns = set(metadata.get("json_columns", []))
+    array_columns = set(metadata.get("array_columns", []))
+    keys = {name: key for key, name in (column_names or {}).items()}
+    records = [{} for _ in range(table.num_rows)]
+    for name in table.column_names:
+        if any(
+            name.endswith(suffix) and name.removesuffix(suffix) in table.column_names
+            for suffix in (_present_suffix, _integer_suffix)
+        ):
+            continue
+        column = table.column(name)
+        if name in json_columns:
+            values = [json.loads(value) for value in column.to_pylist()]
+        elif name in array_columns and (pa.types.is_list(column.type) or pa.types.is_large_list(column.type)):
+            values = _list_column_arrays(column, pa)
+        else:
+            values = column.to_pylist()
+        if name + _integer_suffix in table.column_names:
+            flags = table.column(name + _integer_suffix).to_pylist()
+            values = [_restore_integers(value, flag) for value, flag in zip(values, flags)]
+        if name + _present_suffix in table.column_names:
+            present = table.column(name + _present_suffix).to_pylist()
+        else:
+            present = None
+        key = keys.get(name, name)
+        for row, (record, value) in enumerate(zip(records, values)):
+            if present is None or present[row]:
+                record[key] = value
+    return records
+
+
+def _table_path(path, name, file_format):
+    return Path(path) / f"{name}{file_formats[file_format]}"
+
+
+def _write_table(table, path, file_format):
+    pa = _pyarrow()
+    if file_format == "parquet":
+        pa.parquet.write_table(table, path)
+    else:
+        with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def _read_table(path):
+    pa = _pyarrow()
+    if Path(path).suffix == file_formats["parquet"]:
+        return pa.parquet.read_table(path, memory_map=True)
+    ## memory-mapped, so the columns are read from the file only when they are used
+    return pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+
+
+def _find_table(path, name):
+    for suffix in file_formats.values():
+        table_path = Path(path) / f"{name}{suffix}"
+        if table_path.exists():
+            return table_path
+    raise FileNotFoundError(f"no {name} table in {path}")
+
+
+def bar_to_tables(bar):
+    """
+    Samples and Acquisitions tables for a bar (list of sample dicts), the acquisitions have a sample_index column
+    giving the position of their sample in the bar
+    """
+    samples = [{key: value for key, value in sample.items() if key != "acquisitions"} for sample in bar]
+    acquisitions = [
+        {"sample_index": index, **acquisition}
+        for index, sample in enumerate(bar)
+        for acquisition in sample.get("acquisitions", [])
+    ]
+    return _records_to_table(samples), _records_to_table(acquisitions)
+
+
+def tables_to_bar(samples_table, acquisitions_table):
+    """bar (list of sample dicts) from the tables made by bar_to_tables"""
+    bar = _table_to_records(samples_table)
+    for sample in bar:
+        sample["acquisitions"] = []
+    for acquisition in _table_to_records(acquisitions_table):
+        bar[acquisition.pop("sample_index")]["acquisitions"].append(acquisition)
+    return bar
+
+
+def queue_to_tables(queue):
+    """
+    Queue and Steps tables for a queue (as from dryrun_bar), each step has an entry column giving the position of
+    its acquisition entry in the queue, and a kwargs.<name> column for each of its kwargs
+    """
+    entries = [{key: value for key, value in entry.items() if key != "steps"} for entry in queue]
+    steps = []
+    kwarg_names = {}
+    for index, entry in enumerate(queue):
+        for step in entry.get("steps", []):
+            record = {"entry": index}
+            for key, value in step.items():
+                if key == "kwargs" and isinstance(value, dict):
+                    record["kwargs"] = True  # so steps with empty kwargs keep them
+                    for name, kwarg in value.items():
+                        kwarg_names[("kwargs", name)] = _kwarg_prefix + str(name)
+                        record[("kwargs", name)] = kwarg
+                else:
+                    record[key] = value
+            steps.append(record)
+    return _records_to_table(entries), _records_to_table(steps, kwarg_names)
+
+
+def tables_to_queue(queue_table, steps_table):
+    """AcquisitionQueue from the tables made by queue_to_tables"""
+    queue = AcquisitionQueue(_table_to_records(queue_table))
+    for entry in queue:
+        entry["steps"] = []
+    kwarg_columns = {name: name for name in steps_table.column_names if name.startswith(_kwarg_prefix)}
+    for record in _table_to_records(steps_table):
+        step = {"kwargs": {}} if record.get("kwargs") is True else {}
+        for key, value in record.items():
+            if key in kwarg_columns:
+                step["kwargs"][key.removeprefix(_kwarg_prefix)] = value
+            elif key != "entry" and not (key == "kwargs" and value is True):
+                step[key] = value
+        ## keep the order of the keys in the step as made by the dry run
+        step = {key: step[key] for key in ("description", "action", "kwargs") if key in step} | step
+        queue[record["entry"]]["steps"].append(step)
+    return queue
+
+
+def save_bar_arrow(bar, path, queue=None, file_format="arrow"):
+    """
+    saves a bar, and optionally its queue, as tables in the directory path
+
+    Parameters
+    ----------
+    bar : list of dict
+        list of sample dicts, as from load_samplesxlsx
+    path : str or Path
+        directory for the table files (samples, acquisitions, and optionally queue and steps), made if needed
+    queue : list of dict, optional
+        queue as from dryrun_bar, by default None
+    file_format : str, optional
+        "arrow" for Arrow IPC files, which are memory-mapped when loaded, or "parquet" for smaller files,
+        by default "arrow"
+
+    Returns
+    -------
+    list of Path
+        the table files written
+    """
+    if file_format not in file_formats:
+        raise ValueError(f"file_format must be one of {list(file_formats)}, not {file_format}")
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    tables = dict(zip(table_names["bar"], bar_to_tables(bar)))
+    if queue is not None:
+        tables.update(zip(table_names["queue"], queue_to_tables(queue)))
+    written = []
+    for name, table in tables.items():
+        table_path = _table_path(path, name, file_format)
+        _write_table(table, table_path, file_format)
+        written.append(table_path)
+    return written
+
+
+def load_bar_arrow(path):
+    """bar (list of sample dicts) from the tables saved by save_bar_arrow in the directory path"""
+    return tables_to_bar(*(_read_table(_find_table(path, name)) for name in table_names["bar"]))
+
+
+def load_queue_arrow(path):
+    """
+    AcquisitionQueue from the tables saved by save_bar_arrow in the directory path
+    from Arrow files, the energies and exposure times are read-only numpy views into the memory-mapped file
+    """
+    return tables_to_queue(*(_read_table(_find_table(path, name)) for name in table_names["queue"]))
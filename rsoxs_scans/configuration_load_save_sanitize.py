@@ -10,13 +10,23 @@ import datetime
 import re, warnings, httpx
 import uuid
 
-from rsoxs_scans.defaultEnergyParameters import energyListParameters
+from rsoxs_scans.fingerprint import previous_proposal_info, reuse_identities
+from rsoxs_scans.validation import (
+    samplesSchema,
+    samplesSchema_Compiled,
+    acquisitionsSchema_Compiled,
+    checkDataFrame,
+    invalidRows,
+    parametersWithRule,
+)
 
 
 CURRENT_CYCLE = '2025-1' ## Currently, this needs to be changed manually at the beginning of each cycle.
 
 
-def load_configuration_spreadsheet_local(file_path):
+def load_configuration_spreadsheet_local(file_path, previous_configuration=None):
+    ## previous_configuration: optionally, the configuration loaded from an earlier version of the spreadsheet.
+    ## Samples with the same sample_id and proposal_id reuse its PASS lookup, and acquisitions which are unchanged or modified keep their uid_local (see fingerprint.diff_bars).
     ## TODO: use natsort to get things in order of bar location
 
     ## The following are items that were present in Eliot's spreadsheet loader, but I might not keep going forward.
@@ -28,7 +38,7 @@ def load_configuration_spreadsheet_local(file_path):
     samplesDF = pd.read_excel(file_path, sheet_name="Samples")
     samplesDF = sanitizeSpreadsheet(samplesDF)
     configuration = samplesDF.to_dict(orient="records")
-    configuration = sanitizeSamples(configuration)
+    configuration = sanitizeSamples(configuration, previousConfiguration=previous_configuration)
 
     ## Load list of acquisitions, make a dictionary, and sanitize
     acquisitionsDF = pd.read_excel(file_path, sheet_name="Acquisitions")
@@ -40,6 +50,9 @@ def load_configuration_spreadsheet_local(file_path):
     for indexAcquisition, acquisition in enumerate(acquisitionsDict):
         configuration = updateConfigurationWithAcquisition(configuration, acquisition)
 
+    if previous_configuration is not None:
+        reuse_identities(previous_configuration, configuration, uid_key="uid_local")
+
     return configuration
 
 
@@ -143,41 +156,25 @@ sampleParameters_Empty = {
     "analysis_dir": None,
     "data_session": None,
 }
-samplesParameters_Required = [
-    "bar_name",
-    "sample_id",
-    "sample_name",
-    "project_name",
-    "institution",
-    "proposal_id",
-    "bar_spot",
-    "front",
-    "grazing",
-    "angle",
-    "height",
-    "sample_priority",
-]
+## The parameter lists are derived from the declarative schema in validation.py so that the rules live in one place
+samplesParameters_Required = parametersWithRule(samplesSchema, "required")
 ## TODO: I want to have a notes parameter, but not as a required parameter
-samplesParameters_Strings = [
-    "bar_name",
-    "sample_id",
-    "sample_name",
-    "project_name",
-    "institution",
-    "bar_spot",
-]
-samplesParameters_Booleans = [
-    "front",
-    "grazing",
-]
-samplesParameters_Ints = [
-    "proposal_id",
-    "sample_priority",
-]
-
-
-def sanitizeSamples(configurationInput):
+samplesParameters_Strings = parametersWithRule(samplesSchema, "type", "string")
+samplesParameters_Booleans = parametersWithRule(samplesSchema, "type", "boolean")
+samplesParameters_Ints = parametersWithRule(samplesSchema, "type", "integer")
+
+
+def sanitizeSamples(configurationInput, previousConfiguration=None):
     configuration = copy.deepcopy(configurationInput)
+    ## Check required parameters, their types, and values against the schema in validation.py for all samples at
+    ## once, so every invalid cell is reported together.  This also covers a sample configuration loaded as
+    ## dictionaries directly in Bluesky rather than from a spreadsheet.
+    samplesDF = pd.DataFrame(configuration, dtype=object)
+    checkDataFrame(samplesDF, samplesSchema_Compiled, sheetName="Samples")
+    ## Invalid angles were reported by the schema check.  Default them to normal incidence.
+    for indexSample in invalidRows(samplesDF, samplesSchema_Compiled, "angle"):
+        configuration[indexSample]["angle"] = 90 if configuration[indexSample]["grazing"] else 0
+
     for indexSample, sample in enumerate(
         copy.deepcopy(configuration)
     ):  ## Making a copy so that I am not changing the configuration that I am iterating over
@@ -192,42 +189,6 @@ def sanitizeSamples(configurationInput):
             if isinstance(sample[parameter], float):
                 if np.isnan(sample[parameter]): configuration[indexSample][parameter] = None
         """
-        ## Check that required parameters exist
-        ## For a spreadsheet, this would probably be more efficient to check once when the spreadsheet is loaded rather than one-by-one for each sample.  But it is good to have in case sample configuration is loaded as dictionary directly in Bluesky rather than using spreadsheet.
-        for indexParameter, parameter in enumerate(samplesParameters_Required):
-            if sample.get(parameter, "Not present") == "Not present":
-                raise KeyError(
-                    parameter
-                    + " is a required parameter.  Please add "
-                    + parameter
-                    + " parameter with an appropriate value."
-                )
-
-        ## Then sanitize required parameters further to make sure they are correct type, value, etc.
-        for indexParameter, parameter in enumerate(samplesParameters_Strings):
-            if not isinstance(sample[parameter], str):
-                raise ValueError(parameter + " for row " + str(indexSample) + " must be a string")
-        for indexParameter, parameter in enumerate(samplesParameters_Booleans):
-            if not isinstance(sample[parameter], bool):
-                raise ValueError(parameter + " for row " + str(indexSample) + " must be TRUE or FALSE")
-        for indexParameter, parameter in enumerate(samplesParameters_Ints):
-            if (not isinstance(sample[parameter], int)) or (sample[parameter] < 0):
-                raise ValueError(parameter + " for row " + str(indexSample) + " must be a positive integer")
-        ## If sample angles are invalid, default to normal incidence
-        if sample["grazing"]:
-            if (not isinstance(sample["angle"], (float, int))) or (sample["angle"] < 20) or (sample["angle"] > 90):
-                print("Invalid angle.  Defaulting to normal incidence.")
-                configuration[indexSample]["angle"] = 90
-        if not sample["grazing"]:
-            if (
-                (not isinstance(sample["angle"], (float, int)))
-                or (sample["angle"] < -14)
-                or (sample["angle"] > 90)
-            ):
-                print("Invalid angle.  Defaulting to normal incidence.")
-                configuration[indexSample]["angle"] = 0
-        if not (sample["height"] >= 0):
-            raise ValueError("Sample height in row " + str(indexSample) + " must be 0 or larger.")
 
         ## Sanitize location and acquisition history
         ## This is mostly copied from Eliot's code without much reorganization
@@ -257,13 +218,17 @@ def sanitizeSamples(configurationInput):
         )
 
         ## Grab proposal information from PASS.  Copied from Eliot's code.
+        ## If the sample was in the previous configuration with the same proposal, reuse that instead of looking it up again.
         try:
+            proposalInfo = previous_proposal_info(previousConfiguration, sample)
+            if proposalInfo is None:
+                proposalInfo = get_proposal_info(str(sample["proposal_id"]))
             (
                 configuration[indexSample]["data_session"],
                 configuration[indexSample]["analysis_dir"],
                 configuration[indexSample]["SAF"],
                 configuration[indexSample]["proposal"],
-            ) = get_proposal_info(str(sample["proposal_id"]))
+            ) = proposalInfo
         except:
             warnings.warn("PASS lookup failed - trusting values", stacklevel=2)
             pass
@@ -407,6 +372,13 @@ acquisitionParameters_Default = {
 
 def sanitizeAcquisitions(acquisitionsInput, configuration):
     acquisitions = copy.deepcopy(acquisitionsInput)
+    ## Report every invalid cell of all acquisitions at once rather than stopping at the first bad row
+    checkDataFrame(
+        pd.DataFrame(acquisitions, dtype=object),
+        acquisitionsSchema_Compiled,
+        sheetName="Acquisitions",
+        defaults=acquisitionParameters_Default,
+    )
 
     sampleIDs = [sample["sample_id"] for sample in configuration]
 
@@ -414,14 +386,23 @@ def sanitizeAcquisitions(acquisitionsInput, configuration):
         if acquisition["sample_id"] not in sampleIDs:
             raise ValueError("sample_id " + str(acquisition["sample_id"]) + " in Acquisitions row " + str(indexAcquisition) + " was not found in Samples list")
         
-        acquisitions[indexAcquisition] = sanitizeAcquisition(acquisition)
+        acquisitions[indexAcquisition] = sanitizeAcquisition(acquisition, validate=False)
     
 
     return acquisitions
 
 
-def sanitizeAcquisition(acquisitionInput):
+def sanitizeAcquisition(acquisitionInput, validate=True):
+    ## validate: check the acquisition against the schema in validation.py.  sanitizeAcquisitions checks all
+    ## acquisitions at once beforehand instead.
     acquisition = copy.deepcopy(acquisitionInput)
+    if validate:
+        checkDataFrame(
+            pd.DataFrame([acquisition], dtype=object),
+            acquisitionsSchema_Compiled,
+            sheetName="Acquisitions",
+            defaults=acquisitionParameters_Default,
+        )
     ## Sanitize general parameters
     for indexParameter, parameter in enumerate(list(acquisitionParameters_Default.keys())):
         if (
@@ -432,46 +413,17 @@ def sanitizeAcquisition(acquisitionInput):
             acquisition[parameter] = acquisitionParameters_Default[parameter]
     
 
-    ## TODO: would like to find a way to automate configurations list
-    parameterName = "configuration_instrument"
-    if acquisition[parameterName] not in ("NoBeam",
-                                        "WAXS_OpenBeamImages",
-                                        "WAXSNEXAFS",
-                                        "WAXS",
-                                        "WAXS_LowFlux",
-                                        ):
-        raise ValueError("Please enter valid " + str(parameterName))
-
-    parameterName = "polarization_frame"
-    if acquisition[parameterName] not in ("lab", "sample"): raise ValueError("Please enter valid " + str(parameterName))
-
+    ## Values were checked against the schema in validation.py, so only conversions are left here
     for parameterName in ["polarizations", "sample_angles"]:
         if isinstance(acquisition[parameterName], (int, float)):
             acquisition[parameterName] = [acquisition[parameterName]]
-        if not isinstance(acquisition[parameterName], (list, tuple)): raise ValueError("Please enter valid " + str(parameterName))
-        else:
-            for angle in acquisition[parameterName]:
-                if parameterName == "polarizations":
-                    if not (angle == -1
-                            or (0 <= angle <= 180)):
-                        raise ValueError("Please enter valid " + str(parameterName))
-                if parameterName == "sample_angles":
-                    temp = 0 ## TODO: replace placeholder with something meaningful
-                    ## TODO: need better way to deal with Sample tab entries.  Probably need to have configuration as an input
-                    ## TODO: on a broader level, probably want to remove angle from bar entry and only have it in acquisitions
-            
-    
-    parameterName = "exposure_time"
-    if not isinstance(acquisition[parameterName], (int, float)): raise TypeError(str(parameterName) + " must be a single number.")
-    elif acquisition[parameterName] < 0.001 or acquisition[parameterName] > 10: raise ValueError(str(parameterName) + " must be between 0.001 and 10 s.")
+            ## TODO: need better way to deal with Sample tab entries.  Probably need to have configuration as an input
+            ## TODO: on a broader level, probably want to remove angle from bar entry and only have it in acquisitions
 
     parameterName = "exposures_per_energy"
     acquisition[parameterName] = int(acquisition[parameterName])
 
-    parameterName = "priority"
-    if not isinstance(acquisition[parameterName], (int, float)): raise TypeError(str(parameterName) + " must be an integer.")
-    
-    
+
     ## Sanitize parameters for specific scan types
     parameterName = "scan_type"
     if acquisition[parameterName] in ("time", "time2D"):
@@ -480,7 +432,6 @@ def sanitizeAcquisition(acquisitionInput):
         acquisition = sanitizeSpirals(acquisition)
     elif acquisition[parameterName] in ("nexafs", "rsoxs"):
         acquisition = sanitizeEnergyScan(acquisition)
-    else: raise ValueError("Please enter valid " + str(parameterName))
 
     ## Adding a local UID (not the same as Tiled's UID) so that I can identify this scan when I want to update it with data while it is running like acquireStatus
     if (
@@ -494,30 +445,16 @@ def sanitizeAcquisition(acquisitionInput):
 
 def sanitizeTimeScan(acquisitionInput):
     acquisition = copy.deepcopy(acquisitionInput)
-    parameter = "energy_list_parameters"
-    if not (
-        isinstance(acquisition[parameter], (float, int))
-    ):
-        raise TypeError(str(parameter) + " must be a single number.")
+    ## energy_list_parameters is checked to be a single number by the schema, nothing else to convert yet
 
     return acquisition
 
 
 def sanitizeSpirals(acquisitionInput):
     acquisition = copy.deepcopy(acquisitionInput)
-    parameter = "energy_list_parameters"
-    if not (isinstance(acquisition[parameter], (float, int))):
-        raise TypeError(str(parameter) + " must be a single number.")
-
     parameterName = "spiral_dimensions"
     if acquisition[parameterName] is None:
         acquisition[parameterName] = [0.3, 1.8, 1.8]
-    elif not isinstance(acquisition[parameterName], (list, tuple)):
-        raise TypeError(str(parameterName) + " must be a list.")
-    elif len(acquisition[parameterName]) != 3:
-        raise ValueError(
-            f"spiral_dimensions must have 3 elements, got {acquisition[parameterName]} with length {len(acquisition[parameterName])}"
-        )
 
     return acquisition
 
@@ -526,16 +463,12 @@ def sanitizeEnergyScan(acquisitionInput):
     acquisition = copy.deepcopy(acquisitionInput)
     ## TODO: Most of the sanitization here can be reused for rsoxs scans.  This then would get called in sanitizeAcquisitions.
     parameterName = "energy_list_parameters"
-    if acquisition[parameterName] is None: raise ValueError("Please enter valid " + str(parameterName))
     if isinstance(acquisition[parameterName], (float, int)):
         acquisition[parameterName] = (
             acquisition[parameterName],
             acquisition[parameterName],
             0,
         )
-    if isinstance(acquisition[parameterName], str):
-        if acquisition[parameterName] not in list(energyListParameters.keys()):
-            raise ValueError("Please enter valid energy plan.")
 
     return acquisition
 
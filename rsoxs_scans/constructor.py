@@ -20,6 +20,7 @@ from .defaults import (
     nexafs_edges,
     nexafs_speed_table,
     default_warning_step_time,
+    VersionedTable,
 )
 
 
@@ -62,11 +63,63 @@ def get_nexafs_scan_params(edge, speed=default_speed, ratios=None, quiet=False,
     Returns
     -------
     scan_params
-        _description_ #TODO docs
+        list of (start energy, end energy, speed) for each region of the scan
     time
-        _description_ #TODO docs
+        estimated duration of the scan in seconds
     """
 
+    scan_params, time = _resolve_nexafs_scan_params_cached(edge, speed, ratios)
+    scan_params = list(scan_params)
+
+    if not quiet:
+        # ------- remove this for production, it's just for looking at the output conveniently during development
+        print(scan_params)
+        print(len(scan_params))
+        print(f"time : {datetime.timedelta(seconds=time)}")
+        # --------
+
+    return scan_params, time
+
+
+# the cache is cleared whenever one of the lookup tables the NEXAFS scan parameters depend on is edited or replaced
+_nexafs_scan_params_cache = {}
+_nexafs_scan_params_cache_tables = None
+
+
+def _cache_key(value):
+    # sequences (including the redis backed ones) become tuples, and the type is kept so 250 and 250.0 stay distinct
+    if isinstance(value, (tuple, list, redis_json_dict.redis_json_dict.ObservableSequence)):
+        return ("sequence", tuple(_cache_key(item) for item in value))
+    return (type(value).__name__, value)
+
+
+def _resolve_nexafs_scan_params_cached(edge, speed, ratios):
+    global _nexafs_scan_params_cache_tables
+    # the tables are looked up on every call, so a table replaced in this module is noticed as well as one edited
+    tables = (edge_names, nexafs_edges, nexafs_ratios_table, nexafs_speed_table)
+    if not all(isinstance(table, VersionedTable) for table in tables):
+        # edits to other tables (e.g. a plain dict) can't be seen, so nothing is cached
+        return _resolve_nexafs_scan_params(edge, speed, ratios)
+    state = tuple((table, table.version) for table in tables)
+    if _nexafs_scan_params_cache_tables is None or any(
+        table is not cached_table or version != cached_version
+        for (table, version), (cached_table, cached_version) in zip(state, _nexafs_scan_params_cache_tables)
+    ):
+        _nexafs_scan_params_cache.clear()
+        _nexafs_scan_params_cache_tables = state
+    try:
+        key = (_cache_key(edge), _cache_key(speed), _cache_key(ratios))
+        hash(key)
+    except TypeError:
+        # unhashable inputs are resolved every time
+        return _resolve_nexafs_scan_params(edge, speed, ratios)
+    if key not in _nexafs_scan_params_cache:
+        _nexafs_scan_params_cache[key] = _resolve_nexafs_scan_params(edge, speed, ratios)
+    return _nexafs_scan_params_cache[key]
+
+
+def _resolve_nexafs_scan_params(edge, speed, ratios):
+    # returns (tuple of scan params, time)
     edge_input = edge
     singleinput = False
     if isinstance(edge, str):
@@ -102,15 +155,8 @@ def get_nexafs_scan_params(edge, speed=default_speed, ratios=None, quiet=False,
     for i, ratio in enumerate(ratios):
         scan_params += [(edge[i], edge[i + 1], float(ratio) * float(speed))]
         time += abs(edge[i + 1] - edge[i]) / (float(ratio) * float(speed))
+    return tuple(scan_params), time
 
-    if not quiet:
-        # ------- remove this for production, it's just for looking at the output conveniently during development
-        print(scan_params)
-        print(len(scan_params))
-        print(f"time : {datetime.timedelta(seconds=time)}")
-        # --------
-
-    return scan_params, time
 
 # TODO docs
 def get_energies(edge, frames=default_frames, ratios=None, quiet=False, **kwargs):
@@ -3,6 +3,48 @@
 """
 
 
+class VersionedTable(dict):
+    """dict which counts its changes, so anything cached from a lookup table can tell when the table was edited"""
+
+    version = 0
+
+    def _changed(self):
+        self.version += 1
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._changed()
+
+    def __ior__(self, other):
+        result = super().__ior__(other)
+        self._changed()
+        return result
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._changed()
+
+    def setdefault(self, key, default=None):
+        self._changed()
+        return super().setdefault(key, default)
+
+    def pop(self, *args):
+        self._changed()
+        return super().pop(*args)
+
+    def popitem(self):
+        self._changed()
+        return super().popitem()
+
+    def clear(self):
+        super().clear()
+        self._changed()
+
+
 CURRENT_CYCLE = '2025-1' ## Currently, this needs to be changed manually at the beginning of each cycle.
 
 # set the defaults one place
@@ -12,8 +54,20 @@ default_speed = "normal"
 default_cycles = 0
 default_diameter = 1.8
 default_spiral_step = 0.3
+default_spiral_point_overhead = 4.0  # seconds of detector readout and bookkeeping per spiral point, on top of the exposure
+default_sample_motor_speed = 0.5  # mm/s for the sample x and y motors
+default_motor_settle_time = 0.5  # seconds to accelerate and settle for every sample move
 default_exposure_time = 1
 default_warning_step_time = 1800
+default_config_change_time = 120  # seconds to change between configurations
+grazing_angle_range = (20, 90)  # valid sample angles (inclusive) for grazing samples
+transmission_angle_range = (-14, 90)  # valid sample angles (inclusive) for transmission samples
+# soft limits (inclusive) checked for every sample location before a scan is queued
+location_axes = ("x", "y", "z", "th", "temz")
+motor_limits = {"x": (-13, 13), "y": (-190, 355), "z": (-13, 13), "temz": (0, 150)}
+motor_limit_names = {"x": "X", "y": "Y", "z": "Z", "temz": "TEMz"}
+tey_clash_temz = 100  # TEMz above this can clash with the sample bar ...
+tey_clash_y = 20  # ... if the bar is below this y position
 current_version = "2023-2 Version 1.0" ## This version should match the version of the Excel spreadsheet document.
 
 actions = {
@@ -45,7 +99,7 @@ rsoxs_scan_core    : {'detnames', 'repeats', 'temperatures', 'temps_with_locatio
 
 
 # look up table for aliases of edges
-edge_names = {
+edge_names = VersionedTable({
     "c": "carbon",
     "carbon": "carbon",
     "carbonk": "carbon",
@@ -68,7 +122,7 @@ edge_names = {
     "cak": "calcium",
     'al': 'aluminium',
     'aluminum': 'aluminium',
-}
+})
 
 
 # these define the default edges of the intervals for rsoxs and NEXAFS step scans
@@ -118,7 +172,7 @@ frames_table = {
 
 # these define the default edges of the intervals for nexafs scans
 ## The NEXAFS edges and ratios are different from those used for RSoXS due to the pseudo-flyscanning that is used for NEXAFS.  Each energy subrange has its own speed, and changing the speed at each energy threshold slows down the scan.  Thus, fewer energy subranges are used for NEXAFS scans.
-nexafs_edges = {
+nexafs_edges = VersionedTable({
     "carbon": (250, 282, 297, 350),
     "oxygen": (500, 525, 540, 560),
     "fluorine": (650, 680, 700, 740),
@@ -130,19 +184,19 @@ nexafs_edges = {
     "ironl": (680,700,730,780),
     "siliconk" : (1820,1840,1860,1910),
     "magnesium" : (1250,1300,1330,1430),
-}
+})
 
 # these are the default speed ratios for each section in nexafs scans
-nexafs_ratios_table = {
+nexafs_ratios_table = VersionedTable({
     "default 4": (5, 1, 5),
     "default 5": (5, 1, 2, 5),
     "default 6": (5, 2, 1, 2, 5),
     "default 2": (1,),
     "default 3": (5, 1),
-}
+})
 
 # these are the default speed aliases for NEXAFS scans
-nexafs_speed_table = {
+nexafs_speed_table = VersionedTable({
     "normal": 0.2,
     "": 0.2,
     "quick": 0.4,
@@ -150,7 +204,7 @@ nexafs_speed_table = {
     "very fast": 1,
     "slow": 0.1,
     "very slow": 0.05,
-}
+})
 
 # List of Valid Measurement Configurations
 config_list = [
@@ -0,0 +1,174 @@
+"""Content fingerprints of samples and acquisitions, and the changes between two versions of a bar
+
+A fingerprint is a hash of what was entered for a sample or acquisition, leaving out the values which are generated
+when the sheet is loaded or run (uids, PASS lookups, and the detector set by dry runs), so the same row gives the
+same fingerprint every time the sheet is loaded.  This works for bars from load_samplesxlsx and configurations from
+load_configuration_spreadsheet_local.
+"""
+
+# imports
+from .serialization import content_key
+
+
+## Values of a sample which don't come from its row of the sheet
+sample_generated_keys = ("acquisitions", "data_session", "analysis_dir", "SAF", "proposal", "RSoXS_Main_DET")
+## PASS database values of a sample, which only depend on its proposal_id
+sample_proposal_keys = ("data_session", "analysis_dir", "SAF", "proposal")
+## Identifiers of an acquisition, which are made when the sheet is loaded
+acquisition_identity_keys = ("uid", "uid_local")
+## Values of an acquisition which don't describe it: its identifiers, its row number in the sheet (which changes
+## when rows are inserted above), and its progress
+acquisition_generated_keys = acquisition_identity_keys + ("Parameter/ Index", "acquire_status")
+## What kind of acquisition it is (in bars from load_samplesxlsx, and in configurations), an edited acquisition
+## must keep all of these
+acquisition_kind_keys = (
+    "type",
+    "edge",
+    "configuration",
+    "scan_type",
+    "energy_list_parameters",
+    "configuration_instrument",
+)
+## Fraction of the other parameters an edited acquisition must share with the original
+acquisition_similarity = 0.5
+
+
+def sample_fingerprint(sample):
+    """hash of the parameters of a sample, without its acquisitions and the values filled in when it is loaded"""
+    return content_key({key: value for key, value in sample.items() if key not in sample_generated_keys})
+
+
+def acquisition_fingerprint(acq):
+    """hash of the parameters of an acquisition (including its sample_id), without its uid and row number"""
+    return content_key({key: value for key, value in acq.items() if key not in acquisition_generated_keys})
+
+
+def _same_value(old_value, new_value):
+    return content_key(old_value) == content_key(new_value)
+
+
+def _similarity(old_acq, new_acq):
+    # fraction of the parameters of either acquisition which are the same in both, or None if they are a different
+    # kind of acquisition
+    keys = (old_acq.keys() | new_acq.keys()) - set(acquisition_generated_keys)
+    if any(not _same_value(old_acq.get(key), new_acq.get(key)) for key in acquisition_kind_keys if key in keys):
+        return None
+    keys -= set(acquisition_kind_keys) | {"sample_id"}
+    if not keys:
+        return 1.0
+    shared = sum(
+        1 for key in keys if key in old_acq and key in new_acq and _same_value(old_acq[key], new_acq[key])
+    )
+    return shared / len(keys)
+
+
+def _match_acquisitions(old_acqs, new_acqs):
+    # pairs the acquisitions of one sample: the same parameters first (in order), then each remaining new
+    # acquisition with the remaining old acquisition of the same kind (type, edge, configuration) sharing the most
+    # of its other parameters, if it shares at least acquisition_similarity of them.  anything else is added or
+    # removed
+    old_prints = [acquisition_fingerprint(acq) for acq in old_acqs]
+    unmatched_old = {}
+    for index, fingerprint in enumerate(old_prints):
+        unmatched_old.setdefault(fingerprint, []).append(index)
+    unchanged, remaining_new = [], []
+    for acq in new_acqs:
+        indexes = unmatched_old.get(acquisition_fingerprint(acq))
+        if indexes:
+            unchanged.append((old_acqs[indexes.pop(0)], acq))
+        else:
+            remaining_new.append(acq)
+    remaining_old = sorted(index for indexes in unmatched_old.values() for index in indexes)
+    modified, added = [], []
+    for acq in remaining_new:
+        scores = []
+        for position, index in enumerate(remaining_old):
+            similarity = _similarity(old_acqs[index], acq)
+            if similarity is not None and similarity >= acquisition_similarity:
+                scores.append((similarity, -position))
+        if scores:
+            position = -max(scores)[1]
+            modified.append((old_acqs[remaining_old.pop(position)], acq))
+        else:
+            added.append(acq)
+    removed = [old_acqs[index] for index in remaining_old]
+    return unchanged, modified, added, removed
+
+
+def diff_bars(old_bar, new_bar):
+    """
+    compares two versions of a bar (or configuration) and sorts its samples and acquisitions into unchanged,
+    modified, added, and removed
+
+    samples are matched by sample_id.  the acquisitions of each sample are matched by their parameters, and any
+    left over are paired with one of the same type, edge, and configuration sharing most of its other parameters,
+    as a modified acquisition
+
+    Parameters
+    ----------
+    old_bar : list of dict
+        earlier version of the bar, list of sample dicts with acquisitions
+    new_bar : list of dict
+        later version of the bar
+
+    Returns
+    -------
+    dict
+        "samples": {"unchanged", "modified", "added", "removed": lists of sample_ids},
+        "acquisitions": {"unchanged", "modified": lists of (old acquisition, new acquisition),
+        "added": list of new acquisitions, "removed": list of old acquisitions}
+    """
+    old_samples = {sample["sample_id"]: sample for sample in old_bar or []}
+    new_samples = {sample["sample_id"]: sample for sample in new_bar}
+    samples = {"unchanged": [], "modified": [], "added": [], "removed": []}
+    acquisitions = {"unchanged": [], "modified": [], "added": [], "removed": []}
+    for sample_id, sample in new_samples.items():
+        old_sample = old_samples.get(sample_id)
+        if old_sample is None:
+            samples["added"].append(sample_id)
+            acquisitions["added"].extend(sample.get("acquisitions", []))
+            continue
+        if sample_fingerprint(old_sample) == sample_fingerprint(sample):
+            samples["unchanged"].append(sample_id)
+        else:
+            samples["modified"].append(sample_id)
+        matches = _match_acquisitions(old_sample.get("acquisitions", []), sample.get("acquisitions", []))
+        for kind, found in zip(("unchanged", "modified", "added", "removed"), matches):
+            acquisitions[kind].extend(found)
+    for sample_id, old_sample in old_samples.items():
+        if sample_id not in new_samples:
+            samples["removed"].append(sample_id)
+            acquisitions["removed"].extend(old_sample.get("acquisitions", []))
+    return {"samples": samples, "acquisitions": acquisitions}
+
+
+def reuse_identities(previous_bar, bar, uid_key="uid"):
+    """
+    gives the acquisitions of bar which are unchanged or modified since previous_bar their earlier uid (uid_key),
+    so they can be recognised by anything which keeps track of them by uid.  bar is changed in place
+
+    Returns
+    -------
+    dict
+        the changes from previous_bar to bar (see diff_bars)
+    """
+    changes = diff_bars(previous_bar, bar)
+    for old_acq, acq in changes["acquisitions"]["unchanged"] + changes["acquisitions"]["modified"]:
+        if uid_key in old_acq:
+            acq[uid_key] = old_acq[uid_key]
+    return changes
+
+
+def previous_proposal_info(previous_bar, sample, proposal_key="proposal_id"):
+    """
+    PASS values (data_session, analysis_dir, SAF, proposal) of the sample with the same sample_id and proposal in
+    previous_bar, so it needn't be looked up again, or None if there is no such sample
+    """
+    for old_sample in previous_bar or []:
+        if (
+            old_sample.get("sample_id") == sample.get("sample_id")
+            and str(old_sample.get(proposal_key)) == str(sample.get(proposal_key))
+            and all(key in old_sample for key in sample_proposal_keys)
+        ):
+            return tuple(old_sample[key] for key in sample_proposal_keys)
+    return None
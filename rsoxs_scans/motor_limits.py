@@ -0,0 +1,102 @@
+"""Checks lists of sample locations against the motor soft limits and interlocks
+
+"""
+
+# imports
+import numpy as np
+from .defaults import location_axes, motor_limits, motor_limit_names, tey_clash_temz, tey_clash_y
+
+
+def pack_locations(locations, axes=location_axes):
+    """
+    packs a list of locations (each a list of {"motor", "position"}) into an (N, axes) float array
+    motors which are missing (or have no position) in a location are NaN
+    """
+    column = {axis: index for index, axis in enumerate(axes)}
+    positions = np.full((len(locations), len(axes)), np.nan)
+    for row, location in enumerate(locations):
+        for motor in location:
+            index = column.get(motor["motor"])
+            if index is not None and motor["position"] is not None:
+                positions[row, index] = motor["position"]
+    return positions
+
+
+def check_locations(locations, axes=location_axes, limits=None):
+    """
+    checks every location against the motor soft limits and the TEY clash interlock in one pass
+
+    Parameters
+    ----------
+    locations : list or numpy.ndarray
+        list of locations, or an array already made by pack_locations with the same axes
+    axes : tuple, optional
+        motors to pack, by default location_axes
+    limits : dict, optional
+        {motor: (low, high)}, by default motor_limits
+
+    Returns
+    -------
+    dict
+        "positions": the (N, axes) array of positions
+        "axes": the motor of each column
+        "violations": {motor: (N,) bool array, True where the motor is outside its limits}
+        "clash": (N,) bool array, True for locations involved in a possible clash between the TEY and the bar.
+            This happens if the TEY is raised (temz above tey_clash_temz) for any location while the bar is low
+            (y below tey_clash_y) for any location, so the whole list is unsafe if any location is flagged.
+    """
+    if limits is None:
+        limits = motor_limits
+    positions = locations if isinstance(locations, np.ndarray) else pack_locations(locations, axes)
+    column = {axis: index for index, axis in enumerate(axes)}
+    violations = {}
+    for motor, (low, high) in limits.items():
+        if motor in column:
+            values = positions[:, column[motor]]
+            violations[motor] = (values < low) | (values > high)  # NaN (missing) compares False
+    clash = np.zeros(len(positions), dtype=bool)
+    if "temz" in column and "y" in column:
+        raised = positions[:, column["temz"]] > tey_clash_temz
+        low = positions[:, column["y"]] < tey_clash_y
+        clash = (raised & low.any()) | (low & raised.any())
+    return {"positions": positions, "axes": tuple(axes), "violations": violations, "clash": clash}
+
+
+def location_errors(check):
+    """validation text for every rule broken by any location, from the output of check_locations"""
+    validation = ""
+    for motor, mask in check["violations"].items():
+        if mask.any():
+            validation += f"{motor_limit_names.get(motor, motor)} motor is out of vaild range\n"
+    if check["clash"].any():
+        validation += "potential clash between TEY and sample bar\n"
+    return validation
+
+
+def describe_locations(check):
+    """summary of the angles and positions in a location list, from the output of check_locations"""
+    column = {axis: index for index, axis in enumerate(check["axes"])}
+
+    def distinct(motor):
+        values = check["positions"][:, column[motor]]
+        return set(values[~np.isnan(values)].tolist())
+
+    angles, xs, ys, zs, temzs = (distinct(motor) for motor in ("th", "x", "y", "z", "temz"))
+    retstr = ""
+    if len(angles) > 1:
+        retstr += f"\n setting {len(angles)} angles from {min(angles)} to {max(angles)}"
+        retstr += f", x from {min(xs)} to {max(xs)}"
+        retstr += f", y from {min(ys)} to {max(ys)}"
+        if len(zs):
+            retstr += f", z from {min(zs)} to {max(zs)}"
+        if len(temzs):
+            retstr += f", TEMz from {min(temzs)} to {max(temzs)}"
+    else:
+        retstr += f"\n setting angle to {angles}"
+        retstr += f", x to {xs}"
+        retstr += f", y to {ys}"
+        if len(zs):
+            retstr += f", z to {zs}"
+        if len(temzs):
+            retstr += f", and TEMz to {temzs}"
+    return retstr
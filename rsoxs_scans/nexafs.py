@@ -3,11 +3,13 @@
 """
 
 # imports
+import functools
 import numpy as np
-from copy import deepcopy
 from .constructor import get_nexafs_scan_params, get_energies, construct_exposure_times_nexafs
-from .rsoxs import rotate_sample, rotatedx, sanitize_angle
+from .rsoxs import rotatedx, sanitize_angle, rotated_locations
 import redis_json_dict
+from .serialization import intern_array
+from .motor_limits import check_locations, location_errors, describe_locations
 from nbs_bl.plans.scan_base import _make_gscan_points
 
 
@@ -40,36 +42,50 @@ def dryrun_step_scan_energy(
 
 ## Old code below
 
-def nexafs_scan_enqueue(
-    scan_params,
-    cycles=0,
-    pol=0,
-    grating="best",
-    angle=None,
-    plan_name='nexafs',
-    md=None,
-    **kwargs,  # extraneous settings from higher level plans are ignored
-):
-    # grab locals
-    if md is None:
-        md={}
-    if pol is None:
-        pol = 0
-    # validate inputs
+def validate_nexafs_scan_params(scan_params, cycles=0, grating="best"):
+    """Checks the energy ranges, cycles, and grating of a fly NEXAFS scan.
+
+    The energies only need to be checked at the ends of each region, and the result is remembered so the many
+    scans of an acquisition (every temperature, angle, and polarization) with the same parameters are only checked once.
+
+    Parameters
+    ----------
+    scan_params : list
+        (start energy, end energy, speed) for each region, as from get_nexafs_scan_params
+    cycles : int, optional
+        number of times to cycle the energy, by default 0
+    grating : str, optional
+        grating to use, by default "best"
+
+    Returns
+    -------
+    tuple (valid, validation, energy_range, speed_range)
+        whether the inputs are valid, the text describing any problems, and the (min, max) energy and speed
+    """
+    try:
+        return _validate_nexafs_scan_params_cached(
+            tuple(tuple(scanparam) for scanparam in scan_params), cycles, grating
+        )
+    except TypeError:  # unhashable inputs are checked every time
+        return _validate_nexafs_scan_params(scan_params, cycles, grating)
+
+
+def _validate_nexafs_scan_params(scan_params, cycles, grating):
     valid = True
     validation = ""
-    energies = np.empty(0)
-    speeds = []
-    for scanparam in scan_params:
-        (sten, enden, speed) = scanparam
-        energies = np.append(energies, np.linspace(sten, enden, 10))
-        speeds.append(speed)
-    if len(energies) < 10:
+    endpoints = np.array([(sten, enden) for (sten, enden, speed) in scan_params], dtype=float).reshape(-1, 2)
+    speeds = [speed for (sten, enden, speed) in scan_params]
+    if len(endpoints) < 1:
         valid = False
         validation += f"scan parameters {scan_params} could not be parsed\n"
-    if min(energies) < 70 or max(energies) > 2200:
-        valid = False
-        validation += "energy input is out of range for SST 1\n"
+        energy_range = (np.nan, np.nan)
+        speed_range = (np.nan, np.nan)
+    else:
+        energy_range = (endpoints.min(), endpoints.max())
+        speed_range = (np.min(speeds), np.max(speeds))
+        if energy_range[0] < 70 or energy_range[1] > 2200:
+            valid = False
+            validation += "energy input is out of range for SST 1\n"
     if not isinstance(cycles, (int, float)):
         valid = False
         validation += f"invalid cycles input {cycles}\n"
@@ -77,20 +93,43 @@ def nexafs_scan_enqueue(
         valid = False
         validation += f"invalid cycles number {cycles}\n"
     if grating in ["1200", 1200]:
-        if min(energies) < 150:
+        if energy_range[0] < 150:
             valid = False
             validation += "energy is to low for the 1200 l/mm grating\n"
     elif grating in ["250", 250]:
-        if max(energies) > 1300:
+        if energy_range[1] > 1300:
             valid = False
             validation += "energy is too high for 250 l/mm grating\n"
     elif grating == "rsoxs":
-        if max(energies) > 1300:
+        if energy_range[1] > 1300:
             valid = False
             validation += "energy is too high for 250 l/mm grating\n"
     else:
         valid = False
         validation += "invalid grating was chosen"
+    return valid, validation, energy_range, speed_range
+
+
+_validate_nexafs_scan_params_cached = functools.lru_cache(maxsize=256, typed=True)(_validate_nexafs_scan_params)
+
+
+def nexafs_scan_enqueue(
+    scan_params,
+    cycles=0,
+    pol=0,
+    grating="best",
+    angle=None,
+    plan_name='nexafs',
+    md=None,
+    **kwargs,  # extraneous settings from higher level plans are ignored
+):
+    # grab locals
+    if md is None:
+        md={}
+    if pol is None:
+        pol = 0
+    # validate inputs
+    valid, validation, energy_range, speed_range = validate_nexafs_scan_params(scan_params, cycles, grating)
     if pol < -1 or pol > 180:
         valid = False
         validation += f"polarization of {pol} is not valid\n"
@@ -106,8 +145,8 @@ def nexafs_scan_enqueue(
             retstr += f"\n setting polarization to {pol}"
         if grating is not None:
             retstr += f"\n setting grating to {grating}"
-        retstr += f"\n fly nexafs scanning from {np.min(energies)} eV to {np.max(energies)} eV on the {grating} l/mm grating\n"
-        retstr += f"    at speeds from {np.min(speeds)} to {np.max(speeds)} ev/second\n"
+        retstr += f"\n fly nexafs scanning from {energy_range[0]} eV to {energy_range[1]} eV on the {grating} l/mm grating\n"
+        retstr += f"    at speeds from {speed_range[0]} to {speed_range[1]} ev/second\n"
         if cycles:
             retstr += f"    cycling energy {cycles} times\n"
 
@@ -134,6 +173,31 @@ def epu_angle_from_grazing(real_incident_angle, grazing_angle=20):
     )
 
 
+def epu_angle_table(polarizations, angles):
+    """Lab-frame (EPU) polarizations for every combination of sample-frame polarization and grazing angle.
+
+    Parameters
+    ----------
+    polarizations : list
+        sample-frame polarizations in degrees, None entries are left as they are
+    angles : list
+        grazing angles in degrees, None entries are left as they are
+
+    Returns
+    -------
+    tuple (lab_polarizations, converted, possible)
+        (angles x polarizations) arrays of the lab-frame polarizations, whether each combination needs converting
+        (neither value is None), and whether the conversion is possible (the polarization is not less than the angle)
+    """
+    pols = np.array([np.nan if pol is None else pol for pol in polarizations], dtype=float)
+    grazing = np.array([np.nan if angle is None else angle for angle in angles], dtype=float)
+    converted = ~np.isnan(grazing)[:, np.newaxis] & ~np.isnan(pols)[np.newaxis, :]
+    possible = ~converted | ~(pols[np.newaxis, :] < grazing[:, np.newaxis])
+    with np.errstate(invalid="ignore"):
+        lab_polarizations = epu_angle_from_grazing(pols[np.newaxis, :], grazing[:, np.newaxis])
+    return lab_polarizations, converted, possible
+
+
 def dryrun_nexafs_plan(
     edge,
     speed="normal",
@@ -197,6 +261,10 @@ def dryrun_nexafs_plan(
     elif diode_range == "low":
         outputs.append({"description": "set Diode range to low\n", "action": "diode_low"})
 
+    if pol_mode == "sample":
+        # every lab-frame polarization at once, the same for every temperature
+        lab_polarizations, converted, possible = epu_angle_table(polarizations, angles)
+
     if isinstance(temperatures, list):
         for temp in temperatures:
             if temp_wait and temp is not None:
@@ -215,11 +283,11 @@ def dryrun_nexafs_plan(
                         "kwargs": {"temp": temp, "wait": temp_wait},
                     }
                 )
-            for grazing_angle in angles:
-                for pol in polarizations:
+            for index_angle, grazing_angle in enumerate(angles):
+                for index_pol, pol in enumerate(polarizations):
                     if pol_mode == "sample":
-                        if pol is not None and grazing_angle is not None:
-                            if pol < grazing_angle:
+                        if converted[index_angle, index_pol]:
+                            if not possible[index_angle, index_pol]:
                                 outputs.append(
                                     {
                                         "description": "\nwarning - sample frame polarization less than grazing angle is not possible\n\n Skipping this scan",
@@ -228,7 +296,7 @@ def dryrun_nexafs_plan(
                                 )
                                 continue
                             orig_pol = pol
-                            pol = epu_angle_from_grazing(pol, grazing_angle)
+                            pol = lab_polarizations[index_angle, index_pol]
                             outputs.append(
                                 {
                                     "description": f"\ncalculating a lab-frame polarization of {pol} from the sample_frame polarization \n  input of {orig_pol} and a sample angle {grazing_angle}\n",
@@ -266,8 +334,9 @@ def dryrun_nexafs_step_plan(
     md=None,
     **kwargs,
 ):
-    energies = get_energies(edge, frames, ratios, quiet=True)
+    energies = intern_array(get_energies(edge, frames, ratios, quiet=True))
     times, time = construct_exposure_times_nexafs(energies, exposure_time, quiet=True)
+    times = intern_array(times)  # identical grids are shared between queue items
     outputs = []
 
     # actually set things up
@@ -289,19 +358,8 @@ def dryrun_nexafs_step_plan(
     # construct the locations list
     locations = []
     if isinstance(angles, (list, redis_json_dict.redis_json_dict.ObservableSequence)):
-        for angle in angles:
-            md["angle"] = angle
-            md["bar_loc"]["x0"] = md["bar_loc"].get(
-                "x0", 0
-            )  # need to initialize these locations for the dry run...
-            md["bar_loc"]["y0"] = md["bar_loc"].get("y0", 0)
-            md["bar_loc"]["xoff"] = md["bar_loc"].get("xoff", 0)
-            md["bar_loc"]["zoff"] = md["bar_loc"].get("zoff", 0)
-
-            rotate_sample(
-                md
-            )  # doesn't rotate the actual sample yet, just does the math to update the location of the sample
-            locations += [deepcopy(md["location"])]  # read that rotated location as a location for the acquisition
+        # doesn't rotate the actual sample (or change md), just does the math to find the rotated locations
+        locations = rotated_locations(md, angles)
     outputs.append(
         nexafs_step_scan_enqueue(
             grating=grating,
@@ -362,77 +420,44 @@ def nexafs_step_scan_enqueue(
     detnames = dets
     if isinstance(energies,(float,int)):
         energies = [energies]
-    if np.min(energies) < 70 or max(energies) > 2200:
+    energy_min, energy_max = np.min(energies), np.max(energies)
+    time_max = np.max(times)
+    polarization_min, polarization_max = np.min(polarizations), np.max(polarizations)
+    if energy_min < 70 or energy_max > 2200:
         valid = False
         validation += "energy input is out of range for SST 1\n"
     if grating in ["1200", 1200]:
-        if np.min(energies) < 150:
+        if energy_min < 150:
             valid = False
             validation += "energy is to low for the 1200 l/mm grating\n"
     elif grating in ["250", 250]:
-        if np.max(energies) > 1300:
+        if energy_max > 1300:
             valid = False
             validation += "energy is too high for 250 l/mm grating\n"
     elif grating == "rsoxs":
-        if np.max(energies) > 1300:
+        if energy_max > 1300:
             valid = False
             validation += "energy is too high for 250 l/mm grating\n"
     else:
         valid = False
         validation += "invalid grating was chosen"
-    if np.max(times) > 10:
+    if time_max > 10:
         valid = False
         validation += "exposure times greater than 10 seconds are not valid\n"
-    if np.min(polarizations) < -1 or np.max(polarizations) > 180:
+    if polarization_min < -1 or polarization_max > 180:
         valid = False
         validation += f"a provided polarization is not valid\n"
     if temperatures is not None:
         if min(temperatures, default=35) < 20 or max(temperatures, default=35) > 300:
             valid = False
             validation += f"temperature out of range\n"
-    motor_positions = []
-    angles = None
-    xs = None
-    ys = None
-    zs = None
-    temzs = None
+    location_check = None
     if len(locations) > 0:
-        motor_positions = [{d["motor"]: d["position"] for d in location} for location in locations]
-        angles = {d.get("th", None) for d in motor_positions}
-        angles.discard(None)
-        xs = {d.get("x", None) for d in motor_positions}
-        xs.discard(None)
-        if min(xs, default=0) < -13 or max(xs, default=0) > 13:
-            valid = False
-            validation += f"X motor is out of vaild range\n"
-        ys = {d.get("y", None) for d in motor_positions}
-        ys.discard(None)
-        if min(ys, default=0) < -190 or max(ys, default=0) > 355:
-            valid = False
-            validation += f"Y motor is out of vaild range\n"
-        zs = {d.get("z", None) for d in motor_positions}
-        zs.discard(None)
-        if min(zs, default=0) < -13 or max(zs, default=0) > 13:
+        location_check = check_locations(locations)
+        validation_locations = location_errors(location_check)
+        if validation_locations:
             valid = False
-            validation += f"Z motor is out of vaild range\n"
-        # temxs = {d.get('temx', None) for d in motor_positions}
-        # temxs.discard(None)
-        # if min(xs) < -13 or max(xs) > 13:
-        #     valid = False
-        #     validation += f"X motor is out of vaild range\n"
-        # temys = {d.get('temy', None) for d in motor_positions}
-        # temys.discard(None)
-        # if min(xs) < -13 or max(xs) > 13:
-        #     valid = False
-        #     validation += f"X motor is out of vaild range\n"
-        temzs = {d.get("temz", None) for d in motor_positions}
-        temzs.discard(None)
-        if min(temzs, default=0) < 0 or max(temzs, default=0) > 150:
-            valid = False
-            validation += f"TEMz motor is out of vaild range\n"
-        if max(temzs, default=0) > 100 and min(ys, default=50) < 20:
-            valid = False
-            validation += f"potential clash between TEY and sample bar\n"
+            validation += validation_locations
     if temps_with_locations:
         if len(temperatures) != len(locations):
             valid = False
@@ -440,32 +465,15 @@ def nexafs_step_scan_enqueue(
     retstr = ""
     if valid:
         if len(polarizations) > 1:
-            retstr += f"\n setting {len(polarizations)} polarizations from {np.min(polarizations)} to {np.max(polarizations)}"
+            retstr += f"\n setting {len(polarizations)} polarizations from {polarization_min} to {polarization_max}"
             kwargs["polarizations"] = polarizations
         elif len(polarizations):
             retstr += f"\n setting polarization to {polarizations[0]}"
             kwargs["polarizations"] = polarizations
-        if angles is not None:
+        if location_check is not None:
             kwargs["locations"] = locations
             kwargs["temps_with_locations"] = temps_with_locations
-            if len(angles) > 1:
-                retstr += (
-                    f"\n setting {len(list(angles))} angles from {np.min(list(angles))} to {np.max(list(angles))}"
-                )
-                retstr += f", x from {np.min(list(xs))} to {np.max(list(xs))}"
-                retstr += f", y from {np.min(list(ys))} to {np.max(list(ys))}"
-                if len(zs):
-                    retstr += f", z from {np.min(list(zs))} to {np.max(list(zs))}"
-                if len(temzs):
-                    retstr += f", TEMz from {np.min(list(temzs))} to {np.max(list(temzs))}"
-            else:
-                retstr += f"\n setting angle to {angles}"
-                retstr += f", x to {xs}"
-                retstr += f", y to {ys}"
-                if len(zs):
-                    retstr += f", z to {zs}"
-                if len(temzs):
-                    retstr += f", and TEMz to {temzs}"
+            retstr += describe_locations(location_check)
         if temperatures is not None:
             if len(temperatures) > 1:
                 retstr += f"\n setting {len(temperatures)} temperatures from {np.min(temperatures)} to {np.max(temperatures)}"
@@ -473,9 +481,9 @@ def nexafs_step_scan_enqueue(
             elif len(temperatures):
                 retstr += f"\n setting temperature to {temperatures}"
                 kwargs["temperatures"] = temperatures
-        retstr += f"\n NEXAFS scanning {detnames} from {np.min(energies)} eV to {np.max(energies)} eV on the {grating} l/mm grating\n"
+        retstr += f"\n NEXAFS scanning {detnames} from {energy_min} eV to {energy_max} eV on the {grating} l/mm grating\n"
         retstr += (
-            f"    in {len(times)} steps with exposure times from {np.min(times)} to {np.max(times)} seconds\n"
+            f"    in {len(times)} steps with exposure times from {np.min(times)} to {time_max} seconds\n"
         )
         kwargs["times"] = times
         kwargs["dets"] = detnames
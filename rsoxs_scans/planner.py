@@ -0,0 +1,158 @@
+"""Chooses what to run in a limited amount of beamtime
+
+Given a queue from dryrun_bar and a time budget, the acquisitions worth the most (by sample_priority and
+acquisition priority) are chosen to fit in the budget, counting the time to change configuration, and put in an
+order which only changes configuration once for each configuration used.
+"""
+
+# imports
+import math
+from .acquisition_queue import AcquisitionQueue
+from .defaults import default_config_change_time
+
+
+def _priority_number(priority):
+    # priorities are ranks, lower runs first.  anything which isn't a finite number (e.g. a blank cell read as NaN)
+    # is treated like the default of 50
+    try:
+        priority = float(priority)
+    except (TypeError, ValueError):
+        return 50.0
+    if not math.isfinite(priority):
+        return 50.0
+    return max(priority, 0.0)
+
+
+def priority_value(sample_priority, priority):
+    """
+    value of running an acquisition.  lower priority numbers run first in dryrun_bar, so they are worth more: the
+    value is 1 / (1 + sample_priority) / (1 + priority)
+    """
+    return 1 / (1 + _priority_number(sample_priority)) / (1 + _priority_number(priority))
+
+
+def _run_order(entry):
+    # order within a configuration, as dryrun_bar sorting by spriority then apriority
+    return _priority_number(entry.get("sample_priority")), _priority_number(entry.get("priority"))
+
+
+def _greedy(items, budget, change_time, allowed=None, first=None):
+    # takes items (value, time, configuration, position), sorted by value per second, while they fit, paying the
+    # change time for the first item in each configuration, and taking first (if given) before the rest.  returns
+    # (total value, chosen items)
+    opened = set()
+    used = 0
+    chosen = []
+    total = 0
+    if first is not None:
+        items = [first] + [item for item in items if item is not first]
+    for item in items:
+        value, time, configuration, position = item
+        if allowed is not None and configuration not in allowed:
+            continue
+        cost = time + (0 if configuration in opened else change_time)
+        if used + cost <= budget:
+            used += cost
+            total += value
+            opened.add(configuration)
+            chosen.append(item)
+    return total, chosen
+
+
+def plan_beamtime(queue, time_budget, config_change_time=default_config_change_time, value=priority_value):
+    """
+    chooses and orders acquisitions from a queue to get the most value out of a time budget
+
+    acquisitions are taken in order of value per second while they fit, with a configuration change counted before
+    the first acquisition in each configuration.  the plan is then repaired: configurations which cost more time
+    than they are worth are dropped (and the time given to other acquisitions), and the single most valuable
+    acquisition which fits is tried on its own first.  the chosen acquisitions are run one configuration at a time,
+    the configurations with the most value per second first, and within a configuration by sample_priority then
+    priority
+
+    Parameters
+    ----------
+    queue : list of dict
+        queue as from dryrun_bar, with acq_time, configuration, sample_priority, priority, and steps for each entry
+    time_budget : float
+        seconds of beamtime available, e.g. 8 * 3600
+    config_change_time : float, optional
+        seconds to change between configurations, by default default_config_change_time (as in dryrun_bar)
+    value : callable, optional
+        value(sample_priority, priority) of running an acquisition, by default priority_value
+
+    Returns
+    -------
+    tuple
+        (AcquisitionQueue of the chosen acquisitions in run order, with acq_index and the times before and after
+        each one worked out again, AcquisitionQueue of the acquisitions which didn't fit, in their original order).
+        the entries of the chosen queue are copies, the queue passed in isn't changed
+    """
+    items = [
+        (
+            value(entry.get("sample_priority"), entry.get("priority")),
+            entry["acq_time"],
+            entry.get("configuration"),
+            position,
+        )
+        for position, entry in enumerate(queue)
+    ]
+    items.sort(key=lambda item: (-item[0] / max(item[1], 1), item[3]))
+
+    best_value, chosen = _greedy(items, time_budget, config_change_time)
+    allowed = {item[2] for item in items}
+    ## repair: drop any configuration whose change time would be better spent on the others
+    improved = True
+    while improved:
+        improved = False
+        for configuration in {item[2] for item in chosen}:
+            total, candidate = _greedy(items, time_budget, config_change_time, allowed - {configuration})
+            if total > best_value:
+                best_value, chosen = total, candidate
+                allowed = allowed - {configuration}
+                improved = True
+                break
+    ## repair: a single valuable but long acquisition can be worth more than everything taken before it
+    fits = [item for item in items if item[1] + config_change_time <= time_budget]
+    if fits:
+        most_valuable = max(fits, key=lambda item: (item[0], -item[3]))
+        total, candidate = _greedy(items, time_budget, config_change_time, first=most_valuable)
+        if total > best_value:
+            best_value, chosen = total, candidate
+
+    ## run order: one block per configuration, the most valuable per second first
+    blocks = {}
+    for item in chosen:
+        blocks.setdefault(item[2], []).append(item)
+    block_order = sorted(
+        blocks.values(),
+        key=lambda block: -sum(item[0] for item in block) / (config_change_time + sum(item[1] for item in block)),
+    )
+    order = []
+    for block in block_order:
+        entries = [queue[item[3]] for item in sorted(block, key=lambda item: item[3])]
+        order.extend(sorted(entries, key=_run_order))
+
+    planned = AcquisitionQueue()
+    total_time = 0
+    previous_config = ""
+    for i, entry in enumerate(order):
+        entry = dict(entry)
+        entry["steps"] = [dict(step, acq_index=i) for step in entry.get("steps", [])]
+        if entry.get("configuration") != previous_config:
+            total_time += config_change_time
+        entry["acq_index"] = i
+        entry["total_acq"] = len(order)
+        entry["time_before"] = total_time
+        total_time += entry["acq_time"]
+        previous_config = entry.get("configuration")
+        planned.append(entry)
+    for entry in planned:
+        entry["total_queue_time"] = total_time
+        entry["time_after"] = total_time - entry["time_before"] - entry["acq_time"]
+
+    chosen_positions = {item[3] for item in chosen}
+    spill_over = AcquisitionQueue(
+        entry for position, entry in enumerate(queue) if position not in chosen_positions
+    )
+    return planned, spill_over
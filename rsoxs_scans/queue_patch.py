@@ -0,0 +1,222 @@
+"""Differences between two versions of a queue as a short list of operations, so a queue kept elsewhere (e.g. by
+the queue server) can be brought up to date without sending the whole queue again
+
+Queue entries are matched by uid.  The patch is a list of JSON-friendly operations, applied in order:
+
+{"op": "delete", "uid": uid}
+{"op": "insert", "uid": uid, "after": uid or None, "entry": the new entry}
+{"op": "move", "uid": uid, "after": uid or None}
+{"op": "update", "uid": uid, "patch": changes to the entry (see below)}
+
+"after" is the uid of the entry which comes just before in the new queue (None for the start).  Only the entries
+which are not in the same order as before are moved (the rest form the longest run already in order).  The changes
+to an entry are {"set": {key: new value}, "unset": [keys removed], "patch": {key: changes to the value}}, where the
+nested changes are used for dicts and lists, so a step whose acq_index or time changed only sends that value.  The
+changes to a list are {"splice": [[old start, old stop, new items], ...], "items": [[index, changes or {"value":
+new item}], ...]}: the parts where items were added or removed, then the items which changed in place.
+"""
+
+# imports
+from bisect import bisect_left
+from difflib import SequenceMatcher
+from .acquisition_queue import AcquisitionQueue
+from .serialization import content_key, dumps_json
+
+
+def _same(old, new):
+    return old is new or content_key(old) == content_key(new)
+
+
+def _value_patch(old, new):
+    # changes from old to new: a dict or list patch if both are dicts or both are lists, else None, in which case
+    # the new value is sent in full
+    if isinstance(old, dict) and isinstance(new, dict):
+        patch = {}
+        changed = {}
+        for key, value in new.items():
+            if key not in old:
+                changed[key] = value
+            elif not _same(old[key], value):
+                nested = _value_patch(old[key], value)
+                if nested is None:
+                    changed[key] = value
+                else:
+                    patch.setdefault("patch", {})[key] = nested
+        if changed:
+            patch["set"] = changed
+        removed = [key for key in old if key not in new]
+        if removed:
+            patch["unset"] = removed
+        return patch
+    if isinstance(old, list) and isinstance(new, list):
+        ## runs of items which are the same are skipped, runs replaced by as many items are patched item by item,
+        ## and anything else (items added or removed, e.g. an acquisition of the sample in md) is sent as a splice
+        patch = {"splice": [], "items": []}
+        matcher = SequenceMatcher(
+            None, [content_key(item) for item in old], [content_key(item) for item in new], False
+        )
+        for tag, old_start, old_stop, new_start, new_stop in matcher.get_opcodes():
+            if tag == "replace" and old_stop - old_start == new_stop - new_start:
+                for index in range(new_start, new_stop):
+                    nested = _value_patch(old[old_start + index - new_start], new[index])
+                    patch["items"].append([index, {"value": new[index]} if nested is None else nested])
+            elif tag != "equal":
+                patch["splice"].append([old_start, old_stop, new[new_start:new_stop]])
+        return {key: value for key, value in patch.items() if value}
+    return None
+
+
+def _apply_value_patch(value, patch):
+    # new value with the changes, containers along the way are copied so the original value isn't changed
+    if isinstance(value, list):
+        value = list(value)
+        ## splices are in positions of the old list, so the last is made first
+        for start, stop, items in reversed(patch.get("splice", ())):
+            value[start:stop] = items
+        for index, item_patch in patch.get("items", ()):
+            if "value" in item_patch:
+                value[index] = item_patch["value"]
+            else:
+                value[index] = _apply_value_patch(value[index], item_patch)
+        return value
+    value = dict(value)
+    for key, nested in patch.get("patch", {}).items():
+        value[key] = _apply_value_patch(value[key], nested)
+    value.update(patch.get("set", {}))
+    for key in patch.get("unset", ()):
+        value.pop(key, None)
+    return value
+
+
+def _in_order(positions):
+    # indexes (into positions) of the longest increasing run of positions
+    tails, tail_indexes, previous = [], [], [None] * len(positions)
+    for index, position in enumerate(positions):
+        length = bisect_left(tails, position)
+        if length == len(tails):
+            tails.append(position)
+            tail_indexes.append(index)
+        else:
+            tails[length] = position
+            tail_indexes[length] = index
+        previous[index] = tail_indexes[length - 1] if length else None
+    run = set()
+    index = tail_indexes[-1] if tail_indexes else None
+    while index is not None:
+        run.add(index)
+        index = previous[index]
+    return run
+
+
+def diff_queues(old_queue, new_queue):
+    """
+    operations which turn old_queue into new_queue, matching entries by uid
+
+    Parameters
+    ----------
+    old_queue : list of dict
+        queue as held by the receiver, e.g. from an earlier dryrun_bar
+    new_queue : list of dict
+        the queue it should become
+
+    Returns
+    -------
+    list of dict
+        deletes, then inserts and moves in queue order, then updates (see the module docstring), an empty list if
+        the queues are the same
+    """
+    old_entries = {str(entry["uid"]): entry for entry in old_queue or []}
+    new_uids = [str(entry["uid"]) for entry in new_queue]
+    if len(set(new_uids)) != len(new_uids):
+        raise ValueError("uids in the new queue are not unique, it can't be patched by uid")
+    new_positions = {uid: position for position, uid in enumerate(new_uids)}
+
+    ops = [{"op": "delete", "uid": uid} for uid in old_entries if uid not in new_positions]
+    kept = [uid for uid in old_entries if uid in new_positions]
+    in_order = {kept[index] for index in _in_order([new_positions[uid] for uid in kept])}
+    updates = []
+    for position, (uid, entry) in enumerate(zip(new_uids, new_queue)):
+        after = new_uids[position - 1] if position else None
+        old_entry = old_entries.get(uid)
+        if old_entry is None:
+            ops.append({"op": "insert", "uid": uid, "after": after, "entry": entry})
+            continue
+        if uid not in in_order:
+            ops.append({"op": "move", "uid": uid, "after": after})
+        if not _same(old_entry, entry):
+            updates.append({"op": "update", "uid": uid, "patch": _value_patch(old_entry, entry)})
+    return ops + updates
+
+
+def apply_queue_patch(queue, ops):
+    """
+    applies the operations from diff_queues to a queue
+
+    Parameters
+    ----------
+    queue : list of dict
+        the queue the operations were made from (or a copy of it, e.g. loaded from JSON)
+    ops : list of dict
+        operations from diff_queues
+
+    Returns
+    -------
+    AcquisitionQueue
+        the patched queue.  the queue passed in and its entries are not changed, entries which are not updated are
+        shared with it
+    """
+    uids = [str(entry["uid"]) for entry in queue]
+    entries = {uid: entry for uid, entry in zip(uids, queue)}
+    for op in ops:
+        uid = str(op["uid"])
+        if op["op"] not in ("delete", "insert", "move", "update"):
+            raise ValueError(f"unknown queue patch operation {op['op']}")
+        if op["op"] == "insert":
+            entries[uid] = op["entry"]
+        elif uid not in entries:
+            raise KeyError(f"no acquisition with uid {uid} in the queue to {op['op']}")
+        if op["op"] == "delete":
+            uids.remove(uid)
+            del entries[uid]
+        elif op["op"] == "update":
+            entries[uid] = _apply_value_patch(entries[uid], op["patch"])
+        else:
+            if op["op"] == "move":
+                uids.remove(uid)
+            after = op["after"]
+            uids.insert(0 if after is None else uids.index(str(after)) + 1, uid)
+    return AcquisitionQueue(entries[uid] for uid in uids)
+
+
+def patch_report(new_queue, ops, print_report=True):
+    """
+    compares the size of a patch (as JSON) with sending the whole new queue
+
+    Parameters
+    ----------
+    new_queue : list of dict
+        the queue the patch produces
+    ops : list of dict
+        operations from diff_queues
+    print_report : bool, optional
+        whether to print the report, by default True
+
+    Returns
+    -------
+    dict
+        the number of each kind of operation, the bytes of the full queue and of the patch, and the bytes saved
+    """
+    report = {kind: 0 for kind in ("delete", "insert", "move", "update")}
+    for op in ops:
+        report[op["op"]] += 1
+    report["full_bytes"] = len(dumps_json(new_queue))
+    report["patch_bytes"] = len(dumps_json(ops))
+    report["saved_bytes"] = report["full_bytes"] - report["patch_bytes"]
+    if print_report:
+        print(
+            f"{report['insert']} inserted, {report['delete']} deleted, {report['move']} moved, "
+            f"{report['update']} updated\n"
+            f"patch: {report['patch_bytes']} bytes, full queue: {report['full_bytes']} bytes, "
+            f"{report['saved_bytes']} bytes saved"
+        )
+    return report
@@ -0,0 +1,280 @@
+"""Keeps expanded queues in a key-value store, one key per acquisition, so they can be shared and updated in place
+
+Each queue is stored under a name as
+    {prefix}:{name}:order          the uids of the acquisitions, in queue order
+    {prefix}:{name}:acq:{uid}      each queue entry, as JSON
+    {prefix}:{name}:status:{uid}   the acquire_status of an acquisition, if it has one
+so a change to one acquisition, or to its status, only writes that key.  The backend can be Redis (as used at the
+beamline), SQLite, or a dict in this process for testing.  Entries are saved as JSON, so arrays come back as lists.
+"""
+
+# imports
+import sqlite3
+import threading
+from .acquisition_queue import AcquisitionQueue
+from .queue_patch import apply_queue_patch
+from .serialization import dumps_json, loads_json
+
+
+class MemoryBackend:
+    """keys and values in a dict in this process, for tests and for running without a server"""
+
+    def __init__(self):
+        self.data = {}
+        self._lock = threading.Lock()
+
+    def mget(self, keys):
+        with self._lock:
+            return [self.data.get(key) for key in keys]
+
+    def mset(self, mapping):
+        with self._lock:
+            self.data.update(mapping)
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self.data.pop(key, None)
+
+    def keys(self, prefix):
+        with self._lock:
+            return [key for key in self.data if key.startswith(prefix)]
+
+
+class SQLiteBackend:
+    """
+    keys and values in an SQLite table, in a file or (by default) in memory.  bulk writes are one transaction
+    """
+
+    def __init__(self, path=":memory:"):
+        self.connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS queue_store (key TEXT PRIMARY KEY, value BLOB)")
+
+    def mget(self, keys):
+        keys = list(keys)
+        found = {}
+        with self._lock:
+            ## SQLite limits the number of parameters in a query
+            for start in range(0, len(keys), 500):
+                chunk = keys[start : start + 500]
+                rows = self.connection.execute(
+                    f"SELECT key, value FROM queue_store WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                )
+                found.update(rows)
+        return [found.get(key) for key in keys]
+
+    def mset(self, mapping):
+        with self._lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO queue_store VALUES (?, ?)", mapping.items())
+
+    def delete(self, keys):
+        with self._lock, self.connection:
+            self.connection.executemany("DELETE FROM queue_store WHERE key = ?", ((key,) for key in keys))
+
+    def keys(self, prefix):
+        pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        with self._lock:
+            rows = self.connection.execute("SELECT key FROM queue_store WHERE key LIKE ? ESCAPE '\\'", (pattern,))
+            return [key for (key,) in rows]
+
+
+class RedisBackend:
+    """
+    keys and values in Redis (or anything with the same API).  bulk writes and deletes are sent in batches through
+    one pipeline, so they take one round trip to the server
+
+    Parameters
+    ----------
+    client : redis.Redis, optional
+        the client to use, by default one is made from redis_kwargs (e.g. host and port)
+    batch_size : int, optional
+        number of keys per command in the pipeline, by default 500
+    """
+
+    def __init__(self, client=None, batch_size=500, **redis_kwargs):
+        if client is None:
+            import redis
+
+            client = redis.Redis(**redis_kwargs)
+        self.client = client
+        self.batch_size = batch_size
+
+    def _batches(self, items):
+        items = list(items)
+        return [items[start : start + self.batch_size] for start in range(0, len(items), self.batch_size)]
+
+    def mget(self, keys):
+        pipeline = self.client.pipeline(transaction=False)
+        for batch in self._batches(keys):
+            pipeline.mget(batch)
+        return [value for values in pipeline.execute() for value in values]
+
+    def mset(self, mapping):
+        pipeline = self.client.pipeline(transaction=False)
+        for batch in self._batches(mapping.items()):
+            pipeline.mset(dict(batch))
+        pipeline.execute()
+
+    def delete(self, keys):
+        pipeline = self.client.pipeline(transaction=False)
+        for batch in self._batches(keys):
+            pipeline.delete(*batch)
+        pipeline.execute()
+
+    def keys(self, prefix):
+        keys = self.client.scan_iter(match=f"{prefix}*")
+        return [key.decode() if isinstance(key, bytes) else key for key in keys]
+
+
+class QueueStore:
+    """
+    saves, loads, and updates named queues (as from dryrun_bar) in a key-value backend
+
+    Parameters
+    ----------
+    backend : MemoryBackend, SQLiteBackend, or RedisBackend, optional
+        where the keys are kept, by default a new MemoryBackend
+    prefix : str, optional
+        start of every key, by default "rsoxs_queue"
+    """
+
+    def __init__(self, backend=None, prefix="rsoxs_queue"):
+        self.backend = MemoryBackend() if backend is None else backend
+        self.prefix = prefix
+
+    def _key(self, name, *parts):
+        if ":" in name:
+            raise ValueError(f"queue name {name} can't contain ':'")
+        return ":".join((self.prefix, name) + parts)
+
+    def _order(self, name):
+        (order,) = self.backend.mget([self._key(name, "order")])
+        if order is None:
+            raise KeyError(f"no queue named {name} in the store")
+        return loads_json(order)
+
+    def _entry_values(self, name, entries):
+        # keys and values to write for each entry and its status
+        values = {}
+        for entry in entries:
+            uid = str(entry["uid"])
+            values[self._key(name, "acq", uid)] = dumps_json(entry)
+            if "acquire_status" in entry:
+                values[self._key(name, "status", uid)] = dumps_json(entry["acquire_status"])
+        return values
+
+    def save_queue(self, name, queue):
+        """
+        saves a queue under name, replacing any queue already saved there, in one bulk write (plus a delete of the
+        acquisitions no longer in it).  acquisitions which are still in the queue keep their acquire_status, unless
+        the new entry has one
+        """
+        uids = [str(entry["uid"]) for entry in queue]
+        if len(set(uids)) != len(uids):
+            raise ValueError("uids in the queue are not unique, it can't be stored by uid")
+        values = self._entry_values(name, queue)
+        values[self._key(name, "order")] = dumps_json(uids)
+        kept = values.keys() | {self._key(name, "status", uid) for uid in uids}
+        stale = [key for key in self.backend.keys(self._key(name, "")) if key not in kept]
+        if stale:
+            self.backend.delete(stale)
+        self.backend.mset(values)
+
+    def load_queue(self, name, uids=None):
+        """
+        the queue saved under name (or just the acquisitions with these uids, in queue order), with the latest
+        acquire_status of each acquisition which has one
+
+        Returns
+        -------
+        AcquisitionQueue
+        """
+        order = self._order(name)
+        if uids is not None:
+            wanted = {str(uid) for uid in uids}
+            order = [uid for uid in order if uid in wanted]
+        values = self.backend.mget(
+            [self._key(name, "acq", uid) for uid in order] + [self._key(name, "status", uid) for uid in order]
+        )
+        queue = AcquisitionQueue()
+        for entry, status in zip(values[: len(order)], values[len(order) :]):
+            entry = loads_json(entry)
+            if status is not None:
+                entry["acquire_status"] = loads_json(status)
+            queue.append(entry)
+        return queue
+
+    def update_entries(self, name, entries):
+        """saves changed queue entries (matched by uid) without touching the rest of the queue"""
+        order = set(self._order(name))
+        missing = [str(entry["uid"]) for entry in entries if str(entry["uid"]) not in order]
+        if missing:
+            raise KeyError(f"acquisitions {missing} are not in queue {name}")
+        self.backend.mset(self._entry_values(name, entries))
+
+    def set_status(self, name, statuses):
+        """
+        sets the acquire_status of acquisitions, without writing their queue entries
+
+        Parameters
+        ----------
+        name : str
+            name of the queue
+        statuses : dict
+            {uid: acquire_status}, e.g. {uid: "Started"}
+        """
+        self.backend.mset(
+            {self._key(name, "status", str(uid)): dumps_json(status) for uid, status in statuses.items()}
+        )
+
+    def statuses(self, name):
+        """{uid: acquire_status} of every acquisition in the queue which has one"""
+        order = self._order(name)
+        values = self.backend.mget([self._key(name, "status", uid) for uid in order])
+        return {uid: loads_json(status) for uid, status in zip(order, values) if status is not None}
+
+    def apply_patch(self, name, ops):
+        """
+        updates the queue saved under name with the operations from queue_patch.diff_queues, reading and writing
+        only the acquisitions they change, and the order.  the acquire_status of an updated acquisition isn't
+        written, so a status set while the patch is applied is kept
+        """
+        order = self._order(name)
+        updated = [uid for uid in order if uid in {str(op["uid"]) for op in ops if op["op"] == "update"}]
+        ## the entries alone, without their status
+        values = self.backend.mget([self._key(name, "acq", uid) for uid in updated])
+        stored = {uid: loads_json(value) for uid, value in zip(updated, values)}
+        placeholders = [stored.get(uid, {"uid": uid}) for uid in order]
+        patched = apply_queue_patch(placeholders, ops)
+        inserted = {str(op["uid"]) for op in ops if op["op"] == "insert"}
+        deleted = [str(op["uid"]) for op in ops if op["op"] == "delete"]
+        if deleted:
+            self.backend.delete(
+                [self._key(name, "acq", uid) for uid in deleted]
+                + [self._key(name, "status", uid) for uid in deleted]
+            )
+        written = []
+        for entry in patched:
+            uid = str(entry["uid"])
+            if uid in stored:
+                written.append({key: value for key, value in entry.items() if key != "acquire_status"})
+            elif uid in inserted:
+                written.append(entry)
+        values = self._entry_values(name, written)
+        values[self._key(name, "order")] = dumps_json([str(entry["uid"]) for entry in patched])
+        self.backend.mset(values)
+
+    def delete_queue(self, name):
+        """removes the queue saved under name"""
+        keys = self.backend.keys(self._key(name, ""))
+        if keys:
+            self.backend.delete(keys)
+
+    def queue_names(self):
+        """names of the queues in the store"""
+        suffix = ":order"
+        start = len(self.prefix) + 1
+        keys = self.backend.keys(f"{self.prefix}:")
+        return sorted(key[start : -len(suffix)] for key in keys if key.endswith(suffix))
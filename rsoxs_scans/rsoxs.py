@@ -4,15 +4,17 @@
 
 # imports
 import numpy as np
-from copy import deepcopy
 from .constructor import get_energies, construct_exposure_times
 import redis_json_dict
+from .serialization import intern_array
+from .motor_limits import check_locations, location_errors, describe_locations
 
 # code for finding a rotated position of a sample - needed to test locations
 def rotate_sample(samp, force=False):
     """
     rotate a sample position to the requested theta position
     the requested sample position is set in the angle metadata (sample['angle'])
+    updates samp in place, see rotated_locations for a version which leaves the sample alone
     """
     sanitize_angle(samp, force)  # makes sure the requested angle is translated into a real angle for acquisition
     theta_new = samp["bar_loc"]["th"]
@@ -22,25 +24,33 @@ def rotate_sample(samp, force=False):
     zoff = samp["bar_loc"]["zoff"]
 
     newx = rotatedx(x0, theta_new, zoff, xoff=xoff)
+    samp["location"] = _set_location(samp["location"], newx, y0, theta_new, copy=False)
+
+
+def _set_location(location, x, y, th, copy=True):
+    # sets the x, y, and th motors of a location (list of {"motor", "position"}), adding any which are missing
+    if copy:
+        location = [dict(motor) for motor in location]
     xwritten = False
     ywritten = False
     thwritten = False
-    for motor in samp["location"]:
+    for motor in location:
         if motor["motor"] == "x":
-            motor["position"] = newx
+            motor["position"] = x
             xwritten = True
         if motor["motor"] == "th":
-            motor["position"] = theta_new
+            motor["position"] = th
             thwritten = True
         if motor["motor"] == "y":
-            motor["position"] = y0
+            motor["position"] = y
             ywritten = True
     if not xwritten:
-        samp["location"].append({"motor": "x", "position": newx})
+        location.append({"motor": "x", "position": x})
     if not ywritten:
-        samp["location"].append({"motor": "y", "position": y0})
+        location.append({"motor": "y", "position": y})
     if not thwritten:
-        samp["location"].append({"motor": "th", "position": theta_new})
+        location.append({"motor": "th", "position": th})
+    return location
 
 
 def rotatedx(x0, theta, zoff, xoff=1.88, thoff=1.6):
@@ -49,77 +59,147 @@ def rotatedx(x0, theta, zoff, xoff=1.88, thoff=1.6):
     and a rotation angle, the offset of rotation in z and x (as well as a potential theta offset)
     find the correct x position to move to at a different rotation angle
     """
-    return float(
-        xoff + (x0 - xoff) * np.cos((theta - thoff) * np.pi / 180) - zoff * np.sin((theta - thoff) * np.pi / 180)
-    )
+    return float(rotatedx_array(x0, theta, zoff, xoff=xoff, thoff=thoff))
 
 
-def sanitize_angle(samp, force=False):
-    # translates a requested angle (something in sample['angle']) into an actual angle depending on the kind of sample
-    if type(samp["angle"]) == int or type(samp["angle"]) == float:
-        goodnumber = True  # make the number fall in the necessary range
-    else:
-        goodnumber = False  # make all transmission 90 degrees from the back, and all grading 20 deg
-    if force and -155 < samp["angle"] < 195:
-        samp["bar_loc"]["th"] = samp["angle"]
-        return
-    if samp["grazing"]:
+def rotatedx_array(x0, theta, zoff, xoff=1.88, thoff=1.6):
+    """
+    rotatedx for an array of angles, returning an array of x positions
+    """
+    theta = np.asarray(theta, dtype=float)
+    return xoff + (x0 - xoff) * np.cos((theta - thoff) * np.pi / 180) - zoff * np.sin((theta - thoff) * np.pi / 180)
+
+
+def sanitize_angles(angles, front=True, grazing=False, x0=0, force=False):
+    """
+    translates requested angles (as in sample['angle']) into actual theta positions depending on the kind of sample
+
+    Parameters
+    ----------
+    angles : list
+        requested angles, anything which is not an int or float is replaced by the default angle for the sample
+    front : bool, optional
+        whether the sample is on the front of the bar, by default True
+    grazing : bool, optional
+        whether the sample is measured in grazing incidence, by default False
+    x0 : float, optional
+        x position of the sample at 0 rotation, by default 0
+    force : bool, optional
+        use any angle between -155 and 195 as the theta position directly, by default False
+
+    Returns
+    -------
+    tuple (th, angles)
+        array of theta positions, and the list of requested angles with any defaults filled in
+    """
+    angles = list(angles)
+    goodnumber = np.array([type(angle) == int or type(angle) == float for angle in angles], dtype=bool)
+    angle = np.array([angle if good else 0 for angle, good in zip(angles, goodnumber)], dtype=float)
+    if grazing:
         # the sample is intended for grazing incidence, so angles should be interpreted to mean
         # 0 - parallel with the face of the sample
         # 90 - normal to the sample
         # 110 - 20 degrees from normal in one direction
         # 70 - 20 degrees from normal in the other direction
         # valid input angles are 0 - 180
-        if samp["front"]:
+        if front:
             # sample is on the front of the bar, so valid outputs are between -90 and 90
-            if goodnumber:
-                samp["bar_loc"]["th"] = float(90 - np.mod(samp["angle"] + 3600, 180))
-            else:
-                samp["bar_loc"]["th"] = 70  # default grazing incidence samples to 20 degrees incidence angle
-                samp["angle"] = 70
-                # front grazing sample angle is interpreted as grazing angle
+            th = 90 - np.mod(angle + 3600, 180)
+            default = 70  # default grazing incidence samples to 20 degrees incidence angle
+            # front grazing sample angle is interpreted as grazing angle
         else:
-            if goodnumber:
-                angle = float(np.mod(435 - np.mod(-samp["angle"] + 3600, 180), 360) - 165)
-                if angle < -155:
-                    angle = float(np.mod(435 - np.mod(samp["angle"] + 3600, 180), 360) - 165)
-                samp["bar_loc"]["th"] = angle
-            else:
-                samp["bar_loc"]["th"] = 110
-                samp["angle"] = 110
+            th = np.mod(435 - np.mod(-angle + 3600, 180), 360) - 165
+            th = np.where(th < -155, np.mod(435 - np.mod(angle + 3600, 180), 360) - 165, th)
+            default = 110
             # back grazing sample angle is interpreted as grazing angle but subtracted from 180
     else:
-        if samp["front"]:
-            if goodnumber:
-                samp["bar_loc"]["th"] = float(np.mod(345 - np.mod(90 + samp["angle"] + 3600, 180) + 90, 360) - 165)
-                if samp["bar_loc"]["x0"] < -1.8 and np.abs(samp["angle"]) > 30:
-                    # transmission from the left side of the bar at a incident angle more than 20 degrees,
-                    # flip sample around to come from the other side - this can take a minute or two
-                    samp["bar_loc"]["th"] = float(
-                        np.mod(345 - np.mod(90 - samp["angle"] + 3600, 180) + 90, 360) - 165
-                    )
-                if samp["bar_loc"]["th"] >= 195:
-                    samp["bar_loc"]["th"] = 180
-                if samp["bar_loc"]["th"] <= -155:
-                    samp["bar_loc"]["th"] = -150
-            else:
-                samp["bar_loc"]["th"] = 180
-                samp["angle"] = 180
+        flip = np.abs(angle) > 30
+        if front:
+            th = np.mod(345 - np.mod(90 + angle + 3600, 180) + 90, 360) - 165
+            # transmission from the left side of the bar at a incident angle more than 20 degrees,
+            # flip sample around to come from the other side - this can take a minute or two
+            if x0 < -1.8:
+                th = np.where(flip, np.mod(345 - np.mod(90 - angle + 3600, 180) + 90, 360) - 165, th)
+            th = np.where(th >= 195, 180, th)
+            th = np.where(th <= -155, -150, th)
+            default = 180
         else:
-            if goodnumber:
-                samp["bar_loc"]["th"] = float(np.mod(90 + samp["angle"] + 3600, 180) - 90)
-                if samp["bar_loc"]["x0"] > -1.8 and np.abs(samp["angle"]) > 30:
-                    # transmission from the right side of the bar at a incident angle more than 20 degrees,
-                    # flip to come from the left side
-                    samp["bar_loc"]["th"] = float(np.mod(90 - samp["angle"] + 3600, 180) - 90)
-            else:
-                samp["bar_loc"]["th"] = 0
-                samp["angle"] = 0
+            th = np.mod(90 + angle + 3600, 180) - 90
+            # transmission from the right side of the bar at a incident angle more than 20 degrees,
+            # flip to come from the left side
+            if x0 > -1.8:
+                th = np.where(flip, np.mod(90 - angle + 3600, 180) - 90, th)
+            default = 0
+    th = np.where(goodnumber, th, default)
+    th = np.clip(th, -155, 195)
+    if force:
+        forced = goodnumber & (-155 < angle) & (angle < 195)
+        th = np.where(forced, angle, th)
+    return th, [angle if good else default for angle, good in zip(angles, goodnumber)]
 
-    if samp["bar_loc"]["th"] >= 195:
-        samp["bar_loc"]["th"] = 195
-    if samp["bar_loc"]["th"] <= -155:
-        samp["bar_loc"]["th"] = -155
+
+def rotated_positions(angles, bar_loc, front=True, grazing=False, force=False):
+    """
+    theta and x positions of a sample for many requested angles at once
+
+    Parameters
+    ----------
+    angles : list
+        requested angles, as in sample['angle']
+    bar_loc : dict
+        location of the sample on the bar, missing x0, y0, xoff, and zoff are taken as 0
+    front, grazing, force
+        as for sanitize_angles
+
+    Returns
+    -------
+    tuple (th, x, angles)
+        arrays of theta and x positions, and the list of requested angles with any defaults filled in
+    """
+    x0 = bar_loc.get("x0", 0)
+    th, angles = sanitize_angles(angles, front=front, grazing=grazing, x0=x0, force=force)
+    x = rotatedx_array(x0, th, bar_loc.get("zoff", 0), xoff=bar_loc.get("xoff", 0))
+    return th, x, angles
+
+
+def rotated_locations(samp, angles, force=False):
+    """
+    locations of a sample rotated to each of the requested angles, without changing the sample
+
+    Parameters
+    ----------
+    samp : dict
+        sample, with "location", "bar_loc", "front", and "grazing"
+    angles : list
+        requested angles, as in sample['angle']
+    force : bool, optional
+        as for sanitize_angles, by default False
+
+    Returns
+    -------
+    list
+        a location (list of {"motor", "position"}) for each angle
+    """
+    th, x, angles = rotated_positions(
+        angles, samp["bar_loc"], front=samp["front"], grazing=samp["grazing"], force=force
+    )
+    y0 = samp["bar_loc"].get("y0", 0)
+    return [
+        _set_location(samp["location"], float(x_angle), y0, float(th_angle)) for th_angle, x_angle in zip(th, x)
+    ]
+
+
+def sanitize_angle(samp, force=False):
+    # translates a requested angle (something in sample['angle']) into an actual angle depending on the kind of sample
+    # updates samp in place, see sanitize_angles for many angles at once
+    if force and -155 < samp["angle"] < 195:
+        samp["bar_loc"]["th"] = samp["angle"]
+        return
+    th, angles = sanitize_angles(
+        [samp["angle"]], front=samp["front"], grazing=samp["grazing"], x0=samp["bar_loc"].get("x0", 0)
+    )
+    samp["bar_loc"]["th"] = float(th[0])
+    samp["angle"] = angles[0]
 
 
 def rsoxs_scan_enqueue(
@@ -176,77 +256,44 @@ def rsoxs_scan_enqueue(
         validation += "repeats must be a positive integer between 0 and 100\n"
     if isinstance(energies,(float,int)):
         energies = [energies]
-    if np.min(energies) < 70 or max(energies) > 2200:
+    energy_min, energy_max = np.min(energies), np.max(energies)
+    time_max = np.max(times)
+    polarization_min, polarization_max = np.min(polarizations), np.max(polarizations)
+    if energy_min < 70 or energy_max > 2200:
         valid = False
         validation += "energy input is out of range for SST 1\n"
     if grating in ["1200", 1200]:
-        if np.min(energies) < 150:
+        if energy_min < 150:
             valid = False
             validation += "energy is to low for the 1200 l/mm grating\n"
     elif grating in ["250", 250]:
-        if np.max(energies) > 1300:
+        if energy_max > 1300:
             valid = False
             validation += "energy is too high for 250 l/mm grating\n"
     elif grating == "rsoxs":
-        if np.max(energies) > 1300:
+        if energy_max > 1300:
             valid = False
             validation += "energy is too high for 250 l/mm grating\n"
     else:
         valid = False
         validation += "invalid grating was chosen"
-    if np.max(times) > 10:
+    if time_max > 10:
         valid = False
         validation += "exposure times greater than 10 seconds are not valid\n"
-    if np.min(polarizations) < -1 or np.max(polarizations) > 180:
+    if polarization_min < -1 or polarization_max > 180:
         valid = False
         validation += f"a provided polarization is not valid\n"
     if temperatures is not None:
         if min(temperatures, default=35) < 20 or max(temperatures, default=35) > 300:
             valid = False
             validation += f"temperature out of range\n"
-    motor_positions = []
-    angles = None
-    xs = None
-    ys = None
-    zs = None
-    temzs = None
+    location_check = None
     if len(locations) > 0:
-        motor_positions = [{d["motor"]: d["position"] for d in location} for location in locations]
-        angles = {d.get("th", None) for d in motor_positions}
-        angles.discard(None)
-        xs = {d.get("x", None) for d in motor_positions}
-        xs.discard(None)
-        if min(xs, default=0) < -13 or max(xs, default=0) > 13:
-            valid = False
-            validation += f"X motor is out of vaild range\n"
-        ys = {d.get("y", None) for d in motor_positions}
-        ys.discard(None)
-        if min(ys, default=0) < -190 or max(ys, default=0) > 355:
+        location_check = check_locations(locations)
+        validation_locations = location_errors(location_check)
+        if validation_locations:
             valid = False
-            validation += f"Y motor is out of vaild range\n"
-        zs = {d.get("z", None) for d in motor_positions}
-        zs.discard(None)
-        if min(zs, default=0) < -13 or max(zs, default=0) > 13:
-            valid = False
-            validation += f"Z motor is out of vaild range\n"
-        # temxs = {d.get('temx', None) for d in motor_positions}
-        # temxs.discard(None)
-        # if min(xs) < -13 or max(xs) > 13:
-        #     valid = False
-        #     validation += f"X motor is out of vaild range\n"
-        # temys = {d.get('temy', None) for d in motor_positions}
-        # temys.discard(None)
-        # if min(xs) < -13 or max(xs) > 13:
-        #     valid = False
-        #     validation += f"X motor is out of vaild range\n"
-        temzs = {d.get("temz", None) for d in motor_positions}
-        temzs.discard(None)
-        if min(temzs, default=0) < 0 or max(temzs, default=0) > 150:
-            valid = False
-            validation += f"TEMz motor is out of vaild range\n"
-        if max(temzs, default=0) > 100 and min(ys, default=50) < 20:
-            valid = False
-            validation += f"potential clash between TEY and sample bar\n"
+            validation += validation_locations
     if temps_with_locations:
         if len(temperatures) != len(locations):
             valid = False
@@ -254,32 +301,15 @@ def rsoxs_scan_enqueue(
     retstr = ""
     if valid:
         if len(polarizations) > 1:
-            retstr += f"\n setting {len(polarizations)} polarizations from {np.min(polarizations)} to {np.max(polarizations)}"
+            retstr += f"\n setting {len(polarizations)} polarizations from {polarization_min} to {polarization_max}"
             kwargs["polarizations"] = polarizations
         elif len(polarizations):
             retstr += f"\n setting polarization to {polarizations[0]}"
             kwargs["polarizations"] = polarizations
-        if angles is not None:
+        if location_check is not None:
             kwargs["locations"] = locations
             kwargs["temps_with_locations"] = temps_with_locations
-            if len(angles) > 1:
-                retstr += (
-                    f"\n setting {len(list(angles))} angles from {np.min(list(angles))} to {np.max(list(angles))}"
-                )
-                retstr += f", x from {np.min(list(xs))} to {np.max(list(xs))}"
-                retstr += f", y from {np.min(list(ys))} to {np.max(list(ys))}"
-                if len(zs):
-                    retstr += f", z from {np.min(list(zs))} to {np.max(list(zs))}"
-                if len(temzs):
-                    retstr += f", TEMz from {np.min(list(temzs))} to {np.max(list(temzs))}"
-            else:
-                retstr += f"\n setting angle to {angles}"
-                retstr += f", x to {xs}"
-                retstr += f", y to {ys}"
-                if len(zs):
-                    retstr += f", z to {zs}"
-                if len(temzs):
-                    retstr += f", and TEMz to {temzs}"
+            retstr += describe_locations(location_check)
         if temperatures is not None:
             if len(temperatures) > 1:
                 retstr += f"\n setting {len(temperatures)} temperatures from {np.min(temperatures)} to {np.max(temperatures)}"
@@ -287,9 +317,9 @@ def rsoxs_scan_enqueue(
             elif len(temperatures):
                 retstr += f"\n setting temperature to {temperatures}"
                 kwargs["temperatures"] = temperatures
-        retstr += f"\n RSoXS scanning {detnames} from {np.min(energies)} eV to {np.max(energies)} eV on the {grating} l/mm grating\n"
+        retstr += f"\n RSoXS scanning {detnames} from {energy_min} eV to {energy_max} eV on the {grating} l/mm grating\n"
         retstr += (
-            f"    in {len(times)} steps with exposure times from {np.min(times)} to {np.max(times)} seconds\n"
+            f"    in {len(times)} steps with exposure times from {np.min(times)} to {time_max} seconds\n"
         )
         kwargs["times"] = times
         kwargs["dets"] = detnames
@@ -324,8 +354,9 @@ def dryrun_rsoxs_plan(
     md=None,
     **kwargs,
 ):
-    energies = get_energies(edge, frames, ratios, quiet=True)
+    energies = intern_array(get_energies(edge, frames, ratios, quiet=True))
     times, time = construct_exposure_times(energies, exposure_time, repeats, quiet=True)
+    times = intern_array(times)  # identical grids are shared between queue items
     outputs = []
 
     # actually set things up
@@ -347,19 +378,8 @@ def dryrun_rsoxs_plan(
     # construct the locations list
     locations = []
     if isinstance(angles, (list, redis_json_dict.redis_json_dict.ObservableSequence)):
-        for angle in angles:
-            md["angle"] = angle
-            md["bar_loc"]["x0"] = md["bar_loc"].get(
-                "x0", 0
-            )  # need to initialize these locations for the dry run...
-            md["bar_loc"]["y0"] = md["bar_loc"].get("y0", 0)
-            md["bar_loc"]["xoff"] = md["bar_loc"].get("xoff", 0)
-            md["bar_loc"]["zoff"] = md["bar_loc"].get("zoff", 0)
-
-            rotate_sample(
-                md
-            )  # doesn't rotate the actual sample yet, just does the math to update the location of the sample
-            locations += [deepcopy(md["location"])]  # read that rotated location as a location for the acquisition
+        # doesn't rotate the actual sample (or change md), just does the math to find the rotated locations
+        locations = rotated_locations(md, angles)
     outputs.append(
         rsoxs_scan_enqueue(
             grating=grating,
@@ -0,0 +1,394 @@
+"""Shares identical energy and exposure time arrays between queue items, and saves queues storing each array once
+
+Queues (as from dryrun_bar) can be saved as JSON, either with the standard library or with orjson (which handles
+numpy arrays and uuids itself), or in a compact binary format: a JSON manifest followed by the raw bytes of each
+distinct array, which are loaded without copying.
+"""
+
+# imports
+import copy
+import json
+import time
+import uuid
+import struct
+import hashlib
+import weakref
+import numpy as np
+import orjson
+
+
+# content hash: array, for every interned array still in use somewhere
+_interned_arrays = weakref.WeakValueDictionary()
+
+
+def array_key(array):
+    """content hash of an array (dtype, shape, and values), used to find and reference identical arrays"""
+    array = np.ascontiguousarray(array)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{array.dtype.str}{array.shape}".encode())
+    digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def content_key(obj):
+    """
+    content hash of anything JSON-like (e.g. a sample, acquisition, or queue entry) including numpy arrays, which
+    doesn't depend on the order of dict keys
+    """
+    option = orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    return hashlib.blake2b(orjson.dumps(obj, default=_orjson_default, option=option), digest_size=16).hexdigest()
+
+
+def intern_array(values):
+    """
+    returns the shared, read-only copy of an array with these values, so that identical energy or time arrays
+    from many queue items are only held in memory once
+    """
+    array = np.asarray(values)
+    key = array_key(array)
+    shared = _interned_arrays.get(key)
+    if shared is None:
+        shared = np.array(array, copy=True)
+        shared.flags.writeable = False
+        _interned_arrays[key] = shared
+    return shared
+
+
+def _split_arrays(queue):
+    # pulls the arrays out of a queue so each distinct array can be saved once
+    # returns the queue with None in place of each array in a step's kwargs, the references [acquisition index,
+    # step index, kwarg name, key], {key: array}, and a default function for the JSON encoder, which turns any
+    # other array (deeper in the queue) into {"__array__": key} and sets nested[0]
+    arrays = {}
+    keys = {}
+    refs = []
+    nested = [False]
+
+    def key_for(array):
+        if id(array) not in keys:
+            keys[id(array)] = array_key(array)
+            arrays.setdefault(keys[id(array)], array)
+        return keys[id(array)]
+
+    split_queue = queue
+    if isinstance(queue, list):
+        split_queue = []
+        for index_acq, acquisition in enumerate(queue):
+            if isinstance(acquisition, dict) and isinstance(acquisition.get("steps"), list):
+                steps = []
+                for index_step, step in enumerate(acquisition["steps"]):
+                    kwargs = step.get("kwargs") if isinstance(step, dict) else None
+                    has_arrays = isinstance(kwargs, dict) and any(
+                        isinstance(value, np.ndarray) for value in kwargs.values()
+                    )
+                    if has_arrays:
+                        kwargs = dict(kwargs)
+                        for name, value in kwargs.items():
+                            if isinstance(value, np.ndarray):
+                                refs.append([index_acq, index_step, name, key_for(value)])
+                                kwargs[name] = None
+                        step = {**step, "kwargs": kwargs}
+                    steps.append(step)
+                acquisition = {**acquisition, "steps": steps}
+            split_queue.append(acquisition)
+
+    def default(obj):
+        if isinstance(obj, np.ndarray):
+            nested[0] = True
+            return {"__array__": key_for(obj)}
+        if isinstance(obj, np.generic):
+            return obj.item()
+        return str(obj)
+
+    return split_queue, refs, arrays, default, nested
+
+
+def _join_arrays(queue, refs, arrays, nested):
+    # puts the arrays back into a queue split by _split_arrays
+    for index_acq, index_step, name, key in refs:
+        queue[index_acq]["steps"][index_step]["kwargs"][name] = arrays[key]
+    if nested:
+        queue = _restore_arrays(queue, arrays)
+    return queue
+
+
+def _restore_arrays(item, arrays):
+    # replaces every {"__array__": key} reference with the array
+    if isinstance(item, dict):
+        if len(item) == 1 and "__array__" in item:
+            return arrays[item["__array__"]]
+        return {key: _restore_arrays(value, arrays) for key, value in item.items()}
+    if isinstance(item, list):
+        return [_restore_arrays(value, arrays) for value in item]
+    return item
+
+
+def dumps_queue(queue):
+    """
+    JSON text of a queue (as from dryrun_bar) with a shared "arrays" section, so each distinct array is written
+    once and referenced by its content hash.  anything else which isn't JSON (e.g. uuids) is saved as text
+    """
+    split_queue, refs, arrays, default, nested = _split_arrays(queue)
+    queue_text = json.dumps(split_queue, default=default)  # first, so any nested arrays are found
+    arrays_text = json.dumps(
+        {
+            key: {"dtype": array.dtype.str, "shape": list(array.shape), "data": array.ravel().tolist()}
+            for key, array in arrays.items()
+        }
+    )
+    return (
+        f'{{"arrays": {arrays_text}, "refs": {json.dumps(refs)}, "nested": {json.dumps(nested[0])}, '
+        f'"queue": {queue_text}}}'
+    )
+
+
+def loads_queue(text):
+    """queue from the JSON text made by dumps_queue, with the arrays interned so all references share one array"""
+    queue_dict = json.loads(text)
+    arrays = {
+        key: intern_array(np.array(entry["data"], dtype=entry["dtype"]).reshape(entry["shape"]))
+        for key, entry in queue_dict["arrays"].items()
+    }
+    return _join_arrays(queue_dict["queue"], queue_dict["refs"], arrays, queue_dict["nested"])
+
+
+def _array_references(item, found):
+    # collects every array in a queue, including repeats of the same array
+    if isinstance(item, np.ndarray):
+        found.append(item)
+    elif isinstance(item, dict):
+        for value in item.values():
+            _array_references(value, found)
+    elif isinstance(item, (list, tuple)):
+        for value in item:
+            _array_references(value, found)
+    return found
+
+
+def queue_size_report(queue, print_report=True):
+    """
+    compares the memory and JSON size of a queue with every array stored in full against the shared arrays
+
+    Parameters
+    ----------
+    queue : list of dict
+        queue as from dryrun_bar
+    print_report : bool, optional
+        whether to print the report, by default True
+
+    Returns
+    -------
+    dict
+        number of array references, distinct array objects, and distinct array values, the array memory if every
+        reference held its own copy, the memory actually held, and the memory once interned, and the JSON size
+        with arrays written in place and with the shared array section
+    """
+
+    def encode(obj):
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        return str(obj)
+
+    references = _array_references(queue, [])
+    objects = {id(array): array for array in references}
+    contents = {array_key(array): array for array in objects.values()}
+    report = {
+        "array_references": len(references),
+        "array_objects": len(objects),
+        "distinct_arrays": len(contents),
+        "array_bytes_unshared": sum(array.nbytes for array in references),
+        "array_bytes_in_memory": sum(array.nbytes for array in objects.values()),
+        "array_bytes_interned": sum(array.nbytes for array in contents.values()),
+        "json_bytes_inline": len(json.dumps(queue, default=encode)),
+        "json_bytes_shared": len(dumps_queue(queue)),
+    }
+    if print_report:
+        print(
+            f"{report['array_references']} arrays in the queue, {report['array_objects']} in memory, "
+            f"{report['distinct_arrays']} distinct\n"
+            f"array memory: {report['array_bytes_unshared']} bytes unshared, "
+            f"{report['array_bytes_in_memory']} bytes now, {report['array_bytes_interned']} bytes interned\n"
+            f"JSON: {report['json_bytes_inline']} bytes inline, "
+            f"{report['json_bytes_shared']} bytes with shared arrays"
+        )
+    return report
+
+
+class NumpyEncoder(json.JSONEncoder):
+    """json encoder for queues with numpy arrays and numbers, and uuids, e.g. json.dumps(step, cls=NumpyEncoder)"""
+
+    def default(self, obj):
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        if isinstance(obj, np.generic):
+            return obj.item()
+        if isinstance(obj, uuid.UUID):
+            return str(obj)
+        return json.JSONEncoder.default(self, obj)
+
+
+def _orjson_default(obj):
+    # anything orjson doesn't handle itself, e.g. arrays which are not contiguous or have an unsupported dtype
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return str(obj)
+
+
+def dumps_json(obj, indent=False):
+    """
+    fast JSON bytes for a queue, queue item, or step, with numpy arrays, numpy numbers, and uuids handled by orjson
+    anything else which isn't JSON is saved as text
+    """
+    option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    return orjson.dumps(obj, default=_orjson_default, option=option)
+
+
+def loads_json(data):
+    """queue (or anything else) from JSON text or bytes, arrays come back as lists"""
+    return orjson.loads(data)
+
+
+## Binary format
+## magic (4 bytes) | format version (uint32) | manifest length (uint64) | manifest (JSON) | padding | array data
+## The manifest holds, for each array key, the dtype, shape, and offset of its bytes from the start of the array
+## data, the references to put the arrays back into the step kwargs, and the queue (see _split_arrays).
+## Every array starts on a 64 byte boundary.
+_binary_magic = b"RSXQ"
+_binary_version = 1
+_binary_header = struct.Struct("<4sIQ")
+_binary_alignment = 64
+
+
+def _aligned(offset):
+    return -(-offset // _binary_alignment) * _binary_alignment
+
+
+def dumps_queue_binary(queue):
+    """compact binary form of a queue, each distinct array is written once as raw bytes"""
+    split_queue, refs, arrays, default, nested = _split_arrays(queue)
+    queue_json = orjson.dumps(split_queue, default=default, option=orjson.OPT_NON_STR_KEYS)
+    blocks = []
+    entries = {}
+    offset = 0
+    for key, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        offset = _aligned(offset)
+        entries[key] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        blocks.append((offset, array))
+        offset += array.nbytes
+    manifest = b"".join(
+        (
+            b'{"arrays":',
+            orjson.dumps(entries),
+            b',"refs":',
+            orjson.dumps(refs),
+            b',"nested":',
+            orjson.dumps(nested[0]),
+            b',"queue":',
+            queue_json,
+            b"}",
+        )
+    )
+    data_start = _aligned(_binary_header.size + len(manifest))
+
+    buffer = bytearray(data_start + offset)
+    _binary_header.pack_into(buffer, 0, _binary_magic, _binary_version, len(manifest))
+    buffer[_binary_header.size : _binary_header.size + len(manifest)] = manifest
+    for block_offset, array in blocks:
+        start = data_start + block_offset
+        buffer[start : start + array.nbytes] = memoryview(array.reshape(-1).view(np.uint8))
+    return bytes(buffer)
+
+
+def loads_queue_binary(data):
+    """
+    queue from dumps_queue_binary, data can be bytes, a memoryview, or a numpy uint8 array (e.g. a memmap) every
+    array is a read-only view into data rather than a copy, so data must be kept alive while the queue is used
+    """
+    buffer = memoryview(data).cast("B")
+    magic, version, manifest_length = _binary_header.unpack_from(buffer, 0)
+    if magic != _binary_magic:
+        raise ValueError("not a binary queue file")
+    if version != _binary_version:
+        raise ValueError(f"binary queue format version {version} is not supported")
+    manifest = orjson.loads(buffer[_binary_header.size : _binary_header.size + manifest_length])
+    data_start = _aligned(_binary_header.size + manifest_length)
+    arrays = {}
+    for key, entry in manifest["arrays"].items():
+        dtype = np.dtype(entry["dtype"])
+        count = int(np.prod(entry["shape"], dtype=int))
+        array = np.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + entry["offset"])
+        array = array.reshape(entry["shape"])
+        array.flags.writeable = False
+        arrays[key] = array
+    return _join_arrays(manifest["queue"], manifest["refs"], arrays, manifest["nested"])
+
+
+def save_queue_binary(queue, path):
+    """writes a queue to a binary queue file"""
+    with open(path, "wb") as file:
+        file.write(dumps_queue_binary(queue))
+
+
+def load_queue_binary(path):
+    """reads a binary queue file, memory-mapping it so the arrays are only read from disk when used"""
+    return loads_queue_binary(np.memmap(path, dtype=np.uint8, mode="r"))
+
+
+def benchmark_serialization(queue, num_acquisitions=1000, repeats=3, print_report=True):
+    """
+    times encoding and decoding a queue with each serialization, and reports the sizes
+
+    Parameters
+    ----------
+    queue : list of dict
+        queue as from dryrun_bar, its items are repeated (with new uids) to make a queue of num_acquisitions
+    num_acquisitions : int, optional
+        number of acquisitions in the benchmark queue, by default 1000
+    repeats : int, optional
+        the best time of this many runs is reported, by default 3
+    print_report : bool, optional
+        whether to print the results, by default True
+
+    Returns
+    -------
+    dict
+        {format: {"encode_s", "decode_s", "bytes"}}
+    """
+    big_queue = []
+    for index in range(num_acquisitions):
+        acquisition = copy.copy(queue[index % len(queue)])
+        acquisition["acq_index"] = index
+        acquisition["uid"] = uuid.uuid4()
+        big_queue.append(acquisition)
+
+    formats = {
+        "json": (lambda q: json.dumps(q, cls=NumpyEncoder), json.loads),
+        "json shared arrays": (dumps_queue, loads_queue),
+        "orjson": (dumps_json, loads_json),
+        "binary": (dumps_queue_binary, loads_queue_binary),
+    }
+    results = {}
+    for name, (encode, decode) in formats.items():
+        encode_times = []
+        decode_times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            encoded = encode(big_queue)
+            encode_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            decode(encoded)
+            decode_times.append(time.perf_counter() - start)
+        results[name] = {"encode_s": min(encode_times), "decode_s": min(decode_times), "bytes": len(encoded)}
+    if print_report:
+        print(f"{num_acquisitions} acquisitions")
+        for name, result in results.items():
+            print(
+                f"{name:>20}: encode {result['encode_s'] * 1000:8.1f} ms, "
+                f"decode {result['decode_s'] * 1000:8.1f} ms, {result['bytes'] / 1e6:8.2f} MB"
+            )
+    return results
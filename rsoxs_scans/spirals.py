@@ -9,13 +9,124 @@ from .defaults import *
 import numpy as np
 
 
+def spiral_num_points(diameter, step):
+    """number of points along one axis of a spiral or raster window"""
+    if step <= 0:
+        raise ValueError(f"spiral step must be positive, not {step}")
+    if diameter < 0:
+        raise ValueError(f"spiral diameter must not be negative, not {diameter}")
+    return int(round(diameter / step)) + 1
 
 
+def spiral_square_points(step=default_spiral_step, diameter_x=default_diameter, diameter_y=None, center=(0.0, 0.0)):
+    """Points of a square spiral, in the order they are measured.
 
+    Matches bluesky's spiral_square pattern with x_range=diameter_x and x_num=round(diameter_x/step)+1 (and the
+    same for y), starting at the center and working outwards ring by ring, but computes every point at once.
 
+    Parameters
+    ----------
+    step : float, optional
+        distance between neighbouring points in mm, by default default_spiral_step
+    diameter_x : float, optional
+        width of the window in mm, by default default_diameter
+    diameter_y : float, optional
+        height of the window in mm, by default the same as diameter_x
+    center : tuple, optional
+        (x, y) center of the window, by default (0, 0)
 
+    Returns
+    -------
+    numpy.ndarray
+        (number of points, 2) array of x and y positions
+    """
+    if diameter_y is None:
+        diameter_y = diameter_x
+    x_num = spiral_num_points(diameter_x, step)
+    y_num = spiral_num_points(diameter_y, step)
+    # even numbers of points start half a step off center, as bluesky does
+    x_offset = 0.5 if x_num % 2 == 0 else 0
+    y_offset = -0.5 if y_num % 2 == 0 else 0
+    x_delta = diameter_x / (x_num - 1) if x_num > 1 else 0
+    y_delta = diameter_y / (y_num - 1) if y_num > 1 else 0
 
+    # grid indices relative to the starting point, all of which are within the window
+    m = np.arange(x_num) - (x_num - 1) // 2
+    n = np.arange(y_num) - y_num // 2
+    m, n = [a.ravel() for a in np.meshgrid(m, n)]
 
+    # each ring is walked down its right side, left along the bottom, up the left side, then right along the top
+    ring = np.maximum(np.abs(m), np.abs(n))
+    side = np.select([(m == ring) & (n < ring), n == -ring, m == -ring], [0, 1, 2], default=3)
+    along = np.choose(side, [-n, -m, n, m])
+    order = np.lexsort((along, side, ring))
+
+    x = center[0] - x_delta * x_offset + x_delta * m[order]
+    y = center[1] - y_delta * y_offset + y_delta * n[order]
+    return np.column_stack((x, y))
+
+
+def raster_points(step=default_spiral_step, diameter_x=default_diameter, diameter_y=None, center=(0.0, 0.0), snake=True):
+    """Points of a raster over the same window as spiral_square_points, row by row from the bottom.
+
+    With snake=True every other row is measured backwards so the motors never fly back across the window.
+
+    Returns
+    -------
+    numpy.ndarray
+        (number of points, 2) array of x and y positions
+    """
+    if diameter_y is None:
+        diameter_y = diameter_x
+    x_num = spiral_num_points(diameter_x, step)
+    y_num = spiral_num_points(diameter_y, step)
+    x = center[0] + np.linspace(-diameter_x / 2, diameter_x / 2, x_num)
+    y = center[1] + np.linspace(-diameter_y / 2, diameter_y / 2, y_num)
+    xx = np.tile(x, (y_num, 1))
+    if snake:
+        xx[1::2] = xx[1::2, ::-1]
+    return np.column_stack((xx.ravel(), np.repeat(y, x_num)))
+
+
+def scan_points_time(
+    points,
+    exposure_time=default_exposure_time,
+    point_overhead=default_spiral_point_overhead,
+    motor_speed=default_sample_motor_speed,
+    settle_time=default_motor_settle_time,
+):
+    """Estimated time in seconds to measure a list of points.
+
+    Every point costs an exposure and a fixed overhead, and every move costs a settle time plus the time for the
+    slower of the two motors (which move together) to cover its distance.
+    """
+    points = np.asarray(points, dtype=float)
+    if len(points) == 0:
+        return 0.0
+    moves = np.abs(np.diff(points, axis=0)).max(axis=1) if len(points) > 1 else np.zeros(0)
+    moving = moves > 0
+    return float(
+        len(points) * (exposure_time + point_overhead) + moves[moving].sum() / motor_speed + moving.sum() * settle_time
+    )
+
+
+def spiral_scan_points(
+    diameter=default_diameter, spiral_step=default_spiral_step, spiral_dimensions=None, **kwargs
+):
+    """Points of the spiral measured for a spiral acquisition.
+
+    spiral_dimensions ([step_size, diameter_x, diameter_y]) takes precedence over spiral_step and diameter, so
+    rectangular windows are measured as they are given.  Other keys of the acquisition are ignored, so it can be
+    called as spiral_scan_points(**acq).
+
+    Returns
+    -------
+    numpy.ndarray
+        (number of points, 2) array of x and y positions
+    """
+    if isinstance(spiral_dimensions, (list, tuple)):
+        return spiral_square_points(*spiral_dimensions)
+    return spiral_square_points(spiral_step, diameter)
 
 
 ## Eliot's old code is below
@@ -106,6 +217,7 @@ def dryrun_spiral_plan(
     diode_range="high",
     md=None,
     dets=None,
+    spiral_dimensions=None,
     **kwargs,
 ):
     valid = True
@@ -127,6 +239,14 @@ def dryrun_spiral_plan(
     if edge > 1200 and grating == "rsoxs":
         valid = False
         valid_text += f"\n\nERROR - energy is not appropriate for this grating\n\n"
+    try:
+        points = spiral_scan_points(diameter, spiral_step, spiral_dimensions)
+    except (TypeError, ValueError):
+        valid = False
+        if spiral_dimensions is not None:
+            valid_text += f"\n\nERROR - invalid spiral dimensions {spiral_dimensions}\n\n"
+        else:
+            valid_text += f"\n\nERROR - invalid spiral diameter {diameter} or step size {spiral_step}\n\n"
     if not valid:
         # don't go any further, even in simulation mode, because we know the inputs are wrong
         return {
@@ -142,6 +262,11 @@ def dryrun_spiral_plan(
         output.append({"description": "set Diode range to low\n", "action": "diode_low"})
     if angles is None:
         angles = [None]
+    if spiral_dimensions is not None:
+        kwargs["spiral_dimensions"] = spiral_dimensions
+    point_text = (
+        f"    {len(points)} points, about {round(scan_points_time(points, exposure_time) / 60, 1)} minutes per spiral\n"
+    )
     for angle in angles:
         for pol in polarizations:
             output.append(
@@ -159,4 +284,6 @@ def dryrun_spiral_plan(
                     **kwargs
                 )
             )
+            if output[-1]["action"] != "error":
+                output[-1]["description"] += point_text
     return output
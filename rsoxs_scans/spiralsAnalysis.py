@@ -1,9 +1,200 @@
 # imports
 import copy
+import warnings
 import numpy as np
 
 
-def pickLocationsFromSpirals( ## Intended to be an updated, data-security-compliant version of resolve_spirals.  Probably will just have this function pick spots for one sample and then it can be rerun for multiple samples.  That way, not all spirals have to be resolved in one go.
+## Motor names in the survey scan for each location coordinate, as (stream, key) in order of preference.
+## Older scans used the RSoXS names and newer scans the manipulator names.
+surveyKeys_Candidates = {
+    "x": (("primary", "RSoXS Sample Outboard-Inboard"), ("primary", "manipulator_x")),
+    "y": (("primary", "RSoXS Sample Up-Down"), ("primary", "manipulator_y")),
+    "z": (("baseline", "RSoXS Sample Downstream-Upstream"), ("baseline", "manipulator_z")),
+    "th": (("baseline", "RSoXS Sample Rotation"), ("baseline", "manipulator_r")),
+}
+
+
+def resolveSurveyKeys(scanSurvey, scanID=None, keyCache=None):
+    ## Finds which motor names a survey scan uses, without reading any data
+    ## keyCache is {scanID: {coordinate: (stream, key)}}, kept by the caller for scans from one catalog
+    if keyCache is None: keyCache = {}
+    if scanID is not None and scanID in keyCache: return keyCache[scanID]
+    keys = {}
+    for coordinate, candidates in surveyKeys_Candidates.items():
+        for stream, key in candidates:
+            if key in scanSurvey[stream]["data"]:
+                keys[coordinate] = (stream, key)
+                break
+        else: raise KeyError(f"Scan {scanID} has none of {[key for stream, key in candidates]} in its data")
+    if scanID is not None: keyCache[scanID] = keys
+    return keys
+
+
+def readSurveyLocations(scanSurvey, indices, keys):
+    ## Reads only the rows of the primary stream spanning the selected indices, and the first baseline reading
+    ## Negative indices count from the end of the scan, as they would indexing the whole column
+    indices = np.asarray(indices, dtype=int)
+    if (indices < 0).any():
+        stream, key = next((stream, key) for stream, key in keys.values() if stream == "primary")
+        length = scanSurvey[stream]["data"][key].shape[0]
+        if (indices < -length).any():
+            raise IndexError(f"Index {int(indices.min())} is out of range for a scan of {length} points")
+        indices = np.where(indices < 0, indices + length, indices)
+    rows = slice(int(indices.min()), int(indices.max()) + 1)
+    locations = {}
+    for coordinate, (stream, key) in keys.items():
+        if stream == "primary": locations[coordinate] = np.asarray(scanSurvey[stream]["data"][key][rows])[indices - rows.start]
+        else: locations[coordinate] = np.full(len(indices), scanSurvey[stream]["data"][key][0])
+    return locations
+
+
+def pickLocationsFromSpirals_Batch(
+        configuration, ## Up-to-date spreadsheet with current sample locations
+        catalog,
+        picks, ## Iterable of (sampleID, scanID_Survey, locationsSelected_Indices)
+        keyCache=None, ## {scanID: keys} to reuse between calls with the same catalog.  By default keys are looked up for each call
+):
+    ## Picks locations for many samples at once.  Each survey scan is opened once, its motor names are looked up once,
+    ## and only the stretch of the primary stream covering the selected indices is read.
+    ## As in pickLocationsFromSpirals, the first location picked for a sample replaces its location and each further
+    ## location adds a copy of the sample with _<n> appended to sample_name and sample_id.
+
+    ## Group the picks by scan so each scan is read once, keeping the picks for each sample in order
+    picksBySample = {}
+    indicesByScan = {}
+    for sampleID, scanID_Survey, locationsSelected_Indices in picks:
+        scanID_Survey = int(scanID_Survey)
+        for index_Location in locationsSelected_Indices:
+            picksBySample.setdefault(sampleID, []).append((scanID_Survey, int(index_Location)))
+            indicesByScan.setdefault(scanID_Survey, []).append(int(index_Location))
+
+    ## Read every selected location, {scanID: {index: location}}
+    locationsByScan = {}
+    for scanID_Survey, indices in indicesByScan.items():
+        scanSurvey = catalog[scanID_Survey]
+        keys = resolveSurveyKeys(scanSurvey, scanID_Survey, keyCache)
+        indices = sorted(set(indices))
+        locations = readSurveyLocations(scanSurvey, indices, keys)
+        locationsByScan[scanID_Survey] = {
+            index_Location: [{"motor": "x", "position": float(locations["x"][index_Array])},
+                             {"motor": "y", "position": float(locations["y"][index_Array])},
+                             {"motor": "th", "position": float(locations["th"][index_Array])},
+                             {"motor": "z", "position": float(locations["z"][index_Array])}]
+            for index_Array, index_Location in enumerate(indices)
+        }
+
+    ## Update the configuration through a sample_id index instead of searching it for every sample
+    samplesByID = {}
+    for sample in configuration: samplesByID.setdefault(sample["sample_id"], sample)
+    for sampleID, samplePicks in picksBySample.items():
+        if sampleID not in samplesByID:
+            warnings.warn(f"Sample {sampleID} is not in the configuration, no locations were picked for it.", stacklevel=2)
+            continue
+        sample = samplesByID[sampleID]
+        ## The original location is not carried into the copies, so only the rest of the sample is copied
+        sampleTemplate = {key: value for key, value in sample.items() if key != "location"}
+        for index_Pick, (scanID_Survey, index_Location) in enumerate(samplePicks):
+            locationNewFormatted = copy.deepcopy(locationsByScan[scanID_Survey][index_Location])
+            if index_Pick == 0: sample["location"] = locationNewFormatted
+            else:
+                sampleNew = copy.deepcopy(sampleTemplate)
+                sampleNew["location"] = locationNewFormatted
+                sampleNew["sample_name"] += f"_{index_Pick}"
+                sampleNew["sample_id"] += f"_{index_Pick}"
+                configuration.append(sampleNew)
+                samplesByID.setdefault(sampleNew["sample_id"], sampleNew)
+    return configuration
+
+
+def scoreSpiralImages(
+        images, ## Image stack of a spiral scan, shape (number of points, rows, columns).  Can be a memmap or anything else that reads a stack of frames when sliced
+        saturationLevel=None, ## Counts at which a pixel is saturated.  Defaults to the largest value of an integer dtype
+        beamCenter=None, ## (row, column) of the beam on the detector.  Defaults to the intensity centroid of each image
+        mask=None, ## Boolean array the shape of one image, True for pixels to use
+        chunkSize=4, ## Number of frames held in memory at a time
+):
+    ## Scores every point of a spiral with a few quick metrics of its detector image
+    ## intensity: total counts in the image
+    ## saturationFraction: fraction of pixels at or above saturationLevel
+    ## anisotropy: 0 for scattering that is the same in every direction up to 1 for scattering along a single line,
+    ##     from the second moments of the intensity about the beam center
+    numberImages, numberRows, numberColumns = images.shape[0], images.shape[1], images.shape[2]
+    if saturationLevel is None:
+        dtype = np.dtype(images.dtype)
+        saturationLevel = np.iinfo(dtype).max if np.issubdtype(dtype, np.integer) else np.inf
+    if mask is None: mask = np.ones((numberRows, numberColumns), dtype=bool)
+    mask = np.asarray(mask, dtype=bool)
+    rows = np.arange(numberRows, dtype=np.float64)
+    columns = np.arange(numberColumns, dtype=np.float64)
+
+    scores = {
+        "intensity": np.zeros(numberImages),
+        "saturationFraction": np.zeros(numberImages),
+        "anisotropy": np.zeros(numberImages),
+    }
+    for start in range(0, numberImages, chunkSize):
+        stop = min(start + chunkSize, numberImages)
+        chunk = np.asarray(images[start:stop], dtype=np.float64) * mask
+        scores["saturationFraction"][start:stop] = ((chunk >= saturationLevel) & mask).sum(axis=(1, 2)) / max(mask.sum(), 1)
+
+        ## Row and column profiles are enough for every moment, so the full image is only summed twice
+        profileRows = chunk.sum(axis=2)
+        profileColumns = chunk.sum(axis=1)
+        intensity = profileRows.sum(axis=1)
+        scores["intensity"][start:stop] = intensity
+        total = np.where(intensity > 0, intensity, 1)
+        if beamCenter is None:
+            centerRow = profileRows @ rows / total
+            centerColumn = profileColumns @ columns / total
+        else:
+            centerRow = np.full(stop - start, float(beamCenter[0]))
+            centerColumn = np.full(stop - start, float(beamCenter[1]))
+        momentRows = profileRows @ rows**2 / total - 2 * centerRow * (profileRows @ rows) / total + centerRow**2
+        momentColumns = (
+            profileColumns @ columns**2 / total - 2 * centerColumn * (profileColumns @ columns) / total + centerColumn**2
+        )
+        momentCross = (
+            np.einsum("nij,i,j->n", chunk, rows, columns) / total
+            - centerRow * (profileColumns @ columns) / total
+            - centerColumn * (profileRows @ rows) / total
+            + centerRow * centerColumn
+        )
+        spread = momentRows + momentColumns
+        scores["anisotropy"][start:stop] = np.where(
+            spread > 0,
+            np.sqrt((momentRows - momentColumns) ** 2 + 4 * momentCross**2) / np.where(spread > 0, spread, 1),
+            0,
+        )
+    return scores
+
+
+def rankSpiralLocations(
+        images, ## Image stack of a spiral scan, see scoreSpiralImages
+        numberLocations=3, ## Number of spots to return
+        maximumSaturationFraction=0.001, ## Spots with more saturated pixels than this are never picked
+        weight_Saturation=10, ## Penalty per unit saturation fraction, relative to the normalized intensity
+        weight_Anisotropy=0, ## Reward for anisotropic scattering, e.g., for aligned samples
+        **kwargsScore, ## Passed to scoreSpiralImages
+):
+    ## Ranks spiral points by normalized intensity, penalized for saturation and optionally rewarded for anisotropy
+    ## Returns the indices of the best points, best first, ready to use as locationsSelected_Indices in
+    ## pickLocationsFromSpirals, and the scores of every point
+    scores = scoreSpiralImages(images, **kwargsScore)
+    intensityMaximum = scores["intensity"].max()
+    score = scores["intensity"] / (intensityMaximum if intensityMaximum > 0 else 1)
+    score = score - weight_Saturation * scores["saturationFraction"] + weight_Anisotropy * scores["anisotropy"]
+    score[scores["saturationFraction"] > maximumSaturationFraction] = -np.inf
+    scores["score"] = score
+
+    candidates = np.flatnonzero(np.isfinite(score))
+    numberLocations = min(numberLocations, len(candidates))
+    if numberLocations <= 0: return [], scores
+    best = candidates[np.argpartition(-score[candidates], numberLocations - 1)[:numberLocations]]
+    best = best[np.argsort(-score[best], kind="stable")]
+    return [int(index) for index in best], scores
+
+
+def pickLocationsFromSpirals( ## Intended to be an updated, data-security-compliant version of resolve_spirals.  Picks spots for one sample; use pickLocationsFromSpirals_Batch to pick spots for many samples in one go.
         configuration, ## Up-to-date spreadsheet with current sample locations.  TODO: maybe load sheet separately and then pick spots and then save out a new sheet
         sampleID,
         catalog,
@@ -13,46 +204,10 @@ def pickLocationsFromSpirals( ## Intended to be an updated, data-security-compli
 ):
     
     ## TODO: Consider making this a more generic function that picks a sample location from some series scan.  For spiral scans, it picks x and y location, but for an angle series, it could pick from there as well
-    ## Can do something like try/except where I try to find the coordinate from primary but otherwise, find it from the baseline
-    ## Otherwise, this is simple enough to make a separate function for an angle series and not have unnecessary errors due to extra checking
-
-    
-    ## Load spiral scan from tiled and gather location coordinates
-    scanSurvey = catalog[int(scanID_Survey)]
     ## TODO: If sample_id from tiled does not equal the sample ID here, then give warning
-    try: locations_OutboardInboard = scanSurvey["primary"]["data"]["RSoXS Sample Outboard-Inboard"].read()
-    except KeyError: locations_OutboardInboard = scanSurvey["primary"]["data"]["manipulator_x"].read()
-    
-    try: locations_DownUp = scanSurvey["primary"]["data"]["RSoXS Sample Up-Down"].read()
-    except KeyError: locations_DownUp = scanSurvey["primary"]["data"]["manipulator_y"].read()
-    
-    try: locations_UpstreamDownstream = scanSurvey["baseline"]["data"]["RSoXS Sample Downstream-Upstream"][0]
-    except KeyError: locations_UpstreamDownstream = scanSurvey["baseline"]["data"]["manipulator_z"][0]
-
-    try: locations_Theta = scanSurvey["baseline"]["data"]["RSoXS Sample Rotation"][0]
-    except KeyError: locations_Theta = scanSurvey["baseline"]["data"]["manipulator_r"][0]
-    
-    
-    ## Find the sample to update location
-    ## TODO: probably better to deep copy configuration and search through the copy while updating the original configuration?
-    for index_Configuration, sample in enumerate(configuration):
-        if sample["sample_id"] == sampleID: 
-            #locationInitial = sample["location"]
-            for index_locationSelected_Indices, locationSelected_Indices in enumerate(locationsSelected_Indices):
-                #locationNewFormatted = copy.deepcopy(locationInitial)
-                locationNewFormatted = [{'motor':'x','position':locations_OutboardInboard[locationSelected_Indices]},
-                                        {'motor':'y','position':locations_DownUp[locationSelected_Indices]},
-                                        {'motor':'th','position':locations_Theta},
-                                        {'motor':'z','position':locations_UpstreamDownstream}]
-                if index_locationSelected_Indices==0: sample["location"] = locationNewFormatted
-                else: 
-                    sampleNew = copy.deepcopy(sample)
-                    sampleNew["location"] = locationNewFormatted
-                    sampleNew["sample_name"]+=f'_{index_locationSelected_Indices}'
-                    sampleNew["sample_id"]+=f'_{index_locationSelected_Indices}'
-                    configuration.append(sampleNew)
-            break ## Exit after the sample is found and do not spend time looking through the other samples
-    return configuration
+    return pickLocationsFromSpirals_Batch(configuration=configuration,
+                                          catalog=catalog,
+                                          picks=[(sampleID, scanID_Survey, locationsSelected_Indices)])
 
 
 ## How to use pick_locations_from_spirals
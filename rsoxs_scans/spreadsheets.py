@@ -4,10 +4,9 @@ Contains code to parse excel sheet for bar (list of sample dict), export parsed
 """
 
 # imports
-from copy import deepcopy
-from openpyxl import load_workbook
-from openpyxl.writer import excel
+from openpyxl import load_workbook, Workbook
 from pathlib import Path
+from io import BytesIO
 from datetime import date, datetime
 import json, orjson
 import re, warnings, httpx, uuid
@@ -23,18 +22,37 @@ from .defaults import (
     rsoxs_edges,
     nexafs_edges,
     CURRENT_CYCLE,
+    grazing_angle_range,
+    transmission_angle_range,
 )
+from .fingerprint import previous_proposal_info, reuse_identities
+from .validation import samplesSchema, compileSchema, checkDataFrame
 
 
-def load_samplesxlsx(filename: str, verbose=False):
+# The Bar sheet has the columns of the Samples sheet, so it is checked with the same schema.  Angles are checked
+# with the angles of the acquisitions in load_samplesxlsx, and the proposal can also be given as a data_session, so
+# those are left out
+barSchema_Compiled = compileSchema(
+    {parameter: rules for parameter, rules in samplesSchema.items() if parameter not in ("angle", "proposal_id")}
+)
+
+
+def load_samplesxlsx(filename: str, verbose=False, proposal_cache=None, previous_bar=None):
     """Imports data from sample excel spreadsheet and online sources to generate bar (list of sample dicts)
 
     Parameters
     ----------
-    filename : str
-        String or Pathlike object that references the excel sheet to load
+    filename : str or bytes
+        String or Pathlike object that references the excel sheet to load, or the contents of the file
     verbose : bool
         Whether or not to print messages to stdout
+    proposal_cache : dict, optional
+        PASS database results by proposal, filled in as proposals are looked up, so that loading the sheet again
+        doesn't repeat the lookups (failed lookups are remembered too).  by default None, every proposal is looked up
+    previous_bar : list of dict, optional
+        the bar loaded from an earlier version of the sheet.  samples with the same sample_id and proposal keep their
+        PASS values without looking them up again, and acquisitions which are unchanged or modified (see
+        fingerprint.diff_bars) keep their uids.  by default None
 
     Returns
     -------
@@ -42,8 +60,11 @@ def load_samplesxlsx(filename: str, verbose=False):
         bar (list of sample dicts) which contain all imported data from the Bar sheet and Acquisitions sheet
     """
 
+    # Read the file once, so every sheet comes from the same version of it even if it is saved again while loading
+    data = filename if isinstance(filename, bytes) else Path(filename).read_bytes()
+
     # Validate Spreadsheet Version Number
-    excel_file = load_workbook(filename)
+    excel_file = load_workbook(BytesIO(data), read_only=True)
     print(f"spreadsheet version is {excel_file.properties.title}")
     if excel_file.properties.title != current_version:
         excel_file.close()
@@ -53,6 +74,8 @@ def load_samplesxlsx(filename: str, verbose=False):
         )
     excel_file.close()
 
+    workbook = pd.ExcelFile(BytesIO(data), engine="openpyxl")
+
     # First, check the bar sheet for whether header rows with user instructions are present, and identity them if so
     # If so, we can do some extra validation, but need to skip them when loading data
     # If not, we proceed with a bit less validation and don't skip them
@@ -67,7 +90,7 @@ def load_samplesxlsx(filename: str, verbose=False):
         if verbose:
             print("Loading 'Bar' Sheet Headers")
         df_barHeader = pd.read_excel(
-            filename,
+            workbook,
             na_values="",
             engine="openpyxl",
             keep_default_na=True,
@@ -144,7 +167,7 @@ def load_samplesxlsx(filename: str, verbose=False):
         if verbose:
             print("Loading 'Acquisitions' Sheet Headers")
         df_acqHeader = pd.read_excel(
-            filename,
+            workbook,
             na_values="",
             engine="openpyxl",
             keep_default_na=True,
@@ -212,7 +235,7 @@ def load_samplesxlsx(filename: str, verbose=False):
         print("Loading 'Bar' Sheet Data")
     warnings.simplefilter(action="ignore", category=UserWarning)
     df_bar = pd.read_excel(
-        filename,
+        workbook,
         na_values="",
         engine="openpyxl",
         keep_default_na=True,
@@ -222,6 +245,9 @@ def load_samplesxlsx(filename: str, verbose=False):
         verbose=verbose,
     )
 
+    # Report every invalid cell in the sheet at once, with the same rules as the Samples sheet of the new loader
+    checkDataFrame(df_bar, barSchema_Compiled, sheetName="Bar")
+
     # Replace NaNs with empty string ## PK: Why is this necessary?
     df_bar.replace(np.nan, "", regex=True, inplace=True)
 
@@ -240,7 +266,7 @@ def load_samplesxlsx(filename: str, verbose=False):
     if verbose:
         print("Loading 'Acquisitions' Sheet Data")
     df_acqs = pd.read_excel(
-        filename,
+        workbook,
         na_values="",
         engine="openpyxl",
         keep_default_na=True,
@@ -261,6 +287,7 @@ def load_samplesxlsx(filename: str, verbose=False):
     if verbose:
         print("Started Parsing Acquisition Data")
     acq = {}
+    acqAngles = []  # (acquisition row, sample_id, grazing, angle) for every angle requested in the sheet
     # Loop through acquisitions and sanitize / validate user input
     for i, acq in enumerate(acqs):
         # Loop through columns in the acquisition sheet and sanitize strings
@@ -389,69 +416,23 @@ def load_samplesxlsx(filename: str, verbose=False):
             if isinstance(acq["grating"], (float)):
                 acq["grating"] = int(acq["grating"])
 
-        # Validate Acquisition Parameters by Value and issue warnings if out of bounds
-        invalidAcqParam = False  # False means none invalid
-        invalidAcqParamText = (
-            f"Acquisition #{i}, sample_id:{acq['sample_id']} has invalid parameters: \n"
-        )
-
-        # Check each angle listed, if any
+        # Collect angles so that every angle in the sheet is validated at once after this loop
         if "angles" in acq:
             for testAng in acq["angles"]:
-                # print(f"grazing: {samp['grazing']}, testAng: {testAng}"
-                angInvalid = False
                 # No need to test if its empty (nan)
                 if isinstance(testAng, float) and np.isnan(testAng):
-                    pass
-                else:
-                    # if grazing is true, valid angles are 20 to 90 degrees
-                    if samp["grazing"] == True:
-                        gAngLow, gAngHigh = 20, 90  # Eventually these should move to defaults page
-                        try:
-                            angInvalid = not isParamValid(
-                                testAng, matchType="numeric", validValues=[gAngLow, gAngHigh]
-                            )
-                        except ValueError:  # hacky check for param type validation
-                            angInvalid = True
-                        if angInvalid:
-                            invalidAcqParamText += (
-                                f"\tInvalid Angle: {testAng} . For grazing samples, angle must be"
-                                f" between {gAngLow} and {gAngHigh}\n"
-                            )
-
-                    elif samp["grazing"] == False:
-                        tAngLow, tAngHigh = (
-                            -14,
-                            90,
-                        )  # Eventually these should move to defaults page
-                        try:
-                            angInvalid = not isParamValid(
-                                testAng, matchType="numeric", validValues=[tAngLow, tAngHigh]
-                            )
-                        except ValueError:  # hacky check for param type validation
-                            angInvalid = True
-                        if angInvalid:
-                            invalidAcqParamText += (
-                                f"\tInvalid Angle: {testAng} . For transmission samples, angle"
-                                f" must be between {tAngLow} and {tAngHigh}\n"
-                            )
-                    else:
-                        angInvalid = True
-                        raise ValueError("Unable to determine angle geometry, check grazing field")
-
-                # if any invalid, need to report out
-                invalidAcqParam = (
-                    invalidAcqParam or angInvalid
-                )  # we already had invalids, or we found one now
-
-        if invalidAcqParam:
-            warnings.resetwarnings()
-            warnings.warn(invalidAcqParamText, stacklevel=2)
+                    continue
+                if samp["grazing"] not in (True, False):
+                    raise ValueError("Unable to determine angle geometry, check grazing field")
+                acqAngles.append((i, acq["sample_id"], samp["grazing"] == True, testAng))
+
+    warnInvalidAngles(acqAngles, "Acquisition #{row}, sample_id:{sample_id} has invalid parameters: \n")
 
     # Begin Bar validation
     if verbose:
         print("Started Parsing Bar Data")
 
+    barAngles = []  # (bar row, sample_id, grazing, angle) for every sample with an angle
     # Loop through samples in Bar and sanitize / validate user input
     for i, sam in enumerate(new_bar):
         # Handle the autogenerated columns,
@@ -481,64 +462,17 @@ def load_samplesxlsx(filename: str, verbose=False):
         if missedVal:
             raise ValueError(missingValText)
 
-        # Validate Bar Parameters by Value and issue warnings if out of bounds
-        invalidAcqParam = False  # False means none invalid
-        invalidAcqParamText = (
-            f"Bar Sheet Entry #{i}, sample_id:{sam['sample_id']} has invalid parameters: \n"
-        )
-
-        # Check angle listed, if any
+        # Check angle listed, if any.  Angles are collected and validated for the whole sheet at once below
         if sam["angle"] != "":
             testAng = sam["angle"]
             if testAng == 180:
                 sam["angle"] = 0 # 180 is the old convention, which is just 0 now, let's not error out on it.
                 testAng = sam["angle"]
-            # print(f"grazing: {sam['grazing']}, testAng: {testAng}")
-            angInvalid = False
             # No need to test if its empty (nan)
-            if isinstance(testAng, float) and np.isnan(testAng):
-                pass
-            else:
-                # if grazing is true, valid angles are 20 to 90 degrees
-                if sam["grazing"] == True:
-                    gAngLow, gAngHigh = 20, 90  # Eventually these should move to defaults page
-                    try:
-                        angInvalid = not isParamValid(
-                            testAng, matchType="numeric", validValues=[gAngLow, gAngHigh]
-                        )
-                    except ValueError:  # hacky check for param type validation
-                        angInvalid = True
-                    if angInvalid:
-                        invalidAcqParamText += (
-                            f"\tInvalid Angle: {testAng} . For grazing samples, angle must be"
-                            f" between {gAngLow} and {gAngHigh}\n"
-                        )
-
-                elif sam["grazing"] == False:
-                    tAngLow, tAngHigh = -14, 90  # Eventually these should move to defaults page
-                    try:
-                        angInvalid = not isParamValid(
-                            testAng, matchType="numeric", validValues=[tAngLow, tAngHigh]
-                        )
-                    except ValueError:  # hacky check for param type validation
-                        angInvalid = True
-                    if angInvalid:
-                        invalidAcqParamText += (
-                            f"\tInvalid Angle: {testAng} . For transmission samples, angle must be"
-                            f" between {tAngLow} and {tAngHigh}\n"
-                        )
-                else:
-                    angInvalid = True
+            if not (isinstance(testAng, float) and np.isnan(testAng)):
+                if sam["grazing"] not in (True, False):
                     raise ValueError("Unable to determine angle geometry, check grazing field")
-
-                # if any invalid, need to report out
-                invalidAcqParam = (
-                    invalidAcqParam or angInvalid
-                )  # we already had invalids, or we found one now
-
-        if invalidAcqParam:
-            warnings.resetwarnings()
-            warnings.warn(invalidAcqParamText, stacklevel=2)
+                barAngles.append((i, sam["sample_id"], sam["grazing"] == True, testAng))
 
         # Pull data from PASS Database
 
@@ -554,11 +488,24 @@ def load_samplesxlsx(filename: str, verbose=False):
             )
             proposal = 0
 
-        # Query the PASS database for values
+        # Query the PASS database for values, unless this sample was already looked up
         try:
-            sam["data_session"], sam["analysis_dir"], sam["SAF"], sam["proposal"] = (
-                get_proposal_info(proposal)
-            )
+            previous_info = previous_proposal_info(previous_bar, sam)
+            if previous_info is not None:
+                proposal_info = previous_info
+            elif proposal_cache is None:
+                proposal_info = get_proposal_info(proposal)
+            else:
+                if proposal not in proposal_cache:
+                    try:
+                        proposal_cache[proposal] = get_proposal_info(proposal)
+                    except:
+                        proposal_cache[proposal] = None
+                        raise
+                if proposal_cache[proposal] is None:
+                    raise ValueError(f"PASS lookup of {proposal} failed before")
+                proposal_info = proposal_cache[proposal]
+            sam["data_session"], sam["analysis_dir"], sam["SAF"], sam["proposal"] = proposal_info
         except:
             warnings.warn("PASS lookup failed - trusting values", stacklevel=2)
             pass
@@ -574,6 +521,12 @@ def load_samplesxlsx(filename: str, verbose=False):
         for key in [key for key, value in sam.items() if "named" in key.lower() or "Index" in key]:
             del new_bar[i][key]
 
+    warnInvalidAngles(barAngles, "Bar Sheet Entry #{row}, sample_id:{sample_id} has invalid parameters: \n")
+
+    # Acquisitions which were already in the previous bar keep their uids
+    if previous_bar is not None:
+        reuse_identities(previous_bar, new_bar)
+
     if verbose:
         print("Bar and Acquisitions Sheets Loaded")
     return new_bar
@@ -683,9 +636,33 @@ def get_proposal_info(proposal_id, beamline="SST1", path_base="/sst/", cycle=CUR
     return res["data_session"], valid_path, valid_SAF, proposal_info
 
 
+def _excel_value(value):
+    # plain python version of a value, so arrays and numpy numbers are written as their values
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, dict):
+        return {key: _excel_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_excel_value(item) for item in value]
+    return value
+
+
+def _excel_cell(value):
+    # value to write into a cell - empty for None, NaN, or "", and text for lists, dicts, and anything else
+    value = _excel_value(value)
+    if value is None or value == "" or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, (bool, int, float, str, datetime, date)):
+        return value
+    return str(value)
+
+
 def save_samplesxlsx(bar, name="", path=""):
     """Exports the in-memory bar (list of sample dicts) as an excel sheet with 'Bar', and 'Acquisitions' sheets.
         exports with a fixed pattern to path out_date_name.xlsx
+        the file is written in a single streaming pass, with the spreadsheet version set as the title
     Parameters
     ----------
     bar : list of dict
@@ -695,71 +672,48 @@ def save_samplesxlsx(bar, name="", path=""):
     path : str/path
         export path
     """
-    switch = {
-        "RSoXS Sample Outboard-Inboard": "x",
-        "RSoXS Sample Up-Down": "y",
-        "RSoXS Sample Downstream-Upstream": "z",
-        "RSoXS Sample Rotation": "th",
-        "x": "x",
-        "y": "y",
-        "z": "z",
-        "th": "th",
-    }
-
-    for samp in bar:
-        for acq in samp.get("acq_history", []):
-            for arg in acq["arguments"]:
-                if isinstance(acq["arguments"][arg], np.ndarray):
-                    acq["arguments"][arg] = list(acq["arguments"][arg])
-
     filename = path + f'out_{datetime.today().strftime("%Y-%m-%d_%H-%M-%S")}_{name}.xlsx'
 
-    ## PK: Why is this here twice?  There is something similar in load_samplexlsx as well.
-    for samp in bar:
-        for acq in samp.get("acq_history", []):
-            for arg in acq["arguments"]:
-                if isinstance(acq["arguments"][arg], np.ndarray):
-                    acq["arguments"][arg] = list(acq["arguments"][arg])
-
-    acqlist = []
-    for i, sam in enumerate(bar):
-        for acq in sam["acquisitions"]:
-            acq.update({"sample_id": sam["sample_id"]})
-            cleanacq = deepcopy(empty_acq) ## Sorting the acquisition parameters into a format that can be entered into the spreadsheet
-            for key in acq:
-                cleanacq[key] = acq[key]
-                """
-                if isinstance(acq[key], (str)):
-                    cleanacq[key] = acq[key]
-                else:
-                    cleanacq[key] = orjson.dumps(dict(acq[key])) #cleanacq[key] = json.dumps(acq[key]) ## This is causing JSON serialization issues
-                """
-            acqlist.append(cleanacq)
-    sampledf = pd.DataFrame.from_dict(bar, orient="columns") ## PK: Why is this line present if it is overwritten below?
-    df_bar = deepcopy(sampledf)
-    testdict = df_bar.to_dict(orient="records")
-    cleanbar = []
-    for i, sam in enumerate(testdict):
-        if "acq_history" not in testdict[i].keys():
-            testdict[i]["acq_history"] = []
-        elif isinstance(testdict[i]["acq_history"], str):
-            testdict[i]["acq_history"] = []
-        del testdict[i]["acquisitions"]
-        cleansam = deepcopy(empty_sample)
-        cleansam.update(testdict[i])
-        cleanbar.append(cleansam)
-
-    sampledf = pd.DataFrame.from_dict(cleanbar, orient="columns")
-    acqdf = pd.DataFrame.from_dict(acqlist, orient="columns")
-    writer = pd.ExcelWriter(filename)
-    sampledf.to_excel(writer, index=False, sheet_name="Bar")
-    acqdf.to_excel(writer, index=False, sheet_name="Acquisitions")
-    writer.close()
-
-    excel_file = load_workbook(filename)
-    excel_file.properties.title = current_version
-    excel.save_workbook(excel_file, filename)
-    excel_file.close()
+    ## Columns are the template parameters first, then any others in the order they first appear
+    ## A parameter which some samples (or acquisitions) have is left empty for the others, while one that none of
+    ## them have gets the template value
+    sample_keys = list(dict.fromkeys(key for sam in bar for key in sam if key != "acquisitions"))
+    sample_columns = list(empty_sample) + [key for key in sample_keys if key not in empty_sample]
+    acquisitions = [(sam["sample_id"], acq) for sam in bar for acq in sam["acquisitions"]]
+    acq_columns = list(empty_acq) + [
+        key for key in dict.fromkeys(key for _, acq in acquisitions for key in acq) if key not in empty_acq
+    ]
+
+    def sample_row(sam):
+        for key in sample_columns:
+            if key == "acq_history" and (not isinstance(sam.get(key), list)):
+                yield _excel_cell([])  # histories which are missing or were read as text are not kept
+            elif key in sam:
+                yield _excel_cell(sam[key])
+            elif key in sample_keys:
+                yield None
+            else:
+                yield _excel_cell(empty_sample[key])
+
+    def acq_row(sample_id, acq):
+        for key in acq_columns:
+            if key == "sample_id":
+                yield _excel_cell(sample_id)
+            else:
+                yield _excel_cell(acq.get(key, empty_acq.get(key)))
+
+    workbook = Workbook(write_only=True)
+    workbook.properties.title = current_version
+    bar_sheet = workbook.create_sheet("Bar")
+    bar_sheet.append(sample_columns)
+    for sam in bar:
+        bar_sheet.append(list(sample_row(sam)))
+    acq_sheet = workbook.create_sheet("Acquisitions")
+    acq_sheet.append(acq_columns)
+    for sample_id, acq in acquisitions:
+        acq_sheet.append(list(acq_row(sample_id, acq)))
+    workbook.save(filename)
+    workbook.close()
 
 
 def convertSampleSheetExcelMediaWiki(
@@ -802,35 +756,84 @@ def convertSampleSheetExcelMediaWiki(
     str
         A string containing the formatted table ready to copy-paste into MediaWiki
     """
+    return "".join(
+        _mediaWikiFragments(
+            excelSheet,
+            paramsSheetToOutput,
+            rulesSheetName,
+            versionCell,
+            startRow_Params,
+            endRow_Params,
+            startColumn_Params,
+            endColumn_Params,
+            verbose,
+        )
+    )
 
-    if verbose:
-        print("-" * 5 + " Start Log" + "-" * 5)
-        print("\tExtracting Sheet Version...", end=" ")
 
-    # Step 1: Extract Version Cell and add to wiki table header
-    ## Split versionCell in (row, column)
-    versRow, versColumn = [
-        int("".join(filter(str.isdigit, versionCell))),
-        "".join(filter(str.isalpha, versionCell)),
-    ]
+def writeSampleSheetMediaWiki(
+    fileHandle,
+    excelSheet: Path = None,
+    paramsSheetToOutput: str = "all",
+    rulesSheetName: str = "SheetRulesAndMetaData",
+    versionCell: str = "B4",
+    startRow_Params: int = 7,
+    endRow_Params: int = None,
+    startColumn_Params: str = "A",
+    endColumn_Params: str = "F",
+    verbose: bool = False,
+) -> int:
+    """Streams the MediaWiki tables of convertSampleSheetExcelMediaWiki to an open text file handle, row by row.
 
-    ## Extract Version Code as a string
-    versionStr = load_workbook(excelSheet).properties.title
-    # print(versionStr)
+    Useful for large metadata sheets, as the full output string is never held in memory.
 
-    ## Get Current Date
-    date.today()
+    Parameters
+    ----------
+    fileHandle: file-like
+        Open text file (or anything with a write method) that receives the wiki text
+    excelSheet: Path
+        Path (or string) to the excel sheet to be loaded.
 
-    ## Add Wiki Page Header to Output string
-    outStr = (
-        f"== SST-1 Sample Sheet Syntax Version: {versionStr} Last Updated: {date.today()} ==\n"
-    )
-    if verbose:
-        print(f"Pass!\n\t\tVersion Number is -> {versionStr}")
+    All other parameters are the same as for convertSampleSheetExcelMediaWiki.
+
+    Returns
+    -------
+    int
+        Number of characters written
+    """
+    numChars = 0
+    for fragment in _mediaWikiFragments(
+        excelSheet,
+        paramsSheetToOutput,
+        rulesSheetName,
+        versionCell,
+        startRow_Params,
+        endRow_Params,
+        startColumn_Params,
+        endColumn_Params,
+        verbose,
+    ):
+        fileHandle.write(fragment)
+        numChars += len(fragment)
+    return numChars
+
+
+def _mediaWikiFragments(
+    excelSheet,
+    paramsSheetToOutput,
+    rulesSheetName,
+    versionCell,
+    startRow_Params,
+    endRow_Params,
+    startColumn_Params,
+    endColumn_Params,
+    verbose,
+):
+    """Generates the MediaWiki output as a sequence of string fragments (header, then one fragment per table row)"""
 
-    # Step 2: Extract Metadata Table from Excel Sheet
     if verbose:
-        print("\tExtracting Sheet Metadata...")
+        print("-" * 5 + " Start Log" + "-" * 5)
+        print("\tExtracting Sheet Version...", end=" ")
 
     ## If endRow_Params is provided, limit the number of rows parsed
     if endRow_Params is None:
@@ -841,13 +844,22 @@ def convertSampleSheetExcelMediaWiki(
     ## Convert column bounds to string
     colString = startColumn_Params + ":" + endColumn_Params
 
-    excelMetadataIn = pd.read_excel(
-        excelSheet,
-        sheet_name=rulesSheetName,
-        header=startRow_Params - 1,
-        nrows=numRows,
-        usecols=colString,
-    )
+    # Step 1 and 2: Open the workbook once, read the version from the document properties and the metadata table
+    with pd.ExcelFile(excelSheet, engine="openpyxl") as excelFile:
+        ## Extract Version Code as a string
+        versionStr = excelFile.book.properties.title
+        if verbose:
+            print(f"Pass!\n\t\tVersion Number is -> {versionStr}")
+            print("\tExtracting Sheet Metadata...")
+        excelMetadataIn = excelFile.parse(
+            sheet_name=rulesSheetName,
+            header=startRow_Params - 1,
+            nrows=numRows,
+            usecols=colString,
+        )
+
+    ## Add Wiki Page Header to Output
+    yield f"== SST-1 Sample Sheet Syntax Version: {versionStr} Last Updated: {date.today()} ==\n"
 
     ## Drop empty rows (where 'Sheet' is NaN)
     excelMetadataIn = excelMetadataIn.dropna(subset="Sheet")
@@ -855,10 +867,6 @@ def convertSampleSheetExcelMediaWiki(
     excelMetadataIn = excelMetadataIn.replace("nan", "")
     excelMetadataIn = excelMetadataIn.fillna(" ")
 
-    ###display(excelMetadataIn)
-
-    ## Build MediaWiki Tables
-
     ## Get list of unique sheets for which we have metadata
     sheetList = excelMetadataIn.Sheet.unique()
 
@@ -875,51 +883,144 @@ def convertSampleSheetExcelMediaWiki(
     if verbose:
         print(f"\t\tOutputting tables for: {sheetListToRun}...")
 
-    # Create subset dataframes
-    dataframeList = []
-    for sheetName in sheetListToRun:
-        dataframeList.append(excelMetadataIn[excelMetadataIn.Sheet == sheetName])
-
-    ###print(dataframeList[1])
+    ## Clean every cell at once: cast to string and flatten line breaks, which would otherwise break the wiki table
+    sheetColumn = excelMetadataIn.Sheet
+    excelMetadataIn = excelMetadataIn.astype(str).replace(r"[\r\n]", " ", regex=True)
+    colHeaders = [str(colHeader).replace("\r", " ").replace("\n", " ") for colHeader in excelMetadataIn.columns]
 
     ## Make one table per value in the 'Sheet' column
-    for excelMetadataFrame in dataframeList:
-        excelMetadataFrame.reset_index(drop=True, inplace=True)
-        outStr += "\n" + r'{| class="wikitable sortable"' + "\n" + "|-\n"
-
-        # Add header row elements
-        outStr += "! "
-        for colHeader in excelMetadataFrame.columns:
-            filteredColHeader = str(colHeader).replace("\r", " ").replace("\n", " ")
-            outStr += f"{filteredColHeader} !! "
+    for sheetName in sheetListToRun:
+        yield "\n" + r'{| class="wikitable sortable"' + "\n" + "|-\n" + "! " + " !! ".join(colHeaders)
+        # Add Metadata Row Elements
+        for mdRow in excelMetadataIn[(sheetColumn == sheetName).to_numpy()].itertuples(index=False, name=None):
+            yield "\n|-\n| " + " || ".join(mdRow)
+        # Add MediaWiki Table End
+        yield "\n|}\n"
 
-        # trim extra "!! "
-        outStr = outStr[:-4]
+    if verbose:
+        print("-" * 5 + " End Log. Copy text below this line into the wiki" + "-" * 5)
 
-        ###display(excelMetadataFrame)
 
-        # Add Metadata Row Elements
+class ParamValidator:
+    """Validator built once from a matchType and validValues / invalidValues, which can then test many values cheaply
 
-        ## Loop through metadata rows
-        for mdRow in excelMetadataFrame.index:
-            ###Loop through columns
-            outStr += "\n|-\n| "
-            ###print(mdRow)
-            for mdVal in excelMetadataFrame.iloc[mdRow].to_list():
-                filteredmdVal = str(mdVal).replace("\r", " ").replace("\n", " ")
-                outStr += f"{filteredmdVal} || "
-                ###print(f"\t{mdVal}")
-            # trim extra " || " at the end of each line
-            outStr = outStr[:-4]
+    Test against validValues is made first, then against invalidValues. You can use this to define complex numerical ranges.
 
-        # Add MediaWiki Table End
-        outStr += "\n|}\n"
-        # print(outStr)
+    Parameters
+    ----------
+    matchType : str, optional
+        Match method, by default 'exact'
+        'exact' casts input as string returns True if input is in validValues and not in invalidValues
+        'numeric' attempts to cast input as float and returns True if value is within the validValues range and not in the invalidValues range
+    validValues : list, optional
+        A list of valid match values or a two-element list specifying a numeric interval to return True, by default None
+    invalidValues : list, optional
+        A list of invalid match values or a two-element list specifying a numeric interval to return False for, by default None
+    """
 
-    if verbose:
-        print("-" * 5 + " End Log. Copy text below this line into the wiki" + "-" * 5)
+    def __init__(self, matchType: str = "exact", validValues: list = None, invalidValues: list = None):
+        self.matchType = matchType.lower()
+        if self.matchType == "exact":
+            # cast validValues and invalidValues as str inside lists
+            if validValues is not None:
+                if not isinstance(validValues, list):
+                    validValues = [validValues]
+                validValues = frozenset(str(i) for i in validValues)
+            if invalidValues is not None:
+                if not isinstance(invalidValues, list):
+                    invalidValues = [invalidValues]
+                invalidValues = frozenset(str(i) for i in invalidValues)
+        elif self.matchType == "numeric":
+            # Check that they are two element lists and cast them as float
+            if validValues is not None:
+                if not isinstance(validValues, list) or len(validValues) != 2:
+                    raise ValueError(
+                        "If 'numeric' match is requested, validValues must be a 2-element list"
+                        " specifying a numeric range"
+                    )
+                validValues = (float(validValues[0]), float(validValues[1]))
+            if invalidValues is not None:
+                if not isinstance(invalidValues, list) or len(invalidValues) != 2:
+                    raise ValueError(
+                        "If 'numeric' match is requested, invalidValues must be a 2-element list"
+                        " specifying a numeric range"
+                    )
+                invalidValues = (float(invalidValues[0]), float(invalidValues[1]))
+        else:
+            raise ValueError("Invalid matchType provided")
+        self.validValues = validValues
+        self.invalidValues = invalidValues
+
+    def __call__(self, testVal):
+        """Tests whether a single value is valid, lists should be expanded outside of this function"""
+        # Make sure parameter to validate is not a list
+        # This rule is so that useful output is forced in the calling function
+        if isinstance(testVal, list):
+            raise ValueError("This function only validates single values, not lists")
+
+        isValid = True
+        if self.matchType == "exact":
+            testVal = str(testVal)
+            if self.validValues is not None:
+                isValid = testVal in self.validValues
+            if self.invalidValues is not None:
+                isValid = isValid and (testVal not in self.invalidValues)
+        else:
+            testVal = float(testVal)
+            if self.validValues is not None:
+                isValid = self.validValues[0] <= testVal and testVal <= self.validValues[1]
+            if self.invalidValues is not None:
+                isValid = isValid and not (self.invalidValues[0] <= testVal and testVal <= self.invalidValues[1])
+        return isValid
 
-    return outStr
+    def check(self, values):
+        """Tests an array (or list) of values at once
+
+        Unlike calling the validator, lists and values that cannot be cast for a numeric match are reported as
+        invalid rather than raising.
+
+        Parameters
+        ----------
+        values : array-like
+            values to validate
+
+        Returns
+        -------
+        numpy.ndarray of bool
+            True where the corresponding value is valid
+        """
+        if self.matchType == "exact":
+            objects = np.ravel(np.asarray(values, dtype=object))
+            testVals = np.array([str(i) for i in objects], dtype=object)
+            isValid = np.array([not isinstance(i, list) for i in objects], dtype=bool)
+            if self.validValues is not None:
+                isValid &= np.isin(testVals, list(self.validValues))
+            if self.invalidValues is not None:
+                isValid &= ~np.isin(testVals, list(self.invalidValues))
+            return isValid
+
+        castable = None
+        try:
+            testVals = np.asarray(values, dtype=float).ravel()
+        except (TypeError, ValueError):
+            # Cast one at a time so that a single bad entry only invalidates itself
+            objects = np.ravel(np.asarray(values, dtype=object))
+            testVals = np.full(objects.shape, np.nan)
+            castable = np.zeros(objects.shape, dtype=bool)
+            for index, value in enumerate(objects):
+                try:
+                    testVals[index] = float(value)
+                    castable[index] = True
+                except (TypeError, ValueError):
+                    pass
+        isValid = np.ones(testVals.shape, dtype=bool)
+        if self.validValues is not None:
+            isValid &= (self.validValues[0] <= testVals) & (testVals <= self.validValues[1])
+        if self.invalidValues is not None:
+            isValid &= ~((self.invalidValues[0] <= testVals) & (testVals <= self.invalidValues[1]))
+        if castable is not None:
+            isValid &= castable
+        return isValid
 
 
 def isParamValid(
@@ -928,6 +1029,7 @@ def isParamValid(
     """Tests whether the testVal is valid based on matchType and both the validValues list and invalidValues list (if provided)
 
     Test against validValues is made first, then against invalidValues. You can use this to define complex numerical ranges.
+    When validating many values against the same rules, build a ParamValidator once and reuse it instead.
 
     Parameters
     ----------
@@ -942,55 +1044,49 @@ def isParamValid(
     invalidValues : list, optional
         A list of invalid match values or a two-element list specifying a numeric interval to return False for, by default None
     """
+    return ParamValidator(matchType, validValues, invalidValues)(testVal)
 
-    # Make sure parameter to validate is not a list
-    # This rule is so that useful output is forced in the calling function
-    if isinstance(testVal, list):
-        raise ValueError("This function only validates single values, not lists")
-
-    isValid = True
-
-    # Check exact match
-    if matchType.lower() == "exact":
-        # Compare against validValues
-        if validValues is not None:
-            # cast validValues as str inside lists
-            if not isinstance(validValues, list):
-                validValues = [validValues]
-            validValues = [str(i) for i in validValues]
-            isValid = str(testVal) in validValues
-        if invalidValues is not None:
-            # cast validValues as str inside lists
-            if not isinstance(invalidValues, list):
-                invalidValues = [invalidValues]
-            invalidValues = [str(i) for i in invalidValues]
-            isValid = isValid and (str(testVal) not in invalidValues)
 
-        return isValid
-    elif matchType.lower() == "numeric":
-        testVal = float(testVal)
-        # Compare against validValues
-        if validValues is not None:
-            # Check that it is a two element list
-            if not isinstance(validValues, list) or len(validValues) != 2:
-                raise ValueError(
-                    "If 'numeric' match is requested, validValues must be a 2-element list"
-                    " specifying a numeric range"
-                )
-            # Cast validValues as float inside lists
-            validValues = [float(i) for i in validValues]
-            isValid = validValues[0] <= testVal and testVal <= validValues[1]
-        # Compare against invalidValues
-        if invalidValues is not None:
-            # Check that it is a two element list
-            if not isinstance(invalidValues, list) or len(invalidValues) != 2:
-                raise ValueError(
-                    "If 'numeric' match is requested, invalidValues must be a 2-element list"
-                    " specifying a numeric range"
-                )
-            # Cast invalidValues as float inside lists
-            invalidValues = [float(i) for i in invalidValues]
-            isValid = isValid and not (invalidValues[0] <= testVal and testVal <= invalidValues[1])
-    else:
-        raise ValueError("Invalid matchType provided")
-    return isValid
+# Validators for sample angles, built once and shared by every load
+grazingAngleValidator = ParamValidator("numeric", validValues=list(grazing_angle_range))
+transmissionAngleValidator = ParamValidator("numeric", validValues=list(transmission_angle_range))
+
+
+def warnInvalidAngles(angleEntries, headerText):
+    """Validates every requested angle of a sheet in one comparison per geometry and warns about invalid ones
+
+    Parameters
+    ----------
+    angleEntries : list of tuple
+        (row, sample_id, grazing, angle) for each angle to be tested
+    headerText : str
+        first line of the warning for each row with invalid angles, formatted with row and sample_id
+    """
+    if len(angleEntries) == 0:
+        return
+    rows, sampleIDs, grazing, _ = zip(*angleEntries)
+    grazing = np.array(grazing, dtype=bool)
+    angles = np.empty(len(angleEntries), dtype=object)  # filled element-wise so nested values stay intact
+    angles[:] = [entry[3] for entry in angleEntries]
+    isValid = np.empty(len(angles), dtype=bool)
+    isValid[grazing] = grazingAngleValidator.check(angles[grazing])
+    isValid[~grazing] = transmissionAngleValidator.check(angles[~grazing])
+
+    invalidAngleText = {}
+    for index in np.flatnonzero(~isValid):
+        row = rows[index]
+        if row not in invalidAngleText:
+            invalidAngleText[row] = headerText.format(row=row, sample_id=sampleIDs[index])
+        if grazing[index]:
+            invalidAngleText[row] += (
+                f"\tInvalid Angle: {angles[index]} . For grazing samples, angle must be"
+                f" between {grazing_angle_range[0]} and {grazing_angle_range[1]}\n"
+            )
+        else:
+            invalidAngleText[row] += (
+                f"\tInvalid Angle: {angles[index]} . For transmission samples, angle"
+                f" must be between {transmission_angle_range[0]} and {transmission_angle_range[1]}\n"
+            )
+    for text in invalidAngleText.values():
+        warnings.resetwarnings()
+        warnings.warn(text, stacklevel=3)
@@ -0,0 +1,55 @@
+from pathlib import Path
+
+import pytest
+
+import rsoxs_scans.spreadsheets
+from rsoxs_scans.acquisition import dryrun_bar, precheck_bar_envelope
+from rsoxs_scans.spreadsheets import load_samplesxlsx
+
+example = Path(__file__).parents[2] / "example" / "Sample_Bar_v2023_2.xlsx"
+
+
+@pytest.fixture
+def bar(monkeypatch):
+    monkeypatch.setattr(
+        rsoxs_scans.spreadsheets, "get_proposal_info", lambda proposal: ("session", "/analysis", "saf", {})
+    )
+    return load_samplesxlsx(example)
+
+
+def motor_errors(bar):
+    ## (sample, acquisition) of every acquisition whose dry run has a motor limit error
+    where = {
+        acq["uid"]: (samp_num, acq_num)
+        for samp_num, sample in enumerate(bar)
+        for acq_num, acq in enumerate(sample["acquisitions"])
+        if "uid" in acq
+    }
+    errors = set()
+    for entry in dryrun_bar(bar, print_dry_run=False):
+        for step in entry["steps"]:
+            text = step["description"]
+            if step["action"] == "error" and ("vaild range" in text or "clash" in text):
+                errors.add(where[entry["uid"]])
+    return errors
+
+
+@pytest.mark.filterwarnings("ignore")
+@pytest.mark.parametrize(
+    "y0, zoff, expected",
+    [
+        (0, 0, set()),
+        (400, 0, {(0, 0), (0, 22), (1, 20)}),
+        ## x leaves its range at angle 80 with this offset, so only one of the first sample's angle lists fails
+        (0, 15, {(0, 0)}),
+    ],
+)
+def test_precheck_matches_dry_run(bar, y0, zoff, expected):
+    for sample in bar:
+        sample["bar_loc"].update(x0=0, y0=y0, xoff=0, zoff=0)
+    bar[0]["bar_loc"]["zoff"] = zoff
+    bar[0]["acquisitions"][0]["angles"] = [0, 80]
+    bar[0]["acquisitions"][22]["angles"] = [0, 20]
+    problems = {(problem["sample_num"], problem["acq_num"]) for problem in precheck_bar_envelope(bar)}
+    assert problems == expected
+    assert motor_errors(bar) == expected
@@ -0,0 +1,65 @@
+import pickle
+
+import pytest
+
+from rsoxs_scans.acquisition import get_acq_details, select_group_acquisitions
+from rsoxs_scans.acquisition_queue import AcquisitionQueue
+
+
+def make_queue():
+    return AcquisitionQueue(
+        {
+            "acq_index": i,
+            "uid": f"uid-{i}",
+            "sample_id": ["a", "b"][i % 2],
+            "configuration": ["SAXS", "WAXS", "WAXS"][i % 3],
+            "group": ["Morning", "all"][i // 3],
+            "steps": [{"queue_step": 0, "acq_index": i}, {"queue_step": 1, "acq_index": i}],
+        }
+        for i in range(6)
+    )
+
+
+def test_lookups_and_views():
+    queue = make_queue()
+    assert queue.by_acq_index(4)["uid"] == "uid-4"
+    assert queue.by_uid("uid-3")["acq_index"] == 3
+    assert [entry["acq_index"] for entry in queue.by_sample("b")] == [1, 3, 5]
+    assert [entry["acq_index"] for entry in queue.by_group("MORNING")] == [0, 1, 2]
+    assert [entry["acq_index"] for entry in queue.by_configuration("WAXS")] == [1, 2, 4, 5]
+    view = queue[2:4]
+    assert isinstance(view, AcquisitionQueue) and view.by_uid("uid-2") is queue[2]
+    with pytest.raises(KeyError):
+        view.by_acq_index(0)
+    assert pickle.loads(pickle.dumps(queue)).by_uid("uid-5")["acq_index"] == 5
+
+
+def test_lookups_follow_changes():
+    queue = make_queue()
+    queue.by_uid("uid-0")
+    del queue[0]
+    with pytest.raises(KeyError):
+        queue.by_uid("uid-0")
+    queue.append({"acq_index": 9, "uid": "uid-9", "steps": []})
+    assert queue.by_acq_index(9)["uid"] == "uid-9"
+
+
+def test_get_acq_details_joins_repeated_indexes():
+    queue = [{"acq_index": 1, "steps": [{"queue_step": 0}]}, {"acq_index": 1, "steps": [{"queue_step": 1}]}]
+    assert get_acq_details(1, queue, printOutput=False) == [{"queue_step": 0}, {"queue_step": 1}]
+
+
+def test_group_selection_lists_each_acquisition_once():
+    bar = [
+        {"acquisitions": [{"group": "Night"}, {"group": "all"}, {}]},
+        {"acquisitions": [{"group": "morning"}, {"group": "Night"}]},
+    ]
+    assert select_group_acquisitions(bar, ["Morning", "night"]) == [(0, 0, 1), (0, 1, 0), (1, 0, 0), (1, 1, 1)]
+    assert select_group_acquisitions(bar, ["night", "all"]) == [
+        (0, 0, 0),
+        (0, 0, 1),
+        (0, 1, 1),
+        (1, 0, 2),
+        (1, 1, 0),
+    ]
+    assert len(select_group_acquisitions(bar)) == 5
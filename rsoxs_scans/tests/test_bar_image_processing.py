@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+import rsoxs_scans.bar_image_processing as bar_image_processing
+from rsoxs_scans.bar_image_processing import build_image_pyramid, load_pyramid_level, stitch_images, stitch_sample
+
+
+def concatenated(images, pixel_overlap, y_off):
+    ## how the bar images used to be stitched
+    result = images[0][0]
+    for i, (image,) in enumerate(images[1:], start=1):
+        if y_off > 0:
+            result = np.concatenate((image[(y_off * i) :, :], result[:-(y_off), pixel_overlap:]), axis=1)
+        elif y_off < 0:
+            result = np.concatenate((image[: (y_off * i), :], result[-(y_off):, pixel_overlap:]), axis=1)
+        else:
+            result = np.concatenate((image[:, :], result[:, pixel_overlap:]), axis=1)
+    return result
+
+
+@pytest.mark.parametrize("y_off", [0, 2, -2])
+def test_stitch_matches_concatenation(y_off):
+    rng = np.random.default_rng(0)
+    images = [(rng.integers(0, 255, (20, 30, 3), dtype=np.uint8),) for _ in range(4)]
+    np.testing.assert_array_equal(stitch_images(images, 12, y_off), concatenated(images, 12, y_off))
+
+
+def test_stitch_into_memmap(tmp_path):
+    rng = np.random.default_rng(1)
+    images = [(rng.integers(0, 255, (20, 30, 3), dtype=np.uint8),) for _ in range(3)]
+    path = tmp_path / "bar.npy"
+    result = stitch_images(images, 12, 2, memmap_path=str(path))
+    assert isinstance(result, np.memmap)
+    np.testing.assert_array_equal(np.load(path), concatenated(images, 12, 2))
+
+
+def test_pyramid_levels(tmp_path):
+    image = np.arange(16 * 24, dtype=np.uint16).reshape(16, 24)
+    pyramid = build_image_pyramid(image, factors=(2, 4), path_prefix=str(tmp_path / "bar"))
+    np.testing.assert_allclose(pyramid[2], image.reshape(8, 2, 12, 2).mean(axis=(1, 3)))
+    np.testing.assert_allclose(pyramid[4], image.reshape(4, 4, 6, 4).mean(axis=(1, 3)))
+    region = load_pyramid_level(str(tmp_path / "bar"), 4, (slice(4, 12), slice(None, 8)))
+    np.testing.assert_array_equal(region, pyramid[4][1:3, :2])
+
+
+def test_stitch_sample_plots_pyramid_in_image_dtype(monkeypatch):
+    plotted = []
+    monkeypatch.setattr(bar_image_processing, "plot_bar_image", plotted.append)
+    images = [(np.full((8, 2464, 3), 200, dtype=np.uint8),) for _ in range(2)]
+    result = stitch_sample(images, 25, 0, pyramid_levels=(2, 4))
+    assert plotted[0].dtype == np.uint8 and plotted[0].shape == (2, result.shape[1] // 4, 3)
+    assert (plotted[0] == 200).all()
+    assert stitch_sample(images, 25, 0, plot=False).shape == result.shape
+    assert bar_image_processing.sample_image_pyramid == {}  # no pyramid unless asked for
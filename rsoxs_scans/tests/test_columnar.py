@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from rsoxs_scans.columnar import (  # noqa: E402
+    save_bar_arrow,
+    load_bar_arrow,
+    load_queue_arrow,
+    bar_to_tables,
+    queue_to_tables,
+)
+
+
+def make_bar():
+    return [
+        {
+            "sample_id": "a",
+            "location": [{"motor": "x", "position": 1.5}, {"motor": "th", "position": 90}],
+            "acquisitions": [
+                {"type": "rsoxs", "polarizations": [0, 90], "edge": "carbon"},
+                {"type": "nexafs", "polarizations": [0.5], "edge": [270, 280], "group": "Morning"},
+            ],
+        },
+        {"sample_id": "b", "location": [], "acquisitions": []},
+    ]
+
+
+def make_queue():
+    return [
+        {
+            "acq_index": 0,
+            "uid": "u0",
+            "steps": [
+                {"description": "diode\n", "action": "diode_high", "queue_step": 0},
+                {
+                    "description": "scan\n",
+                    "action": "rsoxs_scan_core",
+                    "kwargs": {
+                        "energies": np.array([270.0, 280.0]),
+                        "times": np.array([1.0, 2.0]),
+                        "md": {"a": 1},
+                        "locations": [[{"motor": "x", "position": 0.5}, {"motor": "y", "position": 0}]],
+                    },
+                    "queue_step": 1,
+                },
+            ],
+        }
+    ]
+
+
+@pytest.mark.parametrize("file_format", ["arrow", "parquet"])
+def test_round_trip(tmp_path, file_format):
+    bar, queue = make_bar(), make_queue()
+    save_bar_arrow(bar, tmp_path, queue, file_format=file_format)
+    loaded = load_bar_arrow(tmp_path)
+    assert loaded == bar
+    ## ints stay ints where the column also holds floats, and keys missing from a row stay missing
+    assert type(loaded[0]["acquisitions"][0]["polarizations"][0]) is int
+    assert "group" not in loaded[0]["acquisitions"][0]
+    loaded_queue = load_queue_arrow(tmp_path)
+    assert "kwargs" not in loaded_queue[0]["steps"][0]
+    kwargs = loaded_queue.by_uid("u0")["steps"][1]["kwargs"]
+    assert isinstance(kwargs["energies"], np.ndarray) and kwargs["energies"].tolist() == [270.0, 280.0]
+    assert kwargs["md"] == {"a": 1}
+
+
+def test_locations_are_arrow_lists():
+    pa = pytest.importorskip("pyarrow")
+    location = pa.list_(pa.struct([("motor", pa.string()), ("position", pa.float64())]))
+    samples, acquisitions = bar_to_tables(make_bar())
+    assert samples.schema.field("location").type == location
+    queue, steps = queue_to_tables(make_queue())
+    assert steps.schema.field("kwargs.locations").type == pa.list_(location)
@@ -0,0 +1,30 @@
+import pytest
+
+from rsoxs_scans import constructor
+from rsoxs_scans.constructor import get_nexafs_scan_params
+from rsoxs_scans.defaults import VersionedTable
+
+
+def test_nexafs_scan_params_follow_edited_and_replaced_tables(monkeypatch):
+    params, time = get_nexafs_scan_params("carbon", 1, (1, 1, 1), quiet=True)
+    assert params[0][:2] == (250, 282)
+    ## the cached parameters are copied out, so changing them doesn't change the next lookup
+    params.append(None)
+    assert len(get_nexafs_scan_params("carbon", 1, (1, 1, 1), quiet=True)[0]) == 3
+
+    edited = VersionedTable(constructor.nexafs_edges)
+    monkeypatch.setattr(constructor, "nexafs_edges", edited)
+    edited["carbon"] = (260, 282, 297, 350)
+    assert get_nexafs_scan_params("carbon", 1, (1, 1, 1), quiet=True)[0][0][:2] == (260, 282)
+
+    monkeypatch.setattr(constructor, "nexafs_edges", VersionedTable(carbon=(270, 282, 297, 350)))
+    params, time = get_nexafs_scan_params("carbon", 1, (1, 1, 1), quiet=True)
+    assert params[0][:2] == (270, 282)
+    assert time == pytest.approx(80)
+
+    ## edits to a plain dict can't be seen, so it is never cached
+    plain = {"carbon": (280, 282, 297, 350)}
+    monkeypatch.setattr(constructor, "nexafs_edges", plain)
+    assert get_nexafs_scan_params("carbon", 1, (1, 1, 1), quiet=True)[0][0][:2] == (280, 282)
+    plain["carbon"] = (281, 282, 297, 350)
+    assert get_nexafs_scan_params("carbon", 1, (1, 1, 1), quiet=True)[0][0][:2] == (281, 282)
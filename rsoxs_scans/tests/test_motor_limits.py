@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from rsoxs_scans.defaults import motor_limits
+from rsoxs_scans.motor_limits import check_locations, location_errors, pack_locations
+
+
+def location(**positions):
+    return [{"motor": motor, "position": position} for motor, position in positions.items()]
+
+
+@pytest.mark.parametrize("motor, name", [("x", "X"), ("y", "Y"), ("z", "Z"), ("temz", "TEMz")])
+def test_each_motor_limit(motor, name):
+    low, high = motor_limits[motor]
+    ## y is kept above the TEY clash height so only the limit being tested can fail
+    inside = [location(**{"y": 50, motor: low}), location(**{"y": 50, motor: high})]
+    outside = [location(**{"y": 50, motor: low - 0.1}), location(**{"y": 50, motor: high + 0.1})]
+    check = check_locations(inside + outside)
+    assert check["violations"][motor].tolist() == [False, False, True, True]
+    assert not any(mask.any() for other, mask in check["violations"].items() if other != motor)
+    assert location_errors(check_locations(inside)) == ""
+    assert location_errors(check_locations(outside[1:])) == f"{name} motor is out of vaild range\n"
+
+
+def test_missing_motors_are_not_checked():
+    check = check_locations([location(th=0), location(x=None, temz=None)])
+    assert np.isnan(check["positions"]).sum() == 9
+    assert location_errors(check) == ""
+    assert np.isnan(pack_locations([location(x=None)])).all()
+
+
+@pytest.mark.parametrize(
+    "locations, clash",
+    [
+        ([location(y=10, temz=120)], [True]),
+        ([location(y=10, temz=50), location(y=50, temz=120)], [True, True]),
+        ([location(y=50, temz=50), location(y=10, temz=50), location(y=50, temz=120)], [False, True, True]),
+        ([location(y=20, temz=120)], [False]),
+        ([location(y=10, temz=100)], [False]),
+        ([location(y=10), location(temz=120)], [True, True]),
+    ],
+)
+def test_tey_clash(locations, clash):
+    check = check_locations(locations)
+    assert check["clash"].tolist() == clash
+    expected = "potential clash between TEY and sample bar\n" if any(clash) else ""
+    assert location_errors(check) == expected
@@ -0,0 +1,48 @@
+from rsoxs_scans.planner import plan_beamtime, priority_value
+
+
+def entry(uid, configuration, acq_time, priority):
+    return {
+        "uid": uid,
+        "configuration": configuration,
+        "acq_time": acq_time,
+        "priority": priority,
+        "sample_priority": 1,
+        "steps": [{"action": "do_scan", "acq_index": 0}],
+    }
+
+
+def test_plan_drops_configuration_not_worth_changing_to():
+    queue = [entry("b", "WAXS", 50, 2)] + [entry(f"a{i}", "SAXS", 200, 1) for i in range(4)]
+    ## taking b first (the most value per second) leaves room for only three of the SAXS acquisitions
+    plan, spill_over = plan_beamtime(queue, 120 + 4 * 200, config_change_time=120)
+    assert [acq["uid"] for acq in plan] == ["a0", "a1", "a2", "a3"]
+    assert [acq["uid"] for acq in spill_over] == ["b"]
+    assert [acq["time_before"] for acq in plan] == [120, 320, 520, 720]
+    assert plan[-1]["total_queue_time"] == 920 and plan[-1]["time_after"] == 0
+    assert [acq["steps"][0]["acq_index"] for acq in plan] == [0, 1, 2, 3]
+    assert queue[1]["steps"][0]["acq_index"] == 0  # the queue passed in isn't changed
+
+
+def test_plan_groups_configurations():
+    queue = [entry(str(i), ["SAXS", "WAXS"][i % 2], 100, i) for i in range(10)]
+    plan, spill_over = plan_beamtime(queue, 10000)
+    assert not spill_over
+    assert sum(a["configuration"] != b["configuration"] for a, b in zip(plan, plan[1:])) == 1
+    assert plan[-1]["total_queue_time"] == 10 * 100 + 2 * 120
+
+
+def test_plan_with_ties_and_no_configuration():
+    queue = [entry("a", None, 10, 1), entry("b", "SAXS", 10, 1)]
+    plan, spill_over = plan_beamtime(queue, 130, config_change_time=120)
+    assert [acq["uid"] for acq in plan] == ["a"]
+    assert [acq["uid"] for acq in spill_over] == ["b"]
+
+
+def test_blank_priority_is_the_default():
+    assert priority_value(1, float("nan")) == priority_value(1, 50) == priority_value(1, "high")
+    assert priority_value(float("inf"), 1) == priority_value(50, 1)
+    queue = [entry("a", "SAXS", 10, float("nan")), entry("b", "SAXS", 10, 60), entry("c", "SAXS", 10, 40)]
+    plan, spill_over = plan_beamtime(queue, 140, config_change_time=120)
+    assert [acq["uid"] for acq in plan] == ["c", "a"]
+    assert [acq["uid"] for acq in spill_over] == ["b"]
@@ -0,0 +1,35 @@
+import numpy as np
+
+from rsoxs_scans.queue_patch import diff_queues, apply_queue_patch, patch_report
+from rsoxs_scans.serialization import content_key, dumps_json, loads_json
+
+
+def entry(uid, acq_index, priority=50):
+    md = {"sample_id": "s1", "acquisitions": [{"uid": uid, "priority": priority}]}
+    steps = [
+        {"action": "load_sample", "acq_index": acq_index, "kwargs": {"sample": md}},
+        {
+            "action": "do_scan",
+            "acq_index": acq_index,
+            "kwargs": {"energies": np.linspace(270, 340, 200), "md": md},
+        },
+    ]
+    return {"uid": uid, "acq_index": acq_index, "priority": priority, "steps": steps}
+
+
+def test_patch_rebuilds_new_queue():
+    old = [entry(uid, index) for index, uid in enumerate("abcde")]
+    new = [entry(uid, index) for index, uid in enumerate("bacxe")]
+    new[3]["priority"] = 10
+
+    ops = diff_queues(old, new)
+    kinds = [op["op"] for op in ops]
+    assert kinds.count("delete") == 1 and kinds.count("insert") == 1
+    assert kinds.count("move") == 1  # b, c, e are already in order, only a moves
+    ## the receiver holds the queue as JSON
+    patched = apply_queue_patch(loads_json(dumps_json(old)), loads_json(dumps_json(ops)))
+    assert content_key(patched) == content_key(new)
+    assert diff_queues(new, new) == []
+
+    report = patch_report(new, ops, print_report=False)
+    assert report["saved_bytes"] == report["full_bytes"] - report["patch_bytes"] > 0
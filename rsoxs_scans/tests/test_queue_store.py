@@ -0,0 +1,57 @@
+import pytest
+
+from rsoxs_scans.queue_patch import diff_queues
+from rsoxs_scans.queue_store import QueueStore, MemoryBackend, SQLiteBackend
+
+
+def make_queue(uids):
+    return [
+        {"uid": uid, "acq_index": index, "steps": [{"action": "do_scan", "kwargs": {"energies": [270.0, 280.0]}}]}
+        for index, uid in enumerate(uids)
+    ]
+
+
+@pytest.mark.parametrize("backend", [MemoryBackend, SQLiteBackend])
+def test_store_save_status_and_patch(backend):
+    store = QueueStore(backend())
+    old = make_queue(["a", "b", "c"])
+    store.save_queue("bar1", old)
+    assert store.load_queue("bar1") == old
+    assert store.queue_names() == ["bar1"]
+
+    store.set_status("bar1", {"b": "Started"})
+    assert store.statuses("bar1") == {"b": "Started"}
+    assert store.load_queue("bar1", uids=["b"])[0]["acquire_status"] == "Started"
+
+    new = make_queue(["b", "d", "a"])
+    store.apply_patch("bar1", diff_queues(old, new))
+    assert [entry["uid"] for entry in store.load_queue("bar1")] == ["b", "d", "a"]
+    assert store.load_queue("bar1", uids=["d"])[0] == new[1]
+    assert store.statuses("bar1") == {"b": "Started"}
+
+    store.save_queue("bar1", make_queue(["b"]))  # the status of b is kept, the keys of a and d are removed
+    assert store.statuses("bar1") == {"b": "Started"}
+    assert len(store.backend.keys("rsoxs_queue:bar1:")) == 3
+    store.delete_queue("bar1")
+    assert store.queue_names() == []
+    with pytest.raises(KeyError):
+        store.load_queue("bar1")
+
+
+def test_patch_keeps_status_set_while_it_is_applied():
+    class StatusDuringRead(MemoryBackend):
+        ## another client marks "a" as finished just after the patch reads the entries
+        def mget(self, keys):
+            values = super().mget(keys)
+            if any(":acq:" in key for key in keys):
+                self.mset({"rsoxs_queue:bar1:status:a": b'"Finished"'})
+            return values
+
+    store = QueueStore(StatusDuringRead())
+    old = make_queue(["a", "b"])
+    store.save_queue("bar1", old)
+    store.set_status("bar1", {"a": "Started"})
+    new = make_queue(["b", "a"])
+    store.apply_patch("bar1", diff_queues(old, new))
+    assert store.statuses("bar1") == {"a": "Finished"}
+    assert [entry["acq_index"] for entry in store.load_queue("bar1")] == [0, 1]
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from rsoxs_scans.rsoxs import rotate_sample, rotated_positions, sanitize_angles
+
+## includes angles outside of the -155 to 195 motor range, and ones which are not numbers
+angles = [0, 10, 45, -45, 90, 135, 180, 200, -160, 250, 20.5, None, "normal"]
+
+
+def make_sample(angle, front, grazing, x0):
+    return {
+        "angle": angle,
+        "front": front,
+        "grazing": grazing,
+        "bar_loc": {"x0": x0, "y0": 1.0, "xoff": 0.3, "zoff": 0.2},
+        "location": [],
+    }
+
+
+@pytest.mark.parametrize("front", [True, False])
+@pytest.mark.parametrize("grazing", [True, False])
+@pytest.mark.parametrize("x0", [-5.0, 0.5])
+@pytest.mark.parametrize("force", [False, True])
+def test_rotated_positions_match_rotate_sample(front, grazing, x0, force):
+    requested = [angle for angle in angles if isinstance(angle, (int, float))] if force else angles
+    bar_loc = make_sample(None, front, grazing, x0)["bar_loc"]
+    th, x, filled = rotated_positions(requested, bar_loc, front, grazing, force)
+    for i, angle in enumerate(requested):
+        sample = make_sample(angle, front, grazing, x0)
+        rotate_sample(sample, force)
+        positions = {motor["motor"]: motor["position"] for motor in sample["location"]}
+        assert th[i] == pytest.approx(positions["th"])
+        assert x[i] == pytest.approx(positions["x"])
+        assert positions["y"] == 1.0
+        if not force:
+            assert filled[i] == sample["angle"]
+    assert th.tolist() == sanitize_angles(requested, front, grazing, x0, force)[0].tolist()
+
+
+def test_sanitize_angles_keeps_old_theta_positions():
+    ## theta positions from the original one-sample-at-a-time sanitize_angle
+    th, filled = sanitize_angles(angles, front=True, grazing=False, x0=-5.0)
+    expected = [180, 170, -135, 135, -90, 135, 180, -150, -150, -110, 159.5, 180, 180]
+    np.testing.assert_allclose(th, expected)
+    assert filled[-2:] == [180, 180]
+    th, _ = sanitize_angles(angles, front=False, grazing=True, force=True)
+    np.testing.assert_allclose(th, [0, 10, 45, -45, 90, 135, 180, 110, 110, 160, 20.5, 110, 110])
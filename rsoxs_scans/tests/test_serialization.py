@@ -0,0 +1,82 @@
+import json
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import rsoxs_scans.spreadsheets
+from rsoxs_scans.acquisition import dryrun_bar
+from rsoxs_scans.spreadsheets import load_samplesxlsx
+from rsoxs_scans.serialization import (
+    NumpyEncoder,
+    benchmark_serialization,
+    content_key,
+    dumps_queue,
+    dumps_queue_binary,
+    load_queue_binary,
+    loads_queue,
+    loads_queue_binary,
+    save_queue_binary,
+)
+
+example = Path(__file__).parents[2] / "example" / "Sample_Bar_v2023_2.xlsx"
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    monkeypatch.setattr(
+        rsoxs_scans.spreadsheets, "get_proposal_info", lambda proposal: ("session", "/analysis", "saf", {})
+    )
+    return dryrun_bar(load_samplesxlsx(example))
+
+
+def step_arrays(queue):
+    return [
+        value
+        for entry in queue
+        for step in entry["steps"]
+        for value in step.get("kwargs", {}).values()
+        if isinstance(value, np.ndarray)
+    ]
+
+
+@pytest.mark.filterwarnings("ignore")
+def test_identical_arrays_are_shared(queue):
+    arrays = step_arrays(queue)
+    shared = {}
+    for array in arrays:
+        assert not array.flags.writeable
+        first = shared.setdefault((array.dtype.str, array.shape, array.tobytes()), array)
+        assert array is first
+    assert len(shared) < len(arrays)
+
+    text = dumps_queue(queue)
+    assert len(json.loads(text)["arrays"]) == len(shared)
+    loaded = loads_queue(text)
+    assert content_key(loaded) == content_key(list(queue))
+    assert {id(array) for array in step_arrays(loaded)} == {id(array) for array in shared.values()}
+
+
+@pytest.mark.filterwarnings("ignore")
+def test_binary_round_trip(queue, tmp_path):
+    expected = content_key(list(queue))
+    loaded = loads_queue_binary(dumps_queue_binary(queue))
+    assert content_key(loaded) == expected
+    save_queue_binary(queue, tmp_path / "queue.rsxq")
+    loaded = load_queue_binary(tmp_path / "queue.rsxq")
+    assert content_key(loaded) == expected
+    arrays = step_arrays(loaded)
+    assert arrays and not any(array.flags.writeable for array in arrays)
+
+
+@pytest.mark.filterwarnings("ignore")
+def test_numpy_encoder(queue):
+    step = {"energies": np.arange(3.0), "time": np.float32(0.5), "uid": uuid.UUID(int=1)}
+    assert json.loads(json.dumps(step, cls=NumpyEncoder)) == {
+        "energies": [0.0, 1.0, 2.0],
+        "time": 0.5,
+        "uid": "00000000-0000-0000-0000-000000000001",
+    }
+    results = benchmark_serialization(queue, num_acquisitions=4, repeats=1, print_report=False)
+    assert set(results) == {"json", "json shared arrays", "orjson", "binary"}
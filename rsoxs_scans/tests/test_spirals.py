@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from bluesky.plan_patterns import spiral_square_pattern
+
+from rsoxs_scans.acquisition import est_scan_time
+from rsoxs_scans.spirals import dryrun_spiral_plan, spiral_square_points, raster_points, scan_points_time
+
+
+@pytest.mark.parametrize("diameter_x, diameter_y", [(1.8, 1.8), (2.1, 2.1), (0.9, 1.5), (1.2, 0.3)])
+def test_spiral_matches_bluesky(diameter_x, diameter_y):
+    step = 0.3
+    x_num, y_num = round(diameter_x / step) + 1, round(diameter_y / step) + 1
+    pattern = spiral_square_pattern("x", "y", 1, -2, diameter_x, diameter_y, x_num, y_num)
+    expected = [(point["x"], point["y"]) for point in pattern]
+    np.testing.assert_allclose(spiral_square_points(step, diameter_x, diameter_y, center=(1, -2)), expected)
+
+
+def test_raster_and_time():
+    points = raster_points(0.5, 1.0, 0.5)
+    assert points.tolist() == [[-0.5, -0.25], [0, -0.25], [0.5, -0.25], [0.5, 0.25], [0, 0.25], [-0.5, 0.25]]
+    ## 6 exposures and overheads, 5 moves of 0.5 mm at 1 mm/s with 0.1 s to settle each
+    time = scan_points_time(points, 2, point_overhead=1, motor_speed=1, settle_time=0.1)
+    assert time == pytest.approx(18 + 2.5 + 0.5)
+
+
+def test_dryrun_and_estimate_use_spiral_dimensions():
+    acq = {
+        "type": "spiral",
+        "edge": 270,
+        "exposure_time": 1,
+        "polarizations": [0],
+        "spiral_dimensions": [0.3, 0.6, 3.0],
+    }
+    points = spiral_square_points(0.3, 0.6, 3.0)
+    assert len(points) == 3 * 11
+    scan_time = scan_points_time(points, 1)
+    ## one spiral plus the 30 s estimated for the polarization change
+    assert est_scan_time(acq) == pytest.approx(scan_time + 30)
+    outputs = dryrun_spiral_plan(**acq, md={"RSoXS_Main_DET": "saxs_det"})
+    assert outputs[-1]["action"] == "spiral_scan_core"
+    assert f"{len(points)} points, about {round(scan_time / 60, 1)} minutes" in outputs[-1]["description"]
+    assert outputs[-1]["kwargs"]["spiral_dimensions"] == [0.3, 0.6, 3.0]
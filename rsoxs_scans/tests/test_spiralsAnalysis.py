@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from rsoxs_scans.spiralsAnalysis import (
+    pickLocationsFromSpirals,
+    pickLocationsFromSpirals_Batch,
+    rankSpiralLocations,
+)
+
+
+class MockArray:
+    ## Stands in for a tiled array, recording which parts are read
+    def __init__(self, values, reads):
+        self.values = np.asarray(values)
+        self.reads = reads
+
+    def __getitem__(self, item):
+        self.reads.append(item)
+        return self.values[item]
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def read(self):
+        raise AssertionError("whole columns should not be read")
+
+
+def make_catalog(reads):
+    return {
+        100: {
+            "primary": {
+                "data": {
+                    "RSoXS Sample Outboard-Inboard": MockArray(np.arange(20) * 0.1, reads),
+                    "RSoXS Sample Up-Down": MockArray(np.arange(20) * -0.2, reads),
+                }
+            },
+            "baseline": {
+                "data": {
+                    "RSoXS Sample Downstream-Upstream": MockArray([1.5, 1.6], reads),
+                    "RSoXS Sample Rotation": MockArray([180.0, 181.0], reads),
+                }
+            },
+        },
+        200: {
+            "primary": {
+                "data": {
+                    "manipulator_x": MockArray(np.arange(20) + 5.0, reads),
+                    "manipulator_y": MockArray(np.arange(20) + 7.0, reads),
+                }
+            },
+            "baseline": {
+                "data": {"manipulator_z": MockArray([0.2], reads), "manipulator_r": MockArray([90.0], reads)}
+            },
+        },
+    }
+
+
+def make_configuration():
+    return [
+        {"sample_id": "a", "sample_name": "A", "location": [], "acquisitions": [{"scan_type": "rsoxs"}]},
+        {"sample_id": "b", "sample_name": "B", "location": [], "acquisitions": []},
+    ]
+
+
+def test_batch_picks_read_only_slices():
+    reads = []
+    configuration = pickLocationsFromSpirals_Batch(
+        make_configuration(), make_catalog(reads), [("a", 100, [3, 8]), ("b", 200, [0])], keyCache={}
+    )
+    assert [sample["sample_id"] for sample in configuration] == ["a", "b", "a_1"]
+    assert configuration[0]["location"] == [
+        {"motor": "x", "position": pytest.approx(0.3)},
+        {"motor": "y", "position": pytest.approx(-0.6)},
+        {"motor": "th", "position": 180.0},
+        {"motor": "z", "position": 1.5},
+    ]
+    assert configuration[2]["sample_name"] == "A_1"
+    assert configuration[2]["location"][0]["position"] == pytest.approx(0.8)
+    assert configuration[1]["location"][:2] == [{"motor": "x", "position": 5.0}, {"motor": "y", "position": 7.0}]
+    ## Copies do not share acquisitions with the original sample
+    assert configuration[2]["acquisitions"] is not configuration[0]["acquisitions"]
+    assert slice(3, 9) in reads and slice(0, 1) in reads
+
+
+def test_single_sample_wrapper_and_key_cache():
+    keyCache = {}
+    catalog = make_catalog([])
+    configuration = pickLocationsFromSpirals(make_configuration(), "b", catalog, 100, [1])
+    assert configuration[1]["location"][0]["position"] == pytest.approx(0.1)
+    pickLocationsFromSpirals_Batch(make_configuration(), catalog, [("a", 200, [2])], keyCache=keyCache)
+    assert keyCache[200]["x"] == ("primary", "manipulator_x")
+
+
+def test_negative_indices_count_from_the_end():
+    reads = []
+    configuration = pickLocationsFromSpirals_Batch(
+        make_configuration(), make_catalog(reads), [("a", 100, [-1, 2])]
+    )
+    assert configuration[0]["location"][0]["position"] == pytest.approx(1.9)
+    assert configuration[2]["location"][0]["position"] == pytest.approx(0.2)
+    assert slice(2, 20) in reads
+    with pytest.raises(IndexError):
+        pickLocationsFromSpirals_Batch(make_configuration(), make_catalog([]), [("a", 100, [-21])])
+
+
+def test_rank_spiral_locations():
+    images = np.full((5, 20, 30), 10, dtype=np.uint16)
+    images[1] += 50  ## brightest, but saturated below
+    images[1, :3, :3] = 65535
+    images[3] += 20
+    images[4, 10, :] += 2000  ## a streak, so strongly anisotropic
+    best, scores = rankSpiralLocations(images, numberLocations=2, chunkSize=2)
+    assert best == [4, 3]
+    assert scores["saturationFraction"][1] == pytest.approx(9 / 600)
+    assert scores["anisotropy"][4] > 0.5 > scores["anisotropy"][0]
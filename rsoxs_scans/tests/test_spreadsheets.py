@@ -0,0 +1,130 @@
+import io
+from copy import deepcopy
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+import rsoxs_scans.spreadsheets
+from rsoxs_scans.spreadsheets import (
+    ParamValidator,
+    convertSampleSheetExcelMediaWiki,
+    empty_acq,
+    empty_sample,
+    isParamValid,
+    load_samplesxlsx,
+    save_samplesxlsx,
+    writeSampleSheetMediaWiki,
+)
+
+example = Path(__file__).parents[2] / "example" / "Sample_Bar_v2023_2.xlsx"
+
+mixed = ["WAXS", "waxs", "1", 1, 1.0, True, False, "True", None, np.nan, "45.5", 45.5, -20, 100, "abc", [1, 2]]
+
+
+def single(value, *rules):
+    ## isParamValid raises for lists and for non-numbers in a numeric match, which check reports as invalid
+    try:
+        return isParamValid(value, *rules)
+    except (TypeError, ValueError):
+        return False
+
+
+@pytest.mark.parametrize(
+    "rules",
+    [
+        ("exact", ["WAXS", "SAXS", 1, True]),
+        ("exact", None, ["WAXS", 1.0, None]),
+        ("numeric", [-14, 90]),
+        ("numeric", [0, 180], [40, 50]),
+    ],
+)
+def test_check_matches_isParamValid(rules):
+    validator = ParamValidator(*rules)
+    expected = [single(value, *rules) for value in mixed]
+    values = np.empty(len(mixed), dtype=object)
+    values[:] = mixed
+    assert validator.check(values).tolist() == expected
+    assert validator.check(mixed[:-1]).tolist() == expected[:-1]
+    if rules[0] == "numeric":
+        numbers = [value for value in mixed if isinstance(value, (int, float))]
+        assert validator.check(np.array(numbers)).tolist() == [single(value, *rules) for value in numbers]
+
+
+def old_media_wiki(excelSheet):
+    ## how the wiki text used to be built, one row (and one string concatenation) at a time
+    outStr = f"== SST-1 Sample Sheet Syntax Version: {load_workbook(excelSheet).properties.title} "
+    outStr += f"Last Updated: {date.today()} ==\n"
+    metadata = pd.read_excel(excelSheet, sheet_name="SheetRulesAndMetaData", header=6, usecols="A:F")
+    metadata = metadata.dropna(subset="Sheet").replace("nan", "").fillna(" ")
+    for sheetName in metadata.Sheet.unique():
+        frame = metadata[metadata.Sheet == sheetName].reset_index(drop=True)
+        outStr += "\n" + r'{| class="wikitable sortable"' + "\n" + "|-\n" + "! "
+        for colHeader in frame.columns:
+            outStr += str(colHeader).replace("\r", " ").replace("\n", " ") + " !! "
+        outStr = outStr[:-4]
+        for mdRow in frame.index:
+            outStr += "\n|-\n| "
+            for mdVal in frame.iloc[mdRow].to_list():
+                outStr += str(mdVal).replace("\r", " ").replace("\n", " ") + " || "
+            outStr = outStr[:-4]
+        outStr += "\n|}\n"
+    return outStr
+
+
+def test_media_wiki_matches_old_output():
+    expected = old_media_wiki(example)
+    assert convertSampleSheetExcelMediaWiki(example, verbose=False) == expected
+    output = io.StringIO()
+    assert writeSampleSheetMediaWiki(output, example) == len(expected)
+    assert output.getvalue().encode() == expected.encode()
+
+
+def old_save(bar, filename):
+    ## how the bar used to be exported, through pandas data frames
+    bar = deepcopy(bar)
+    acqlist = []
+    for sam in bar:
+        for acq in sam["acquisitions"]:
+            acq.update({"sample_id": sam["sample_id"]})
+            cleanacq = deepcopy(empty_acq)
+            cleanacq.update(acq)
+            acqlist.append(cleanacq)
+    cleanbar = []
+    for sam in pd.DataFrame.from_dict(bar, orient="columns").to_dict(orient="records"):
+        if not isinstance(sam.get("acq_history", []), list):
+            sam["acq_history"] = []
+        sam.setdefault("acq_history", [])
+        del sam["acquisitions"]
+        cleansam = deepcopy(empty_sample)
+        cleansam.update(sam)
+        cleanbar.append(cleansam)
+    with pd.ExcelWriter(filename) as writer:
+        pd.DataFrame.from_dict(cleanbar, orient="columns").to_excel(writer, index=False, sheet_name="Bar")
+        pd.DataFrame.from_dict(acqlist, orient="columns").to_excel(writer, index=False, sheet_name="Acquisitions")
+
+
+def sheet_values(filename):
+    ## every row is padded to the width of the sheet, empty cells are None
+    workbook = load_workbook(filename)
+    return {sheet.title: [list(row) for row in sheet.iter_rows(values_only=True)] for sheet in workbook}
+
+
+@pytest.mark.filterwarnings("ignore")
+def test_save_matches_old_export(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        rsoxs_scans.spreadsheets, "get_proposal_info", lambda proposal: ("session", "/analysis", "saf", {})
+    )
+    bar = load_samplesxlsx(example)
+    old_save(bar, tmp_path / "old.xlsx")
+    save_samplesxlsx(bar, name="new", path=f"{tmp_path}/")
+    (filename,) = tmp_path.glob("out_*_new.xlsx")
+    new, old = sheet_values(filename), sheet_values(tmp_path / "old.xlsx")
+    assert list(new) == ["Bar", "Acquisitions"]
+    for sheet in new:
+        assert new[sheet][0] == old[sheet][0]  # headers
+        assert new[sheet][1:] == old[sheet][1:]
+    assert load_workbook(filename).properties.title == rsoxs_scans.spreadsheets.current_version
@@ -0,0 +1,165 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+from rsoxs_scans.validation import (
+    samplesSchema_Compiled,
+    acquisitionsSchema_Compiled,
+    validateDataFrame,
+    checkDataFrame,
+)
+from rsoxs_scans.configuration_load_save_sanitize import (
+    acquisitionParameters_Default,
+    sanitizeAcquisition,
+    sanitizeAcquisitions,
+    sanitizeSamples,
+)
+import rsoxs_scans.spreadsheets
+from rsoxs_scans.spreadsheets import load_samplesxlsx, save_samplesxlsx
+
+example = Path(__file__).parents[2] / "example" / "Sample_Bar_v2023_2.xlsx"
+
+
+def make_samples():
+    sample = {
+        "bar_name": "bar",
+        "sample_id": "s1",
+        "sample_name": "one",
+        "project_name": "proj",
+        "institution": "NIST",
+        "proposal_id": 123,
+        "bar_spot": "1A",
+        "front": True,
+        "grazing": False,
+        "angle": 0,
+        "height": 0.5,
+        "sample_priority": 1,
+    }
+    return pd.DataFrame([sample, dict(sample, sample_id="s2", grazing=True, angle=10)])
+
+
+def test_valid_samples_pass():
+    errors, warnings = validateDataFrame(make_samples().iloc[:1], samplesSchema_Compiled)
+    assert errors == []
+    assert warnings == []
+
+
+def test_all_sample_errors_reported_together():
+    samples = make_samples().astype(object)
+    samples.loc[0, "front"] = "yes"
+    samples.loc[1, "height"] = -1
+    errors, warnings = validateDataFrame(samples, samplesSchema_Compiled)
+    assert errors == ["front for row 0 must be TRUE or FALSE", "height for row 1 must be 0 or larger"]
+    ## grazing angle below 20 is only a warning, the sample is reset to normal incidence later
+    assert len(warnings) == 1 and warnings[0].startswith("angle for row 1")
+
+
+def test_missing_required_column():
+    errors, _ = validateDataFrame(make_samples().drop(columns="bar_spot"), samplesSchema_Compiled)
+    assert errors == [
+        "bar_spot for row 0 is a required parameter and is missing",
+        "bar_spot for row 1 is a required parameter and is missing",
+    ]
+
+
+def test_acquisition_rules():
+    acquisitions = pd.DataFrame(
+        [
+            {
+                "sample_id": "s1",
+                "configuration_instrument": "WAXS",
+                "scan_type": "rsoxs",
+                "energy_list_parameters": "carbon_RSoXS",
+                "polarizations": [0, 90],
+            },
+            {
+                "sample_id": "s1",
+                "configuration_instrument": "SAXS",
+                "scan_type": "spiral",
+                "energy_list_parameters": 270,
+                "polarizations": [-1, 200],
+                "spiral_dimensions": [0.3, 1.8],
+                "exposure_time": 20,
+            },
+        ]
+    )
+    errors, _ = validateDataFrame(
+        acquisitions, acquisitionsSchema_Compiled, defaults=acquisitionParameters_Default
+    )
+    assert errors == [
+        "configuration_instrument for row 1 is not a valid configuration_instrument",
+        "polarizations for row 1 must be -1 or between 0 and 180",
+        "exposure_time for row 1 must be between 0.001 and 10 s",
+        "spiral_dimensions for row 1 must be a list of 3 elements, [step_size, diameter_x, diameter_y]",
+    ]
+    with pytest.raises(ValueError, match="4 invalid entries"):
+        checkDataFrame(acquisitions, acquisitionsSchema_Compiled, "Acquisitions", acquisitionParameters_Default)
+
+
+def test_sanitize_samples_uses_schema(recwarn, capsys):
+    samples = make_samples().to_dict(orient="records")
+    ## PASS values from an earlier load, so nothing is looked up
+    previous = [
+        dict(sample, data_session="pass-123", analysis_dir="/sst/", SAF=1, proposal={}) for sample in samples
+    ]
+    configuration = sanitizeSamples(samples, previousConfiguration=previous)
+    assert [sample["angle"] for sample in configuration] == [0, 90]
+    ## the invalid angle is reported once, by the schema check
+    assert len(recwarn) == 1 and "angle for row 1" in str(recwarn[0].message)
+    assert capsys.readouterr().out == ""
+
+    samples[0]["front"] = "yes"
+    del samples[1]["height"]
+    with pytest.raises(ValueError, match="2 invalid entries"):
+        sanitizeSamples(samples, previousConfiguration=previous)
+
+
+def test_blank_angle_defaults_to_normal_incidence(recwarn):
+    samples = make_samples().to_dict(orient="records")
+    for sample in samples:
+        sample["angle"] = None
+    previous = [
+        dict(sample, data_session="pass-123", analysis_dir="/sst/", SAF=1, proposal={}) for sample in samples
+    ]
+    configuration = sanitizeSamples(samples, previousConfiguration=previous)
+    assert [sample["angle"] for sample in configuration] == [0, 90]
+    assert len(recwarn) == 1
+    assert "angle for row 0 is blank" in str(recwarn[0].message)
+    assert "angle for row 1 is blank" in str(recwarn[0].message)
+
+
+def test_sanitize_acquisitions_uses_schema():
+    configuration = [{"sample_id": "s1"}]
+    acquisition = {
+        "sample_id": "s1",
+        "configuration_instrument": "WAXS",
+        "scan_type": "spiral",
+        "energy_list_parameters": 270,
+        "polarizations": 90,
+    }
+    (sanitized,) = sanitizeAcquisitions([acquisition], configuration)
+    assert sanitized["polarizations"] == [90] and sanitized["spiral_dimensions"] == [0.3, 1.8, 1.8]
+    with pytest.raises(ValueError, match="exposure_time for row 1"):
+        sanitizeAcquisitions([acquisition, dict(acquisition, exposure_time=20)], configuration)
+    with pytest.raises(ValueError, match="scan_type for row 0"):
+        sanitizeAcquisition(dict(acquisition, scan_type="step"))
+
+
+@pytest.mark.filterwarnings("ignore")
+def test_bar_sheet_uses_sample_schema(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        rsoxs_scans.spreadsheets, "get_proposal_info", lambda proposal: ("session", "/", "saf", {})
+    )
+    ## a sheet exported by save_samplesxlsx has no formulas, so it can be edited here with openpyxl
+    save_samplesxlsx(load_samplesxlsx(example), name="schema", path=f"{tmp_path}/")
+    (filename,) = tmp_path.glob("out_*_schema.xlsx")
+    workbook = load_workbook(filename)
+    sheet = workbook["Bar"]
+    header = [cell.value for cell in sheet[1]]
+    sheet.cell(2, header.index("height") + 1, -1)
+    sheet.cell(3, header.index("front") + 1, "yes")
+    workbook.save(filename)
+    with pytest.raises(ValueError, match="Bar sheet has 2 invalid entries"):
+        load_samplesxlsx(filename)
@@ -0,0 +1,97 @@
+from pathlib import Path
+
+import pytest
+from openpyxl import load_workbook
+
+import rsoxs_scans.spreadsheets
+from rsoxs_scans.spreadsheets import load_samplesxlsx, save_samplesxlsx
+from rsoxs_scans.watch import SpreadsheetWatcher
+from rsoxs_scans.fingerprint import reuse_identities
+
+example = Path(__file__).parents[2] / "example" / "Sample_Bar_v2023_2.xlsx"
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    calls = []
+
+    def get_proposal_info(proposal):
+        calls.append(proposal)
+        return "session", "/analysis", "saf", {}
+
+    monkeypatch.setattr(rsoxs_scans.spreadsheets, "get_proposal_info", get_proposal_info)
+    return calls
+
+
+@pytest.mark.filterwarnings("ignore")
+def test_watcher_reloads_changed_sheets(tmp_path, lookups):
+    ## a sheet exported by save_samplesxlsx has no formulas, so it can be edited here with openpyxl
+    save_samplesxlsx(load_samplesxlsx(example), name="watch", path=f"{tmp_path}/")
+    (filename,) = tmp_path.glob("out_*_watch.xlsx")
+    updates = []
+    watcher = SpreadsheetWatcher(filename, on_update=updates.append, debounce=0.5)
+
+    assert watcher.poll(now=0.0) is None  # first sight of the file, waiting for it to settle
+    assert watcher.poll(now=0.2) is None
+    first = watcher.poll(now=1.0)
+    assert first["changes"]["added"] and not first["changes"]["removed"]
+    lookups.clear()
+
+    workbook = load_workbook(filename)
+    sheet = workbook["Acquisitions"]
+    priority = [cell.value for cell in sheet[1]].index("priority") + 1
+    sheet.cell(2, priority).value = 99
+    workbook.save(filename)
+    watcher.poll(now=2.0)
+    update = watcher.poll(now=3.0)
+    assert "Acquisitions" in update["sheets"]
+    ## the edited acquisition keeps its uid
+    assert not update["changes"]["added"] and not update["changes"]["removed"]
+    assert len(update["changes"]["changed"]) == 1
+    assert update["changes"]["unchanged"] + len(update["changes"]["moved"]) == len(first["queue"]) - 1
+    assert updates == [first, update]
+    assert lookups == []  # PASS lookups are reused
+
+
+@pytest.mark.filterwarnings("ignore")
+def test_watcher_survives_a_half_written_file(tmp_path, lookups):
+    save_samplesxlsx(load_samplesxlsx(example), name="watch", path=f"{tmp_path}/")
+    (filename,) = tmp_path.glob("out_*_watch.xlsx")
+    data = filename.read_bytes()
+    filename.write_bytes(data[: len(data) // 2])
+    watcher = SpreadsheetWatcher(filename, debounce=0.5)
+
+    assert watcher.poll(now=0.0) is None
+    assert watcher.poll(now=1.0) is None and watcher.last_error is not None
+    assert watcher.hashes == {}
+    filename.unlink()
+    assert watcher.reload() is None and isinstance(watcher.last_error, FileNotFoundError)
+
+    filename.write_bytes(data)
+    watcher.poll(now=2.0)
+    update = watcher.poll(now=3.0)
+    assert watcher.last_error is None and len(update["changes"]["added"]) == len(update["queue"])
+
+
+def test_diff_bars_matches_edited_acquisitions(lookups):
+    bar = load_samplesxlsx(example)
+    previous = load_samplesxlsx(example)
+    sample = bar[0]
+    sample["acquisitions"][0]["priority"] = 99
+    removed = sample["acquisitions"].pop()
+    ## a new row in place of the removed one, sharing everything but the edge, is a different acquisition
+    replacement = {key: value for key, value in removed.items() if key != "uid"}
+    replacement["edge"] = "ca"
+    sample["acquisitions"].append(replacement)
+    ## the row numbers change when a row is inserted above
+    for acq in sample["acquisitions"]:
+        acq["Parameter/ Index"] += 1
+
+    changes = reuse_identities(previous, bar)
+    acquisitions = changes["acquisitions"]
+    assert changes["samples"]["modified"] == [] and changes["samples"]["added"] == []
+    assert [new for old, new in acquisitions["modified"]] == [sample["acquisitions"][0]]
+    assert sample["acquisitions"][0]["uid"] == previous[0]["acquisitions"][0]["uid"]
+    assert [acq["uid"] for acq in acquisitions["removed"]] == [previous[0]["acquisitions"][-1]["uid"]]
+    assert acquisitions["added"] == [replacement] and "uid" not in replacement
+    assert len(acquisitions["unchanged"]) == sum(len(s["acquisitions"]) for s in bar) - 2
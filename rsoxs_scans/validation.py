@@ -0,0 +1,365 @@
+"""Declarative validation schema for the Samples and Acquisitions sheets.
+
+Each schema maps a parameter name to a list of rules (types, ranges, enums, lengths, and conditions on other
+columns).  compileSchema turns a schema into checks that each operate on a whole DataFrame column at once, and
+validateDataFrame runs all of them so that every problem in a sheet is reported in one pass instead of stopping at
+the first bad row.
+"""
+
+# imports
+import numbers
+import warnings
+import numpy as np
+import pandas as pd
+from .defaults import grazing_angle_range, transmission_angle_range
+from .defaultEnergyParameters import energyListParameters
+
+
+## Rule keys understood by compileSchema
+## required: cell must be present and not blank
+## type: "string", "boolean", "integer", "number", "list", or a tuple of these.  Blank cells are not type checked.
+## range: (low, high) inclusive numeric interval.  Either bound can be None for an open interval.
+## allowed: tuple of valid values (enum)
+## length: exact number of elements for list values
+## elementRange, elementAllowed: numeric interval for every element of a list (or a single number), with extra
+##     individual values that are also accepted (e.g., -1 for polarizations)
+## check: callable applied to each non-blank value, returning True if the value is valid
+## when: {column: value or tuple of values}, the rule only applies to rows where the other column matches
+## severity: "error" (default) or "warning"
+## message: text appended to "<parameter> for row <index>" when the rule fails
+
+configurationsInstrument_Valid = (
+    "NoBeam",
+    "WAXS_OpenBeamImages",
+    "WAXSNEXAFS",
+    "WAXS",
+    "WAXS_LowFlux",
+)
+polarizationFrames_Valid = ("lab", "sample")
+scanTypes_Valid = ("time", "time2D", "spiral", "nexafs", "rsoxs")
+
+
+samplesSchema = {
+    "bar_name": [{"required": True, "type": "string", "message": "must be a string"}],
+    "sample_id": [{"required": True, "type": "string", "message": "must be a string"}],
+    "sample_name": [{"required": True, "type": "string", "message": "must be a string"}],
+    "project_name": [{"required": True, "type": "string", "message": "must be a string"}],
+    "institution": [{"required": True, "type": "string", "message": "must be a string"}],
+    "proposal_id": [
+        {"required": True, "type": "integer", "range": (0, None), "message": "must be a positive integer"}
+    ],
+    "bar_spot": [{"required": True, "type": "string", "message": "must be a string"}],
+    "front": [{"required": True, "type": "boolean", "message": "must be TRUE or FALSE"}],
+    "grazing": [{"required": True, "type": "boolean", "message": "must be TRUE or FALSE"}],
+    "angle": [
+        ## a blank angle is not an error, the sample is put at normal incidence like an out of range angle
+        {"required": True, "severity": "warning", "message": "is blank.  Defaulting to normal incidence."},
+        {
+            "when": {"grazing": True},
+            "type": "number",
+            "range": grazing_angle_range,
+            "severity": "warning",
+            "message": (
+                f"is not between {grazing_angle_range[0]} and {grazing_angle_range[1]} for a grazing sample."
+                "  Defaulting to normal incidence."
+            ),
+        },
+        {
+            "when": {"grazing": False},
+            "type": "number",
+            "range": transmission_angle_range,
+            "severity": "warning",
+            "message": (
+                f"is not between {transmission_angle_range[0]} and {transmission_angle_range[1]} for a"
+                " transmission sample.  Defaulting to normal incidence."
+            ),
+        },
+    ],
+    "height": [{"required": True, "type": "number", "range": (0, None), "message": "must be 0 or larger"}],
+    "sample_priority": [
+        {"required": True, "type": "integer", "range": (0, None), "message": "must be a positive integer"}
+    ],
+}
+
+
+acquisitionsSchema = {
+    "sample_id": [{"required": True}],
+    "configuration_instrument": [
+        {"allowed": configurationsInstrument_Valid, "message": "is not a valid configuration_instrument"}
+    ],
+    "scan_type": [{"allowed": scanTypes_Valid, "message": "is not a valid scan_type"}],
+    "polarization_frame": [{"allowed": polarizationFrames_Valid, "message": "is not a valid polarization_frame"}],
+    "polarizations": [
+        {
+            "type": ("number", "list"),
+            "elementRange": (0, 180),
+            "elementAllowed": (-1,),
+            "message": "must be -1 or between 0 and 180",
+        }
+    ],
+    "sample_angles": [{"type": ("number", "list"), "message": "must be a number or a list of numbers"}],
+    "exposure_time": [
+        {"type": "number", "message": "must be a single number"},
+        {"range": (0.001, 10), "message": "must be between 0.001 and 10 s"},
+    ],
+    "exposures_per_energy": [{"type": "number", "message": "must be a number"}],
+    "priority": [{"type": "number", "message": "must be a number"}],
+    "energy_list_parameters": [
+        {
+            "when": {"scan_type": ("time", "time2D", "spiral")},
+            "type": "number",
+            "message": "must be a single number",
+        },
+        {
+            "when": {"scan_type": ("nexafs", "rsoxs")},
+            "required": True,
+            "check": lambda value: not isinstance(value, str) or value in energyListParameters,
+            "message": "is not a valid energy plan",
+        },
+    ],
+    "spiral_dimensions": [
+        {
+            "when": {"scan_type": "spiral"},
+            "type": "list",
+            "length": 3,
+            "message": "must be a list of 3 elements, [step_size, diameter_x, diameter_y]",
+        }
+    ],
+}
+
+
+def _isType(value, typeName):
+    if typeName == "string":
+        return isinstance(value, str)
+    if typeName == "boolean":
+        return isinstance(value, (bool, np.bool_))
+    if typeName == "integer":
+        return isinstance(value, numbers.Integral) and not isinstance(value, (bool, np.bool_))
+    if typeName == "number":
+        return isinstance(value, numbers.Real) and not isinstance(value, (bool, np.bool_))
+    if typeName == "list":
+        return isinstance(value, (list, tuple))
+    raise ValueError(f"Unknown schema type {typeName}")
+
+
+def _typeMask(series, typeNames):
+    ## Use the column dtype where it already answers the question, otherwise check each cell once
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return pd.Series("boolean" in typeNames, index=series.index)
+    if pd.api.types.is_integer_dtype(series.dtype):
+        return pd.Series(("integer" in typeNames) or ("number" in typeNames), index=series.index)
+    if pd.api.types.is_float_dtype(series.dtype):
+        return pd.Series("number" in typeNames, index=series.index)
+    return series.map(lambda value: any(_isType(value, typeName) for typeName in typeNames)).astype(bool)
+
+
+def _rangeMask(values, bounds):
+    low, high = bounds
+    mask = values.notna()
+    if low is not None:
+        mask &= values >= low
+    if high is not None:
+        mask &= values <= high
+    return mask
+
+
+def _compileRule(parameter, rule):
+    typeNames = rule.get("type")
+    if isinstance(typeNames, str):
+        typeNames = (typeNames,)
+    required = rule.get("required", False)
+    when = rule.get("when", {})
+    when = {column: (values if isinstance(values, tuple) else (values,)) for column, values in when.items()}
+
+    def invalidMask(df):
+        ## Returns a boolean Series that is True for every row breaking this rule
+        if parameter not in df.columns:
+            if required and not when:
+                return pd.Series(True, index=df.index)
+            column = pd.Series(None, index=df.index, dtype=object)
+        else:
+            column = df[parameter]
+
+        applies = pd.Series(True, index=df.index)
+        for otherColumn, values in when.items():
+            if otherColumn not in df.columns:
+                return pd.Series(False, index=df.index)
+            applies &= df[otherColumn].isin(values)
+
+        blank = column.isna()
+        invalid = pd.Series(False, index=df.index)
+        if required:
+            invalid |= blank
+        present = applies & ~blank
+        if not present.any():
+            return invalid & applies
+
+        values = column[present]
+        valid = pd.Series(True, index=values.index)
+        if typeNames is not None:
+            valid &= _typeMask(values, typeNames)
+        if "range" in rule:
+            valid &= _rangeMask(pd.to_numeric(values, errors="coerce"), rule["range"])
+        if "allowed" in rule:
+            valid &= values.isin(rule["allowed"])
+        if "length" in rule:
+            valid &= values.map(lambda value: isinstance(value, (list, tuple)) and len(value) == rule["length"])
+        if "elementRange" in rule:
+            ## Check every element of every list in the column with a single comparison
+            elements = values.map(lambda value: value if isinstance(value, (list, tuple)) else [value]).explode()
+            numericElements = pd.to_numeric(elements, errors="coerce")
+            elementValid = _rangeMask(numericElements, rule["elementRange"])
+            elementValid |= numericElements.isin(rule.get("elementAllowed", ()))
+            elementValid |= elements.isna()  ## empty lists explode to a blank element
+            valid &= elementValid.groupby(level=0).all().reindex(values.index, fill_value=True)
+        if "check" in rule:
+            valid &= values.map(lambda value: bool(rule["check"](value))).astype(bool)
+
+        invalid.loc[values.index] |= ~valid
+        return invalid & applies
+
+    return {
+        "parameter": parameter,
+        "severity": rule.get("severity", "error"),
+        "message": rule.get("message", "is not valid"),
+        "required": required,
+        "invalidMask": invalidMask,
+    }
+
+
+def compileSchema(schema):
+    """Compiles a declarative schema into a list of column-wise checks.
+
+    Parameters
+    ----------
+    schema : dict
+        maps each parameter name to a rule dict or a list of rule dicts (see the rule keys at the top of this
+        module)
+
+    Returns
+    -------
+    list of dict
+        compiled checks, ready to be passed to validateDataFrame
+    """
+    compiledSchema = []
+    for parameter, rules in schema.items():
+        if isinstance(rules, dict):
+            rules = [rules]
+        for rule in rules:
+            compiledSchema.append(_compileRule(parameter, rule))
+    return compiledSchema
+
+
+def validateDataFrame(df, schema, defaults=None):
+    """Runs every check of a schema over a whole sheet and collects all of the problems found.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        sheet contents, one row per sample or acquisition
+    schema : dict or list of dict
+        declarative schema, or the output of compileSchema if the same schema is used repeatedly
+    defaults : dict, optional
+        values used in place of blank or missing cells before checking, by default None
+
+    Returns
+    -------
+    tuple (errors, warnings)
+        lists of strings describing each invalid cell, e.g., "proposal_id for row 3 must be a positive integer"
+    """
+    if isinstance(schema, dict):
+        schema = compileSchema(schema)
+    if defaults is not None:
+        df = df.copy()
+        for parameter, default in defaults.items():
+            if parameter not in df.columns:
+                df[parameter] = pd.Series([default] * len(df), index=df.index, dtype=object)
+            elif default is not None:
+                blank = df[parameter].isna()
+                if blank.any():
+                    df[parameter] = df[parameter].astype(object)
+                    df.loc[blank, parameter] = pd.Series([default] * int(blank.sum()), index=df.index[blank])
+
+    errors = []
+    warningsFound = []
+    for check in schema:
+        invalidRows = df.index[check["invalidMask"](df)]
+        for row in invalidRows:
+            missing = check["parameter"] not in df.columns or pd.isna(df.at[row, check["parameter"]])
+            if check["required"] and missing and check["severity"] == "error":
+                text = f"{check['parameter']} for row {row} is a required parameter and is missing"
+            else:
+                text = f"{check['parameter']} for row {row} {check['message']}"
+            if check["severity"] == "warning":
+                warningsFound.append(text)
+            elif text not in errors:
+                errors.append(text)
+    return errors, warningsFound
+
+
+def checkDataFrame(df, schema, sheetName="", defaults=None):
+    """Validates a sheet against a schema, warning about minor problems and raising once for all errors.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        sheet contents, one row per sample or acquisition
+    schema : dict or list of dict
+        declarative schema, or the output of compileSchema
+    sheetName : str, optional
+        sheet name used in the messages, by default ""
+    defaults : dict, optional
+        values used in place of blank or missing cells before checking, by default None
+
+    Raises
+    ------
+    ValueError
+        listing every invalid cell in the sheet
+    """
+    errors, warningsFound = validateDataFrame(df, schema, defaults=defaults)
+    if warningsFound:
+        warnings.warn(f"\n{sheetName} sheet warnings:\n\t" + "\n\t".join(warningsFound), stacklevel=2)
+    if errors:
+        raise ValueError(f"\n{sheetName} sheet has {len(errors)} invalid entries:\n\t" + "\n\t".join(errors))
+
+
+def invalidRows(df, schema, parameter):
+    """Index of the rows of a sheet which break any rule of a schema for one parameter.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        sheet contents, one row per sample or acquisition
+    schema : dict or list of dict
+        declarative schema, or the output of compileSchema
+    parameter : str
+        column to check
+
+    Returns
+    -------
+    pandas.Index
+        labels of the invalid rows, e.g., to replace their values after the problems have been reported
+    """
+    if isinstance(schema, dict):
+        schema = compileSchema(schema)
+    invalid = pd.Series(False, index=df.index)
+    for check in schema:
+        if check["parameter"] == parameter:
+            invalid |= check["invalidMask"](df)
+    return df.index[invalid]
+
+
+def parametersWithRule(schema, ruleKey, ruleValue=True):
+    """Lists the parameters of a schema which have a rule with the given key and value, in schema order."""
+    parameters = []
+    for parameter, rules in schema.items():
+        if isinstance(rules, dict):
+            rules = [rules]
+        if any(rule.get(ruleKey) == ruleValue and not rule.get("when") for rule in rules):
+            parameters.append(parameter)
+    return parameters
+
+
+## Compiled once at import so loading a spreadsheet only runs the checks
+samplesSchema_Compiled = compileSchema(samplesSchema)
+acquisitionsSchema_Compiled = compileSchema(acquisitionsSchema)
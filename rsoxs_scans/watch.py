@@ -0,0 +1,234 @@
+"""Watches a bar spreadsheet, and loads and dry runs it again whenever it is saved with changes
+
+The file is polled, and once it has stopped changing for the debounce time the value of every sheet is hashed.  If
+no sheet changed (e.g. the file was saved without edits) nothing is done.  Otherwise the bar is loaded again,
+reusing the PASS lookups from earlier loads, the acquisitions which are the same as before or were edited keep
+their uids (see fingerprint.diff_bars), and the bar is dry run again, reusing the steps of every acquisition which
+hasn't changed.  The update, with the new queue and the acquisitions added, removed, changed, and moved, is passed
+to a callback.
+"""
+
+# imports
+import os
+import time
+import hashlib
+import threading
+import warnings
+from io import BytesIO
+from pathlib import Path
+from openpyxl import load_workbook
+from .spreadsheets import load_samplesxlsx
+from .acquisition import dryrun_bar
+from .serialization import content_key, dumps_json
+
+
+## Queue entry values which depend on where the entry is in the queue rather than what it does
+queue_position_keys = ("acq_index", "total_acq", "time_before", "time_after", "total_queue_time")
+
+
+def sheet_hashes(data):
+    """
+    title of a workbook and a hash of the values in each of its sheets
+
+    Parameters
+    ----------
+    data : bytes or str or Path
+        contents of an xlsx file, or its path
+
+    Returns
+    -------
+    tuple
+        (workbook title, {sheet name: hash of the cell values})
+    """
+    if not isinstance(data, bytes):
+        data = Path(data).read_bytes()
+    workbook = load_workbook(BytesIO(data), read_only=True, data_only=True)
+    try:
+        hashes = {}
+        for sheet in workbook.worksheets:
+            rows = dumps_json(list(sheet.iter_rows(values_only=True)))
+            hashes[sheet.title] = hashlib.blake2b(rows, digest_size=16).hexdigest()
+        return workbook.properties.title, hashes
+    finally:
+        workbook.close()
+
+
+def _step_content(step):
+    # a step without its acq_index, and without the parts of the sample (in md, or the sample to load) set by other
+    # acquisitions - the acquisitions themselves, and the detector, which is left as set by the acquisition before
+    content = {key: value for key, value in step.items() if key != "acq_index"}
+    kwargs = content.get("kwargs")
+    if isinstance(kwargs, dict):
+        content["kwargs"] = {
+            name: {key: item for key, item in value.items() if key not in ("acquisitions", "RSoXS_Main_DET")}
+            if name in ("md", "sample") and isinstance(value, dict)
+            else value
+            for name, value in kwargs.items()
+        }
+    return content
+
+
+def _entry_key(entry):
+    # content of a queue entry, without the values which depend on its position in the queue
+    content = {key: value for key, value in entry.items() if key not in queue_position_keys and key != "steps"}
+    return content_key((content, [_step_content(step) for step in entry.get("steps", [])]))
+
+
+def queue_changes(old_queue, new_queue):
+    """
+    acquisitions added, removed, changed, and moved between two queues (as from dryrun_bar), by uid
+
+    Returns
+    -------
+    dict
+        "added", "removed", "changed" (same uid, different content), and "moved" (same content, different
+        acq_index) lists of uids, and the number "unchanged".  the times before and after each acquisition, and
+        changes to the md of its steps made by other acquisitions of the sample, aren't counted as changes
+    """
+    old_entries = {str(entry["uid"]): entry for entry in old_queue or []}
+    new_entries = {str(entry["uid"]): entry for entry in new_queue}
+    changes = {"added": [], "removed": [], "changed": [], "moved": [], "unchanged": 0}
+    for uid, entry in new_entries.items():
+        old_entry = old_entries.get(uid)
+        if old_entry is None:
+            changes["added"].append(uid)
+        elif _entry_key(old_entry) != _entry_key(entry):
+            changes["changed"].append(uid)
+        elif old_entry.get("acq_index") != entry.get("acq_index"):
+            changes["moved"].append(uid)
+        else:
+            changes["unchanged"] += 1
+    changes["removed"] = [uid for uid in old_entries if uid not in new_entries]
+    return changes
+
+
+class SpreadsheetWatcher:
+    """
+    polls a bar spreadsheet and loads and dry runs it again when it is saved with changes
+
+    Parameters
+    ----------
+    filename : str or Path
+        the xlsx file to watch
+    on_update : callable, optional
+        called with each update (see reload), by default None
+    poll_interval : float, optional
+        seconds between checks of the file, by default 1
+    debounce : float, optional
+        seconds the file must be unchanged before it is loaded, so a save in progress isn't read, by default 0.5
+    dryrun_kwargs : dict, optional
+        extra arguments for dryrun_bar (e.g. group or sort_by), by default the dry run isn't printed
+
+    use poll() to check the file once, run() to keep checking it, or start() and stop() to check it in a thread.
+    the latest bar and queue are kept in .bar and .queue
+    """
+
+    def __init__(self, filename, on_update=None, poll_interval=1.0, debounce=0.5, dryrun_kwargs=None):
+        self.filename = Path(filename)
+        self.on_update = on_update
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.dryrun_kwargs = {"print_dry_run": False, **(dryrun_kwargs or {})}
+        self.bar = None
+        self.queue = None
+        self.title = None
+        self.hashes = {}
+        self.last_error = None
+        self.proposal_cache = {}
+        self.step_cache = {}
+        self._file_state = None
+        self._changed_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.filename)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def poll(self, now=None):
+        """checks the file once, and returns the update if it was reloaded (see reload), otherwise None"""
+        now = time.monotonic() if now is None else now
+        state = self._stat()
+        if state != self._file_state:
+            ## the file is (still) being written, wait for it to settle
+            self._file_state = state
+            self._changed_at = now
+            return None
+        if state is None or self._changed_at is None or now - self._changed_at < self.debounce:
+            return None
+        self._changed_at = None
+        update = self.reload()
+        if self.last_error is not None:
+            self._changed_at = now  # try again after another debounce time, even if the file doesn't change
+        return update
+
+    def reload(self):
+        """
+        loads and dry runs the spreadsheet again, if any sheet has changed since it was last loaded
+
+        Returns
+        -------
+        dict or None
+            None if no sheet changed or the sheet couldn't be loaded (see .last_error), otherwise
+            "sheets": the sheets which changed, "bar": the new bar, "queue": the new queue,
+            "changes": the changes to the queue (see queue_changes), "seconds": the time taken
+        """
+        start = time.perf_counter()
+        try:
+            data = self.filename.read_bytes()
+            title, hashes = sheet_hashes(data)
+            changed_sheets = sorted(
+                name for name in hashes.keys() | self.hashes.keys() if hashes.get(name) != self.hashes.get(name)
+            )
+            if title == self.title and not changed_sheets:
+                return None
+            bar = load_samplesxlsx(data, proposal_cache=self.proposal_cache, previous_bar=self.bar)
+            queue = dryrun_bar(bar, step_cache=self.step_cache, **self.dryrun_kwargs)
+        except Exception as error:
+            ## e.g. the file is locked, half written, or gone while it is being saved.  the sheet hashes aren't
+            ## kept, so it is loaded again next time
+            self.last_error = error
+            warnings.warn(f"could not load {self.filename}, keeping the previous queue: {error}", stacklevel=2)
+            return None
+        self.last_error = None
+        self.title, self.hashes = title, hashes
+        update = {
+            "sheets": changed_sheets,
+            "bar": bar,
+            "queue": queue,
+            "changes": queue_changes(self.queue, queue),
+            "seconds": time.perf_counter() - start,
+        }
+        self.bar, self.queue = bar, queue
+        if self.on_update is not None:
+            self.on_update(update)
+        return update
+
+    def run(self):
+        """checks the file every poll_interval until stop() is called"""
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as error:
+                ## e.g. from on_update, keep watching
+                warnings.warn(f"error while watching {self.filename}: {error}", stacklevel=2)
+            self._stop.wait(self.poll_interval)
+
+    def start(self):
+        """checks the file in a background thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name=f"watch {self.filename.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """stops the background thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None